@@ -1,8 +1,17 @@
+from typing import Any
+
 from fastapi import APIRouter
 
+from app.services import legacy_bridge
+
 router = APIRouter()
 
 
 @router.get("/")
 def health_check() -> dict[str, str]:
     return {"status": "ok"}
+
+
+@router.get("/legacy")
+def legacy_services_health() -> dict[str, Any]:
+    return legacy_bridge.get_service_metrics()
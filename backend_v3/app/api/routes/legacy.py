@@ -1,7 +1,8 @@
 from typing import Any
 
-from fastapi import APIRouter, Depends, File, UploadFile
-from fastapi.responses import HTMLResponse
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import HTMLResponse, StreamingResponse
+from starlette.background import BackgroundTask
 
 from app.api.deps import get_current_user
 from app.schemas.legacy import (
@@ -9,8 +10,10 @@ from app.schemas.legacy import (
     LegacyChatRequest,
     LegacyFilenameRequest,
     LegacyFraudCheckRequest,
+    LegacyPredictBatchRequest,
     LegacyPredictRequest,
     LegacyScoreFileRequest,
+    LegacyScoreFileStreamRequest,
     LegacyTrainingRequest,
 )
 from app.services import legacy_bridge
@@ -19,74 +22,149 @@ router = APIRouter(dependencies=[Depends(get_current_user)])
 
 
 @router.get("/files")
-def read_files() -> list[str]:
-    return legacy_bridge.list_files()
-
-
-@router.post("/upload")
-async def upload_file(file: UploadFile = File(...)) -> Any:
-    content = await file.read()
-    return legacy_bridge.upload_direct(file.filename or "dataset.csv", content, file.content_type)
+async def read_files(
+    limit: int | None = Query(default=None, ge=1, le=10000),
+    offset: int = Query(default=0, ge=0),
+) -> list[str]:
+    return await legacy_bridge.list_files(limit=limit, offset=offset)
+
+
+UPLOAD_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "properties": {"file": {"type": "string", "format": "binary"}},
+                    "required": ["file"],
+                }
+            }
+        },
+    }
+}
+
+
+@router.post("/upload", openapi_extra=UPLOAD_OPENAPI)
+async def upload_file(request: Request) -> Any:
+    content_type = request.headers.get("content-type", "")
+    if not content_type.startswith("multipart/form-data"):
+        raise HTTPException(status_code=400, detail="Expected multipart/form-data with a 'file' field.")
+    return await legacy_bridge.upload_direct_stream(
+        request.stream(),
+        content_type,
+        request.headers.get("content-length"),
+    )
 
 
 @router.get("/columns/{filename}")
-def read_columns(filename: str) -> list[str]:
-    return legacy_bridge.list_columns(filename)
+async def read_columns(filename: str) -> list[str]:
+    return await legacy_bridge.list_columns(filename)
 
 
 @router.post("/profile")
-def create_profile(payload: LegacyFilenameRequest) -> Any:
-    return legacy_bridge.create_profile(payload.filename)
+async def create_profile(payload: LegacyFilenameRequest) -> Any:
+    return await legacy_bridge.create_profile(payload.filename)
 
 
 @router.get("/profile-report/{report_filename}", response_class=HTMLResponse)
-def read_profile_report(report_filename: str) -> HTMLResponse:
-    return HTMLResponse(content=legacy_bridge.get_profile_report(report_filename))
+async def read_profile_report(report_filename: str) -> StreamingResponse:
+    upstream = await legacy_bridge.open_profile_report(report_filename)
+    return StreamingResponse(
+        upstream.aiter_bytes(),
+        media_type=upstream.headers.get("content-type", "text/html; charset=utf-8"),
+        background=BackgroundTask(upstream.aclose),
+    )
 
 
 @router.post("/ai/analyze")
-def analyze_file(payload: LegacyFilenameRequest) -> Any:
-    return legacy_bridge.analyze_file(payload.filename)
+async def analyze_file(payload: LegacyFilenameRequest) -> Any:
+    return await legacy_bridge.analyze_file(payload.filename)
 
 
 @router.post("/ai/chat")
-def chat_with_file(payload: LegacyChatRequest) -> Any:
-    return legacy_bridge.chat_with_file(
+async def chat_with_file(payload: LegacyChatRequest) -> Any:
+    return await legacy_bridge.chat_with_file(
         payload.filename,
         [message.model_dump() for message in payload.chat_history],
     )
 
 
 @router.get("/models")
-def read_models() -> Any:
-    return legacy_bridge.list_models()
+async def read_models() -> Any:
+    return await legacy_bridge.list_models()
 
 
 @router.get("/models/{model_name}/config")
-def read_model_config(model_name: str) -> Any:
-    return legacy_bridge.get_model_config(model_name)
+async def read_model_config(model_name: str) -> Any:
+    return await legacy_bridge.get_model_config(model_name)
+
+
+@router.get("/models/{model_name}/versions")
+async def read_model_versions(model_name: str) -> Any:
+    return await legacy_bridge.list_model_versions(model_name)
+
+
+@router.post("/models/{model_name}/versions/{version}/activate")
+async def activate_model_version(model_name: str, version: int) -> Any:
+    return await legacy_bridge.activate_model_version(model_name, version)
 
 
 @router.post("/train-anomaly-detector")
-def train_anomaly_detector(payload: LegacyTrainingRequest) -> Any:
-    return legacy_bridge.train_anomaly_detector(payload.model_dump())
+async def train_anomaly_detector(payload: LegacyTrainingRequest) -> Any:
+    return await legacy_bridge.train_anomaly_detector(payload.model_dump())
+
+
+@router.post("/training-jobs", status_code=202)
+async def submit_training_job(payload: LegacyTrainingRequest) -> Any:
+    return await legacy_bridge.submit_training_job(payload.model_dump())
+
+
+@router.get("/training-jobs")
+async def read_training_jobs() -> Any:
+    return await legacy_bridge.list_training_jobs()
+
+
+@router.get("/training-jobs/{job_id}")
+async def read_training_job(job_id: str) -> Any:
+    return await legacy_bridge.get_training_job(job_id)
+
+
+@router.post("/training-jobs/{job_id}/cancel")
+async def cancel_training_job(job_id: str) -> Any:
+    return await legacy_bridge.cancel_training_job(job_id)
 
 
 @router.post("/score-file")
-def score_file(payload: LegacyScoreFileRequest) -> Any:
-    return legacy_bridge.score_file(payload.model_dump())
+async def score_file(payload: LegacyScoreFileRequest) -> Any:
+    return await legacy_bridge.score_file(payload.model_dump(exclude_none=True))
+
+
+@router.post("/score-file-stream")
+async def score_file_stream(payload: LegacyScoreFileStreamRequest) -> StreamingResponse:
+    upstream = await legacy_bridge.open_score_file_stream(payload.model_dump(exclude_none=True))
+    return StreamingResponse(
+        upstream.aiter_bytes(),
+        media_type=upstream.headers.get("content-type", "application/x-ndjson"),
+        background=BackgroundTask(upstream.aclose),
+    )
 
 
 @router.post("/predict-or-score")
-def predict_or_score(payload: LegacyPredictRequest) -> Any:
-    return legacy_bridge.predict_or_score(payload.model_dump())
+async def predict_or_score(payload: LegacyPredictRequest) -> Any:
+    return await legacy_bridge.predict_or_score(payload.model_dump())
+
+
+@router.post("/predict-batch")
+async def predict_batch(payload: LegacyPredictBatchRequest) -> Any:
+    return await legacy_bridge.predict_batch(payload.model_dump())
 
 
 @router.post("/fraud-check")
-def check_fraud(payload: LegacyFraudCheckRequest) -> Any:
-    return legacy_bridge.fraud_check(payload.model_dump())
+async def check_fraud(payload: LegacyFraudCheckRequest) -> Any:
+    return await legacy_bridge.fraud_check(payload.model_dump())
 
 
 @router.post("/fraud-blacklist")
-def add_blacklist(payload: LegacyBlacklistRequest) -> Any:
-    return legacy_bridge.add_blacklist(payload.model_dump())
+async def add_blacklist(payload: LegacyBlacklistRequest) -> Any:
+    return await legacy_bridge.add_blacklist(payload.model_dump())
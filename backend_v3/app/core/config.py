@@ -30,6 +30,18 @@ class Settings(BaseSettings):
     training_service_url: str = "http://training_service:8000"
     prediction_service_url: str = "http://prediction_service:8000"
     fraud_check_service_url: str = "http://fraud_check_service:8000"
+    legacy_http_max_connections: int = 20
+    legacy_http_max_keepalive_connections: int = 10
+    legacy_http_keepalive_expiry: float = 30.0
+    legacy_http_connect_timeout: float = 10.0
+    legacy_http2: bool = True
+    legacy_circuit_window_size: int = 20
+    legacy_circuit_min_calls: int = 5
+    legacy_circuit_failure_rate: float = 0.5
+    legacy_circuit_slow_call_rate: float = 0.8
+    legacy_circuit_open_seconds: float = 30.0
+    legacy_circuit_half_open_calls: int = 1
+    legacy_cache_ttl_seconds: float = 30.0
     seed_test_data: bool = False
 
     jwt_secret_key: str = "change-me-in-production"
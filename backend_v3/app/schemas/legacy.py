@@ -20,7 +20,7 @@ class LegacyChatRequest(BaseModel):
 class LegacyTrainingRequest(BaseModel):
     filename: str = Field(min_length=1)
     model_name: str = Field(min_length=1)
-    model_type: Literal["IsolationForest", "LocalOutlierFactor", "OneClassSVM"] = "IsolationForest"
+    model_type: Literal["IsolationForest", "LocalOutlierFactor", "OneClassSVM", "SGDOneClassSVM"] = "IsolationForest"
     numerical_features: list[str] = Field(default_factory=list)
     categorical_features: list[str] = Field(default_factory=list)
     date_features: list[str] = Field(default_factory=list)
@@ -28,16 +28,41 @@ class LegacyTrainingRequest(BaseModel):
     card_id_column: str | None = None
     timestamp_column: str | None = None
     amount_column: str | None = None
+    max_samples: int | None = Field(default=None, ge=1)
+    sampling: Literal["random", "stratified"] = "random"
+    stratify_column: str | None = None
+    incremental: bool = False
+    chunk_rows: int | None = Field(default=None, ge=1000)
+    categorical_encoding: Literal["onehot", "frequency", "hashing"] = "onehot"
+    max_categories: int | None = Field(default=None, ge=2)
+    hashing_features: int | None = Field(default=None, ge=8)
 
 
 class LegacyScoreFileRequest(BaseModel):
     model_name: str = Field(min_length=1)
     filename: str = Field(min_length=1)
+    n_jobs: int | None = None
+
+
+class LegacyScoreFileStreamRequest(BaseModel):
+    model_name: str = Field(min_length=1)
+    filename: str = Field(min_length=1)
+    output_format: Literal["csv", "parquet"] = "csv"
+    result_filename: str | None = None
+    chunk_rows: int | None = Field(default=None, ge=1)
+    n_jobs: int | None = None
 
 
 class LegacyPredictRequest(BaseModel):
     model_name: str = Field(min_length=1)
     features: dict[str, Any]
+    update_feature_state: bool = False
+
+
+class LegacyPredictBatchRequest(BaseModel):
+    model_name: str = Field(min_length=1)
+    columns: dict[str, list[Any]]
+    update_feature_state: bool = False
 
 
 class LegacyFraudCheckRequest(BaseModel):
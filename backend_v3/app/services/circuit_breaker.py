@@ -0,0 +1,162 @@
+import time
+from bisect import bisect_left
+from collections import deque
+from enum import Enum
+from typing import Any
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+
+class CircuitState(str, Enum):
+    closed = "closed"
+    open = "open"
+    half_open = "half_open"
+
+
+class LatencyHistogram:
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect_left(self.buckets, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+
+    def snapshot(self) -> dict[str, Any]:
+        labels = [f"le_{bucket:g}" for bucket in self.buckets] + ["le_inf"]
+        cumulative: dict[str, int] = {}
+        running = 0
+        for label, bucket_count in zip(labels, self.counts):
+            running += bucket_count
+            cumulative[label] = running
+        return {
+            "buckets": cumulative,
+            "count": self.count,
+            "sum_seconds": round(self.total, 6),
+        }
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        name: str,
+        *,
+        latency_budget: float,
+        window_size: int,
+        min_calls: int,
+        failure_rate_threshold: float,
+        slow_call_rate_threshold: float,
+        open_seconds: float,
+        half_open_max_calls: int,
+    ) -> None:
+        self.name = name
+        self.latency_budget = latency_budget
+        self.window_size = window_size
+        self.min_calls = min_calls
+        self.failure_rate_threshold = failure_rate_threshold
+        self.slow_call_rate_threshold = slow_call_rate_threshold
+        self.open_seconds = open_seconds
+        self.half_open_max_calls = half_open_max_calls
+
+        self.state = CircuitState.closed
+        self.opened_at = 0.0
+        self._window: deque[tuple[bool, bool]] = deque(maxlen=window_size)
+        self._half_open_in_flight = 0
+        self._half_open_successes = 0
+
+        self.success_count = 0
+        self.failure_count = 0
+        self.rejected_count = 0
+        self.latency = LatencyHistogram()
+
+    def allow_request(self) -> bool:
+        if self.state == CircuitState.open:
+            if time.monotonic() - self.opened_at < self.open_seconds:
+                self.rejected_count += 1
+                return False
+            self.state = CircuitState.half_open
+            self._half_open_in_flight = 0
+            self._half_open_successes = 0
+
+        if self.state == CircuitState.half_open:
+            if self._half_open_in_flight >= self.half_open_max_calls:
+                self.rejected_count += 1
+                return False
+            self._half_open_in_flight += 1
+        return True
+
+    def retry_after(self) -> int:
+        remaining = self.open_seconds - (time.monotonic() - self.opened_at)
+        return max(1, int(remaining + 0.999))
+
+    def record_success(self, latency: float) -> None:
+        self.success_count += 1
+        self.latency.observe(latency)
+        slow = latency > self.latency_budget
+        if self.state == CircuitState.half_open:
+            self._half_open_in_flight = max(0, self._half_open_in_flight - 1)
+            if slow:
+                self._trip()
+                return
+            self._half_open_successes += 1
+            if self._half_open_successes >= self.half_open_max_calls:
+                self._reset()
+            return
+        self._window.append((True, slow))
+        self._evaluate()
+
+    def record_failure(self, latency: float) -> None:
+        self.failure_count += 1
+        self.latency.observe(latency)
+        if self.state == CircuitState.half_open:
+            self._half_open_in_flight = max(0, self._half_open_in_flight - 1)
+            self._trip()
+            return
+        self._window.append((False, latency > self.latency_budget))
+        self._evaluate()
+
+    def release(self) -> None:
+        if self.state == CircuitState.half_open:
+            self._half_open_in_flight = max(0, self._half_open_in_flight - 1)
+
+    def _evaluate(self) -> None:
+        calls = len(self._window)
+        if self.state != CircuitState.closed or calls < self.min_calls:
+            return
+        failures = sum(1 for ok, _ in self._window if not ok)
+        slow_calls = sum(1 for _, slow in self._window if slow)
+        if (
+            failures / calls >= self.failure_rate_threshold
+            or slow_calls / calls >= self.slow_call_rate_threshold
+        ):
+            self._trip()
+
+    def _trip(self) -> None:
+        self.state = CircuitState.open
+        self.opened_at = time.monotonic()
+        self._window.clear()
+
+    def _reset(self) -> None:
+        self.state = CircuitState.closed
+        self._window.clear()
+        self._half_open_in_flight = 0
+        self._half_open_successes = 0
+
+    def snapshot(self) -> dict[str, Any]:
+        calls = len(self._window)
+        failures = sum(1 for ok, _ in self._window if not ok)
+        slow_calls = sum(1 for _, slow in self._window if slow)
+        return {
+            "state": self.state.value,
+            "latency_budget_seconds": self.latency_budget,
+            "window_calls": calls,
+            "window_failure_rate": round(failures / calls, 4) if calls else 0.0,
+            "window_slow_call_rate": round(slow_calls / calls, 4) if calls else 0.0,
+            "success_count": self.success_count,
+            "failure_count": self.failure_count,
+            "rejected_count": self.rejected_count,
+            "latency_seconds": self.latency.snapshot(),
+        }
@@ -1,17 +1,95 @@
-from pathlib import Path
+import time
+from collections.abc import AsyncIterator
 from typing import Any
-from urllib.parse import quote
+from urllib.parse import quote, urlencode
 
-import requests
+import httpx
 from fastapi import HTTPException
 
 from app.core.config import settings
+from app.services.circuit_breaker import CircuitBreaker
+from app.services.response_cache import ResponseCache
 
 
 DEFAULT_TIMEOUT = 180
+# Calls slower than the budget count as "slow" in the circuit breaker window.
+SERVICE_LATENCY_BUDGETS = {
+    "file_service": 30.0,
+    "groq_service": 120.0,
+    "profiling_service": 240.0,
+    "training_service": 480.0,
+    "prediction_service": 120.0,
+    "fraud_check_service": 30.0,
+}
+
+_clients: dict[str, httpx.AsyncClient] = {}
+_breakers: dict[str, CircuitBreaker] = {}
+_read_cache = ResponseCache(ttl_seconds=settings.legacy_cache_ttl_seconds)
+
+
+def _service_base_url(service_name: str) -> str:
+    return {
+        "file_service": settings.file_service_url,
+        "groq_service": settings.groq_service_url,
+        "profiling_service": settings.profiling_service_url,
+        "training_service": settings.training_service_url,
+        "prediction_service": settings.prediction_service_url,
+        "fraud_check_service": settings.fraud_check_service_url,
+    }[service_name]
+
+
+def _get_client(service_name: str) -> httpx.AsyncClient:
+    client = _clients.get(service_name)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            base_url=_service_base_url(service_name),
+            http2=settings.legacy_http2,
+            limits=httpx.Limits(
+                max_connections=settings.legacy_http_max_connections,
+                max_keepalive_connections=settings.legacy_http_max_keepalive_connections,
+                keepalive_expiry=settings.legacy_http_keepalive_expiry,
+            ),
+            timeout=httpx.Timeout(DEFAULT_TIMEOUT, connect=settings.legacy_http_connect_timeout),
+        )
+        _clients[service_name] = client
+    return client
+
+
+def _get_breaker(service_name: str) -> CircuitBreaker:
+    breaker = _breakers.get(service_name)
+    if breaker is None:
+        breaker = CircuitBreaker(
+            service_name,
+            latency_budget=SERVICE_LATENCY_BUDGETS.get(service_name, float(DEFAULT_TIMEOUT)),
+            window_size=settings.legacy_circuit_window_size,
+            min_calls=settings.legacy_circuit_min_calls,
+            failure_rate_threshold=settings.legacy_circuit_failure_rate,
+            slow_call_rate_threshold=settings.legacy_circuit_slow_call_rate,
+            open_seconds=settings.legacy_circuit_open_seconds,
+            half_open_max_calls=settings.legacy_circuit_half_open_calls,
+        )
+        _breakers[service_name] = breaker
+    return breaker
+
+
+def get_service_metrics() -> dict[str, Any]:
+    return {
+        "services": {
+            service_name: _get_breaker(service_name).snapshot()
+            for service_name in SERVICE_LATENCY_BUDGETS
+        },
+        "cache": _read_cache.stats(),
+    }
+
+
+async def close_clients() -> None:
+    clients = list(_clients.values())
+    _clients.clear()
+    for client in clients:
+        await client.aclose()
 
 
-def _service_error(service_name: str, response: requests.Response) -> HTTPException:
+def _service_error(service_name: str, response: httpx.Response) -> HTTPException:
     detail: Any
     try:
         payload = response.json()
@@ -26,30 +104,113 @@ def _service_error(service_name: str, response: requests.Response) -> HTTPExcept
     )
 
 
-def _request_json(
+def _acquire(service_name: str) -> CircuitBreaker:
+    breaker = _get_breaker(service_name)
+    if not breaker.allow_request():
+        raise HTTPException(
+            status_code=503,
+            detail=f"{service_name} is temporarily unavailable: circuit is open.",
+            headers={"Retry-After": str(breaker.retry_after())},
+        )
+    return breaker
+
+
+async def _dispatch(
+    service_name: str,
+    request: httpx.Request,
+    *,
+    stream: bool,
+) -> httpx.Response:
+    breaker = _acquire(service_name)
+    started = time.monotonic()
+    try:
+        response = await _get_client(service_name).send(request, stream=stream)
+    except httpx.HTTPError as exc:
+        breaker.record_failure(time.monotonic() - started)
+        raise HTTPException(status_code=502, detail=f"{service_name} is unavailable: {exc}") from exc
+    except BaseException:
+        breaker.release()
+        raise
+
+    latency = time.monotonic() - started
+    if response.status_code >= 500:
+        breaker.record_failure(latency)
+    else:
+        breaker.record_success(latency)
+
+    if not response.is_success:
+        if stream:
+            try:
+                await response.aread()
+            finally:
+                await response.aclose()
+        raise _service_error(service_name, response)
+    return response
+
+
+def _build_request(
+    service_name: str,
+    method: str,
+    path: str,
+    *,
+    timeout: int,
+    **kwargs: Any,
+) -> httpx.Request:
+    return _get_client(service_name).build_request(
+        method,
+        path,
+        timeout=httpx.Timeout(timeout, connect=settings.legacy_http_connect_timeout),
+        **kwargs,
+    )
+
+
+async def _send(
     service_name: str,
     method: str,
-    url: str,
+    path: str,
+    *,
+    timeout: int,
+    **kwargs: Any,
+) -> httpx.Response:
+    request = _build_request(service_name, method, path, timeout=timeout, **kwargs)
+    return await _dispatch(service_name, request, stream=False)
+
+
+async def _open_stream(
+    service_name: str,
+    method: str,
+    path: str,
+    *,
+    timeout: int,
+    **kwargs: Any,
+) -> httpx.Response:
+    request = _build_request(service_name, method, path, timeout=timeout, **kwargs)
+    return await _dispatch(service_name, request, stream=True)
+
+
+async def _request_json(
+    service_name: str,
+    method: str,
+    path: str,
     *,
     json_payload: dict[str, Any] | None = None,
     files: dict[str, Any] | None = None,
     data: dict[str, Any] | None = None,
+    content: AsyncIterator[bytes] | None = None,
+    headers: dict[str, str] | None = None,
     timeout: int = DEFAULT_TIMEOUT,
 ) -> Any:
-    try:
-        response = requests.request(
-            method,
-            url,
-            json=json_payload,
-            files=files,
-            data=data,
-            timeout=timeout,
-        )
-    except requests.RequestException as exc:
-        raise HTTPException(status_code=502, detail=f"{service_name} is unavailable: {exc}") from exc
-
-    if not response.ok:
-        raise _service_error(service_name, response)
+    response = await _send(
+        service_name,
+        method,
+        path,
+        json=json_payload,
+        files=files,
+        data=data,
+        content=content,
+        headers=headers,
+        timeout=timeout,
+    )
 
     try:
         return response.json()
@@ -60,146 +221,212 @@ def _request_json(
         ) from exc
 
 
-def _request_text(
-    service_name: str,
-    method: str,
-    url: str,
-    *,
-    timeout: int = DEFAULT_TIMEOUT,
-) -> str:
-    try:
-        response = requests.request(method, url, timeout=timeout)
-    except requests.RequestException as exc:
-        raise HTTPException(status_code=502, detail=f"{service_name} is unavailable: {exc}") from exc
-
-    if not response.ok:
-        raise _service_error(service_name, response)
-    return response.text
-
-
-def list_files() -> list[str]:
-    return _request_json("file_service", "GET", f"{settings.file_service_url}/files/", timeout=60)
+async def list_files(limit: int | None = None, offset: int = 0) -> list[str]:
+    params = {key: value for key, value in (("limit", limit), ("offset", offset)) if value}
+    path = f"/files/?{urlencode(params)}" if params else "/files/"
+    return await _read_cache.get_or_fetch(
+        f"files:{limit}:{offset}" if params else "files",
+        lambda: _request_json("file_service", "GET", path, timeout=60),
+    )
 
 
-def upload_direct(filename: str, content: bytes, content_type: str | None) -> Any:
-    safe_name = Path(filename).name
-    return _request_json(
+async def upload_direct_stream(
+    body: AsyncIterator[bytes],
+    content_type: str,
+    content_length: str | None,
+) -> Any:
+    headers = {"Content-Type": content_type}
+    if content_length:
+        headers["Content-Length"] = content_length
+    result = await _request_json(
         "file_service",
         "POST",
-        f"{settings.file_service_url}/upload-direct/",
-        files={"file": (safe_name, content, content_type or "application/octet-stream")},
+        "/upload-direct/",
+        content=body,
+        headers=headers,
     )
+    _read_cache.invalidate_prefix("files")
+    if isinstance(result, dict) and result.get("filename"):
+        _read_cache.invalidate(f"columns:{result['filename']}")
+    return result
 
 
-def list_columns(filename: str) -> list[str]:
+async def list_columns(filename: str) -> list[str]:
     encoded_filename = quote(filename, safe="")
-    return _request_json(
-        "file_service",
-        "GET",
-        f"{settings.file_service_url}/columns/{encoded_filename}",
-        timeout=60,
+    return await _read_cache.get_or_fetch(
+        f"columns:{filename}",
+        lambda: _request_json("file_service", "GET", f"/columns/{encoded_filename}", timeout=60),
     )
 
 
-def create_profile(filename: str) -> Any:
-    return _request_json(
+async def create_profile(filename: str) -> Any:
+    return await _request_json(
         "profiling_service",
         "POST",
-        f"{settings.profiling_service_url}/profile/",
+        "/profile/",
         json_payload={"filename": filename},
         timeout=300,
     )
 
 
-def get_profile_report(report_filename: str) -> str:
+async def open_profile_report(report_filename: str) -> httpx.Response:
     encoded_report = quote(report_filename, safe="")
-    return _request_text(
-        "profiling_service",
-        "GET",
-        f"{settings.profiling_service_url}/reports/{encoded_report}",
-        timeout=120,
-    )
+    return await _open_stream("profiling_service", "GET", f"/reports/{encoded_report}", timeout=120)
 
 
-def analyze_file(filename: str) -> Any:
-    return _request_json(
+async def analyze_file(filename: str) -> Any:
+    return await _request_json(
         "groq_service",
         "POST",
-        f"{settings.groq_service_url}/analyze/",
+        "/analyze/",
         json_payload={"filename": filename},
         timeout=300,
     )
 
 
-def chat_with_file(filename: str, chat_history: list[dict[str, Any]]) -> Any:
-    return _request_json(
+async def chat_with_file(filename: str, chat_history: list[dict[str, Any]]) -> Any:
+    return await _request_json(
         "groq_service",
         "POST",
-        f"{settings.groq_service_url}/chat/",
+        "/chat/",
         json_payload={"filename": filename, "chat_history": chat_history},
         timeout=300,
     )
 
 
-def list_models() -> Any:
-    return _request_json("training_service", "GET", f"{settings.training_service_url}/models/", timeout=60)
+async def list_models() -> Any:
+    return await _read_cache.get_or_fetch(
+        "models",
+        lambda: _request_json("training_service", "GET", "/models/", timeout=60),
+    )
+
+
+async def get_model_config(model_name: str) -> Any:
+    encoded_model = quote(model_name, safe="")
+    return await _read_cache.get_or_fetch(
+        f"model_config:{model_name}",
+        lambda: _request_json("training_service", "GET", f"/models/{encoded_model}/config", timeout=60),
+    )
+
+
+async def list_model_versions(model_name: str) -> Any:
+    encoded_model = quote(model_name, safe="")
+    return await _request_json("training_service", "GET", f"/models/{encoded_model}/versions", timeout=60)
 
 
-def get_model_config(model_name: str) -> Any:
+async def activate_model_version(model_name: str, version: int) -> Any:
     encoded_model = quote(model_name, safe="")
-    return _request_json(
+    try:
+        return await _request_json(
+            "training_service",
+            "POST",
+            f"/models/{encoded_model}/versions/{version}/activate",
+            timeout=60,
+        )
+    finally:
+        _read_cache.invalidate(f"model_config:{model_name}")
+
+
+async def train_anomaly_detector(payload: dict[str, Any]) -> Any:
+    try:
+        return await _request_json(
+            "training_service",
+            "POST",
+            "/train_anomaly_detector/",
+            json_payload=payload,
+            timeout=600,
+        )
+    finally:
+        # Even a failed or timed-out call may have overwritten the model on training_service.
+        _read_cache.invalidate("models", f"model_config:{payload.get('model_name')}")
+
+
+async def submit_training_job(payload: dict[str, Any]) -> Any:
+    return await _request_json(
         "training_service",
-        "GET",
-        f"{settings.training_service_url}/models/{encoded_model}/config",
+        "POST",
+        "/jobs/train",
+        json_payload=payload,
         timeout=60,
     )
 
 
-def train_anomaly_detector(payload: dict[str, Any]) -> Any:
-    return _request_json(
+async def list_training_jobs() -> Any:
+    return await _request_json("training_service", "GET", "/jobs/", timeout=60)
+
+
+async def get_training_job(job_id: str) -> Any:
+    job = await _request_json("training_service", "GET", f"/jobs/{quote(job_id, safe='')}", timeout=60)
+    if job.get("status") == "succeeded":
+        # The job has saved a new model version after the list and config were cached.
+        _read_cache.invalidate("models", f"model_config:{job.get('model_name')}")
+    return job
+
+
+async def cancel_training_job(job_id: str) -> Any:
+    return await _request_json(
         "training_service",
         "POST",
-        f"{settings.training_service_url}/train_anomaly_detector/",
-        json_payload=payload,
-        timeout=600,
+        f"/jobs/{quote(job_id, safe='')}/cancel",
+        timeout=60,
     )
 
 
-def score_file(payload: dict[str, Any]) -> Any:
-    return _request_json(
+async def score_file(payload: dict[str, Any]) -> Any:
+    return await _request_json(
         "prediction_service",
         "POST",
-        f"{settings.prediction_service_url}/score_file/",
+        "/score_file/",
         json_payload=payload,
         timeout=300,
     )
 
 
-def predict_or_score(payload: dict[str, Any]) -> Any:
-    return _request_json(
+async def open_score_file_stream(payload: dict[str, Any]) -> httpx.Response:
+    return await _open_stream(
         "prediction_service",
         "POST",
-        f"{settings.prediction_service_url}/predict_or_score/",
+        "/score_file_stream/",
+        json=payload,
+        timeout=600,
+    )
+
+
+async def predict_or_score(payload: dict[str, Any]) -> Any:
+    return await _request_json(
+        "prediction_service",
+        "POST",
+        "/predict_or_score/",
         json_payload=payload,
         timeout=180,
     )
 
 
-def fraud_check(payload: dict[str, Any]) -> Any:
-    return _request_json(
+async def predict_batch(payload: dict[str, Any]) -> Any:
+    return await _request_json(
+        "prediction_service",
+        "POST",
+        "/predict_batch/",
+        json_payload=payload,
+        timeout=300,
+    )
+
+
+async def fraud_check(payload: dict[str, Any]) -> Any:
+    return await _request_json(
         "fraud_check_service",
         "POST",
-        f"{settings.fraud_check_service_url}/check/",
+        "/check/",
         json_payload=payload,
         timeout=120,
     )
 
 
-def add_blacklist(payload: dict[str, Any]) -> Any:
-    return _request_json(
+async def add_blacklist(payload: dict[str, Any]) -> Any:
+    return await _request_json(
         "fraud_check_service",
         "POST",
-        f"{settings.fraud_check_service_url}/add-blacklist/",
+        "/add-blacklist/",
         json_payload=payload,
         timeout=120,
     )
@@ -0,0 +1,126 @@
+"""
+Сравнение чтения датасета: разбор исходного CSV против Parquet-копии из file_service
+и memory-mapped Arrow-копии, которую ML-сервисы держат в локальном кэше.
+
+Запуск из корня репозитория:
+    python benchmarks/columnar_reads.py --rows 5000000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT_DIR, os.path.join(ROOT_DIR, "file_service")]
+
+from columnar_utils import build_columnar_copy  # noqa: E402
+from ml_common.dataset_cache import _convert_to_arrow  # noqa: E402
+from ml_common.datasets import read_columnar, read_raw_dataset, table_to_pandas  # noqa: E402
+
+PROJECTED_COLUMNS = ["transaction_amount_kzt", "mcc_category", "card_id"]
+ANOMALY_ROWS = 5
+
+
+def make_dataset(path: str, rows: int, encoding: str) -> None:
+    rng = np.random.default_rng(42)
+    start = np.datetime64("2024-01-01T00:00:00")
+    df = pd.DataFrame(
+        {
+            "transaction_id": np.arange(rows),
+            "card_id": rng.integers(0, max(rows // 50, 1), rows),
+            "transaction_timestamp": start + rng.integers(0, 365 * 24 * 3600, rows).astype("timedelta64[s]"),
+            "transaction_amount_kzt": rng.lognormal(8, 1.2, rows).round(2),
+            "mcc_category": rng.choice(["Продукты", "АЗС", "Рестораны", "Онлайн", "Путешествия"], rows),
+            "merchant_city": rng.choice(["Алматы", "Астана", "Шымкент", "Караганда"], rows),
+            "is_international": rng.integers(0, 2, rows),
+        }
+    )
+    df.to_csv(path, index=False, encoding=encoding)
+
+
+def timed(label: str, func, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    print(f"{label:<44} {best:8.2f} s")
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=5_000_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--encoding",
+        default="cp1251",
+        help="Кодировка CSV; cp1251 заставляет read_dataset сначала перебрать utf-8 варианты",
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as upload_dir:
+        filename = "bench.csv"
+        csv_path = os.path.join(upload_dir, filename)
+        print(f"Генерация {args.rows:,} строк ({args.encoding})...")
+        make_dataset(csv_path, args.rows, args.encoding)
+
+        build_time = timed("Построение Parquet-копии (один раз)", lambda: build_columnar_copy(upload_dir, filename), 1)
+        parquet_path = os.path.join(upload_dir, ".columnar", f"{filename}.parquet")
+        print(
+            f"Размер CSV: {os.path.getsize(csv_path) / 1024 ** 2:.1f} MiB, "
+            f"Parquet: {os.path.getsize(parquet_path) / 1024 ** 2:.1f} MiB"
+        )
+
+        csv_full = timed("CSV, все колонки", lambda: read_raw_dataset(csv_path), args.repeat)
+        csv_projected = timed(
+            "CSV, usecols",
+            lambda: read_raw_dataset(csv_path, usecols=lambda column: column in PROJECTED_COLUMNS),
+            args.repeat,
+        )
+        parquet_full = timed("Parquet, все колонки", lambda: read_columnar(parquet_path), args.repeat)
+        parquet_projected = timed(
+            "Parquet, проекция колонок",
+            lambda: read_columnar(parquet_path, columns=PROJECTED_COLUMNS),
+            args.repeat,
+        )
+
+        arrow_path = os.path.join(upload_dir, f"{filename}.arrow")
+        timed("Arrow-копия из Parquet (один раз)", lambda: _convert_to_arrow(parquet_path, arrow_path), 1)
+
+        def open_mmap() -> pa.Table:
+            return pa.ipc.open_file(pa.memory_map(arrow_path, "r")).read_all()
+
+        arrow_projected = timed(
+            "Arrow mmap, проекция колонок",
+            lambda: table_to_pandas(open_mmap(), columns=PROJECTED_COLUMNS),
+            args.repeat,
+        )
+        row_indices = np.random.default_rng(0).integers(0, args.rows, ANOMALY_ROWS).tolist()
+        csv_rows = timed(
+            f"CSV, {ANOMALY_ROWS} строк по индексу",
+            lambda: read_raw_dataset(csv_path).iloc[row_indices],
+            1,
+        )
+        arrow_rows = timed(
+            f"Arrow mmap, {ANOMALY_ROWS} строк по индексу",
+            lambda: [open_mmap().slice(idx, 1).to_pylist() for idx in row_indices],
+            args.repeat,
+        )
+
+        print()
+        print(f"Ускорение полного чтения:     x{csv_full / parquet_full:.1f}")
+        print(f"Ускорение чтения с проекцией: x{csv_projected / parquet_projected:.1f}")
+        print(f"Проекция, Arrow mmap vs CSV:  x{csv_projected / arrow_projected:.1f}")
+        print(f"Строки по индексу:            {arrow_rows * 1000:.2f} ms вместо {csv_rows:.2f} s")
+        reads = build_time / max(csv_full - parquet_full, 1e-9)
+        print(f"Построение копии окупается после ~{max(reads, 0):.1f} полных чтений")
+
+
+if __name__ == "__main__":
+    main()
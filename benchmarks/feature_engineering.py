@@ -0,0 +1,128 @@
+"""
+Генерация признаков: прежняя реализация (apply + три groupby().rolling()) против
+ml_common.features (один проход по отсортированным массивам, numba при наличии).
+
+Перед замером результаты обеих реализаций сверяются на подвыборке.
+Прежняя реализация на 10M строк работает долго, поэтому ее можно ограничить --legacy-rows.
+
+Запуск из корня репозитория:
+    python benchmarks/feature_engineering.py --rows 10000000 --cards 1000000
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from ml_common import features  # noqa: E402
+
+CONFIG = {
+    "card_id_column": "card_id",
+    "timestamp_column": "transaction_timestamp",
+    "amount_column": "transaction_amount_kzt",
+}
+FEATURE_COLUMNS = [
+    "is_night",
+    "card_tx_count_1h",
+    "card_tx_amount_sum_1h",
+    "time_since_last_tx_card",
+    "amount_deviation_from_card_avg",
+]
+
+
+def legacy_generate_features(df: pd.DataFrame, config: dict) -> pd.DataFrame:
+    """Реализация, которая раньше была скопирована в training_service и prediction_service."""
+    card_col, ts_col, amt_col = config["card_id_column"], config["timestamp_column"], config["amount_column"]
+    df_eng = df.copy()
+    df_eng[ts_col] = pd.to_datetime(df_eng[ts_col])
+    df_eng = df_eng.sort_values(by=[card_col, ts_col])
+    hour_col = [col for col in df_eng.columns if col.endswith('_hour')][0]
+    df_eng['is_night'] = df_eng[hour_col].apply(lambda x: 1 if (x >= 22 or x <= 6) else 0)
+    # В pandas 3 колонка из on должна входить в выборку groupby, иначе rolling падает
+    grouped = df_eng.groupby(card_col, group_keys=False)[[ts_col, amt_col]]
+    rolling_window_1h = grouped.rolling('1h', on=ts_col, closed='left')
+    df_eng['card_tx_count_1h'] = rolling_window_1h.count()[amt_col].reset_index(level=0, drop=True).fillna(0).astype(int)
+    df_eng['card_tx_amount_sum_1h'] = rolling_window_1h.sum()[amt_col].reset_index(level=0, drop=True).fillna(0)
+    df_eng['time_since_last_tx_card'] = df_eng.groupby(card_col)[ts_col].diff().dt.total_seconds().fillna(86400)
+    avg_24h = grouped.rolling('24h', on=ts_col, closed='left').mean()[amt_col]
+    avg_24h = avg_24h.reset_index(level=0, drop=True).fillna(df_eng[amt_col].mean())
+    df_eng['amount_deviation_from_card_avg'] = df_eng[amt_col] - avg_24h
+    return df_eng
+
+
+def make_transactions(rows: int, cards: int) -> pd.DataFrame:
+    rng = np.random.default_rng(7)
+    start = np.datetime64("2024-01-01T00:00:00")
+    timestamps = start + rng.integers(0, 90 * 24 * 3600, rows).astype("timedelta64[s]")
+    card_ids = rng.integers(0, cards, rows)
+    # Часть транзакций повторяет карту и время другой: окна не должны включать строки с тем же временем
+    tied = np.flatnonzero(rng.random(rows) < 0.05)
+    source = rng.integers(0, rows, len(tied))
+    timestamps[tied] = timestamps[source]
+    card_ids[tied] = card_ids[source]
+    amounts = rng.lognormal(8, 1.2, rows).round(2)
+    amounts[rng.random(rows) < 0.001] = np.nan
+    return pd.DataFrame(
+        {
+            "card_id": card_ids,
+            "transaction_timestamp": timestamps,
+            "transaction_timestamp_hour": pd.DatetimeIndex(timestamps).hour,
+            "transaction_amount_kzt": amounts,
+        }
+    )
+
+
+def timed(label: str, func):
+    started = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - started
+    print(f"{label:<40} {elapsed:8.2f} s")
+    return result, elapsed
+
+
+def check_equal(rows: int, cards: int) -> None:
+    df = make_transactions(rows, cards)
+    expected = legacy_generate_features(df, CONFIG)
+    actual, generated = features.generate_features(df, CONFIG)
+    assert generated == FEATURE_COLUMNS, generated
+    assert expected.index.equals(actual.index), "порядок строк отличается"
+    for column in FEATURE_COLUMNS:
+        np.testing.assert_allclose(
+            actual[column].to_numpy(dtype=float), expected[column].to_numpy(dtype=float), rtol=1e-9, atol=1e-6,
+            err_msg=column,
+        )
+    print(f"Проверка на {rows:,} строках: результаты совпадают")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--cards", type=int, default=1_000_000)
+    parser.add_argument("--legacy-rows", type=int, default=None, help="Строк для прежней реализации (по умолчанию --rows)")
+    parser.add_argument("--check-rows", type=int, default=200_000)
+    args = parser.parse_args()
+
+    print(f"numba: {'есть' if features.numba is not None else 'нет, используется numpy'}")
+    check_equal(args.check_rows, max(args.check_rows * args.cards // args.rows, 1))
+
+    df = make_transactions(args.rows, args.cards)
+    if features.numba is not None:
+        features.generate_features(df.head(1000), CONFIG)  # компиляция numba не входит в замер
+    _, new_time = timed(f"ml_common.features, {args.rows:,} строк", lambda: features.generate_features(df, CONFIG))
+
+    legacy_rows = args.legacy_rows or args.rows
+    legacy_df = df if legacy_rows >= args.rows else df.head(legacy_rows)
+    _, legacy_time = timed(f"Прежняя реализация, {legacy_rows:,} строк", lambda: legacy_generate_features(legacy_df, CONFIG))
+    if legacy_rows < args.rows:
+        legacy_time *= args.rows / legacy_rows
+        print(f"{'Прежняя, линейная экстраполяция':<40} {legacy_time:8.2f} s")
+    print(f"Ускорение: {legacy_time / new_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
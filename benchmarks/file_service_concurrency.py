@@ -0,0 +1,114 @@
+"""
+Задержка легких запросов file_service (/files/, HEAD /download/) во время большой загрузки.
+
+Сначала замеряется фон без нагрузки, затем те же запросы идут параллельно с потоковой
+загрузкой файла размера --upload-mb через /upload-direct/. Если event loop блокируется
+дисковыми операциями, p95/max во время загрузки вырастают на порядки.
+
+Запуск (file_service уже поднят):
+    python benchmarks/file_service_concurrency.py --url http://localhost:8000 --upload-mb 1024
+"""
+import argparse
+import os
+import statistics
+import threading
+import time
+import uuid
+
+import requests
+
+BLOCK_SIZE = 1024 * 1024
+PROBE_FILENAME = "concurrency_probe.csv"
+
+
+def multipart_body(boundary: str, filename: str, size_mb: int):
+    yield (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+        "Content-Type: text/csv\r\n\r\n"
+    ).encode()
+    row = b"1,2024-01-01 00:00:00,12345.67,Grocery\n"
+    block = b"id,timestamp,amount,category\n" + row * (BLOCK_SIZE // len(row))
+    for _ in range(size_mb):
+        yield block
+    yield f"\r\n--{boundary}--\r\n".encode()
+
+
+def upload(url: str, size_mb: int) -> float:
+    boundary = uuid.uuid4().hex
+    started = time.perf_counter()
+    response = requests.post(
+        f"{url}/upload-direct/",
+        data=multipart_body(boundary, f"concurrency_{size_mb}mb.csv", size_mb),
+        headers={"Content-Type": f"multipart/form-data; boundary={boundary}"},
+        timeout=3600,
+    )
+    response.raise_for_status()
+    return time.perf_counter() - started
+
+
+def probe(url: str, stop: threading.Event, latencies: list[float], interval: float) -> None:
+    session = requests.Session()
+    while not stop.is_set():
+        for method, path in (("GET", "/files/"), ("HEAD", f"/download/{PROBE_FILENAME}")):
+            started = time.perf_counter()
+            session.request(method, f"{url}{path}", timeout=60).raise_for_status()
+            latencies.append((time.perf_counter() - started) * 1000)
+        time.sleep(interval)
+
+
+def summary(label: str, latencies: list[float]) -> None:
+    ordered = sorted(latencies)
+    p95 = ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)]
+    print(
+        f"{label:<22} n={len(ordered):<5} p50={statistics.median(ordered):7.1f} ms "
+        f"p95={p95:7.1f} ms max={ordered[-1]:7.1f} ms"
+    )
+
+
+def run_probes(url: str, clients: int, interval: float, duration: float | None, during=None) -> list[float]:
+    stop = threading.Event()
+    latencies: list[float] = []
+    threads = [threading.Thread(target=probe, args=(url, stop, latencies, interval)) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    try:
+        if during is not None:
+            during()
+        else:
+            time.sleep(duration)
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+    return latencies
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=os.getenv("FILE_SERVICE_URL", "http://localhost:8000"))
+    parser.add_argument("--upload-mb", type=int, default=1024)
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--interval", type=float, default=0.05, help="Пауза между запросами одного клиента, с")
+    parser.add_argument("--baseline-seconds", type=float, default=5.0)
+    args = parser.parse_args()
+
+    url = args.url.rstrip("/")
+    requests.post(
+        f"{url}/upload-direct/",
+        files={"file": (PROBE_FILENAME, b"a,b\n1,2\n")},
+        timeout=30,
+    ).raise_for_status()
+
+    summary("Без нагрузки", run_probes(url, args.clients, args.interval, args.baseline_seconds))
+
+    upload_seconds: list[float] = []
+    latencies = run_probes(
+        url, args.clients, args.interval, None, during=lambda: upload_seconds.append(upload(url, args.upload_mb))
+    )
+    summary(f"Во время {args.upload_mb} MiB", latencies)
+    print(f"Загрузка заняла {upload_seconds[0]:.1f} s ({args.upload_mb / upload_seconds[0]:.0f} MiB/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Обучение training_service на большом файле: весь файл против выборки и обучения по частям
+(training_service/large_training.py).
+
+Файл транзакций пишется в Parquet так, как его хранит file_service (исходник и колоночная
+копия), затем каждый вариант обучения запускается в отдельном процессе через run_training,
+и для него замеряются время и пиковая память процесса (ru_maxrss). Оконные признаки
+по карте включены. Вариант, которому не хватило памяти, выводится как killed.
+
+Запуск из корня репозитория:
+    python benchmarks/large_training.py --rows 20000000 --cards 2000000
+"""
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from benchmarks.feature_engineering import CONFIG, make_transactions  # noqa: E402
+
+FILENAME = "large_training_benchmark.parquet"
+PART_ROWS = 1_000_000
+VARIANTS = {
+    "full": {"model_type": "IsolationForest"},
+    "sample": {"model_type": "IsolationForest", "max_samples": 200_000},
+    "stratified": {"model_type": "IsolationForest", "max_samples": 200_000, "sampling": "stratified",
+                   "stratify_column": "merchant_category"},
+    "incremental": {"model_type": "IsolationForest", "incremental": True},
+    "sgd": {"model_type": "SGDOneClassSVM"},
+    "ocsvm_sample": {"model_type": "OneClassSVM"},
+    "lof_sample": {"model_type": "LocalOutlierFactor", "max_samples": 100_000},
+}
+
+
+def write_dataset(upload_dir: str, rows: int, cards: int) -> None:
+    """Пишет файл частями: каждая часть сдвинута по времени, чтобы транзакции не повторялись."""
+    path = os.path.join(upload_dir, FILENAME)
+    categories = np.array(["grocery", "fuel", "travel", "electronics", "gambling"])
+    writer = None
+    for part, offset in enumerate(range(0, rows, PART_ROWS)):
+        df = make_transactions(min(PART_ROWS, rows - offset), cards)
+        df = df.drop(columns="transaction_timestamp_hour")
+        df["transaction_timestamp"] += np.timedelta64(90 * part, "D")
+        df["transaction_amount_kzt"] = df["transaction_amount_kzt"].fillna(0)
+        # Редкая категория: при равномерной выборке ее доля может просесть, при стратифицированной — нет
+        df["merchant_category"] = categories[np.minimum(np.random.default_rng(part).geometric(0.6, len(df)) - 1, 4)]
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        if writer is None:
+            writer = pq.ParquetWriter(path, table.schema)
+        writer.write_table(table)
+    writer.close()
+    # Колоночная копия file_service: для Parquet-исходника совпадает с ним
+    os.makedirs(os.path.join(upload_dir, ".columnar"), exist_ok=True)
+    shutil.copyfile(path, os.path.join(upload_dir, ".columnar", f"{FILENAME}.parquet"))
+
+
+def run_child(variant: str) -> None:
+    """Один вариант обучения в этом процессе; печатает JSON с метриками и пиковой памятью."""
+    sys.path.insert(0, os.path.join(ROOT_DIR, "training_service"))
+    from main import run_training
+
+    params = {
+        "filename": FILENAME,
+        "model_name": f"large_training_{variant}",
+        "numerical_features": ["transaction_amount_kzt"],
+        "categorical_features": [],
+        "date_features": [CONFIG["timestamp_column"]],
+        "enable_feature_engineering": True,
+        **{key: CONFIG[key] for key in ("card_id_column", "timestamp_column", "amount_column")},
+        **VARIANTS[variant],
+    }
+    started = time.perf_counter()
+    result = run_training(params, lambda stage: None)
+    print(json.dumps({
+        "seconds": time.perf_counter() - started,
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        **result["metrics"],
+    }))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=5_000_000)
+    parser.add_argument("--cards", type=int, default=500_000)
+    parser.add_argument("--variants", nargs="+", choices=sorted(VARIANTS), default=list(VARIANTS))
+    parser.add_argument("--child", choices=sorted(VARIANTS), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        run_child(args.child)
+        return
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        upload_dir = os.path.join(work_dir, "uploads")
+        models_dir = os.path.join(work_dir, "models")
+        os.makedirs(upload_dir)
+        os.makedirs(models_dir)
+        write_dataset(upload_dir, args.rows, args.cards)
+        env = {
+            **os.environ,
+            "PYTHONPATH": ROOT_DIR,
+            "UPLOAD_DIR": upload_dir,
+            "DATASET_CACHE_DIR": os.path.join(work_dir, "cache"),
+            "MODELS_DIR": models_dir,
+        }
+        env.pop("DATABASE_URL", None)
+        # Arrow-копия строится один раз при первом чтении, в замер это не входит
+        subprocess.run(
+            [sys.executable, "-c", f"from ml_common.datasets import open_dataset_table; open_dataset_table({FILENAME!r})"],
+            env=env, check=True,
+        )
+
+        print(f"{args.rows:,} строк, {args.cards:,} карт")
+        print(f"{'variant':<13} {'mode':<12} {'trained':>10} {'seconds':>8} {'fit, s':>8} {'peak, MB':>9} {'anomaly':>8}")
+        for variant in args.variants:
+            child = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--child", variant],
+                env=env, capture_output=True, text=True,
+            )
+            if child.returncode != 0:
+                reason = "killed" if child.returncode < 0 else child.stderr.strip().splitlines()[-1]
+                print(f"{variant:<13} {reason}")
+                continue
+            result = json.loads(child.stdout.strip().splitlines()[-1])
+            print(
+                f"{variant:<13} {result['training_mode']:<12} {result['n_samples']:>10,} {result['seconds']:>8.1f} "
+                f"{result['fit_seconds']:>8.1f} {result['max_rss_mb']:>9.0f} {result['anomaly_rate']:>8.3f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
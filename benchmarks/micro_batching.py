@@ -0,0 +1,198 @@
+"""
+Нагрузочный тест /predict_or_score/ с микробатчингом и без него.
+
+Для каждого значения --max-rows поднимается prediction_service (uvicorn, один процесс)
+с моделью IsolationForest на признаках транзакций, затем для каждого уровня --concurrency
+клиент держит столько одновременных запросов и замеряет пропускную способность
+и задержки. MICRO_BATCH_MAX_ROWS=1 — прежнее поведение, по запросу на вызов модели.
+
+Запуск из корня репозитория:
+    python benchmarks/micro_batching.py --max-rows 1 32 256 --concurrency 1 8 32 128
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+import joblib
+import numpy as np
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import IsolationForest
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from benchmarks.feature_engineering import CONFIG, make_transactions  # noqa: E402
+from ml_common.features import generate_features  # noqa: E402
+
+MODEL_NAME = "micro_batching_benchmark"
+FEATURES = [
+    "transaction_amount_kzt",
+    "is_night",
+    "card_tx_count_1h",
+    "card_tx_amount_sum_1h",
+    "time_since_last_tx_card",
+    "amount_deviation_from_card_avg",
+]
+
+
+def train_model(models_dir: str, rows: int) -> list[dict]:
+    """Обучает модель так же, как training_service, и возвращает исходные строки для запросов."""
+    df = make_transactions(rows, max(rows // 20, 1))
+    df["transaction_amount_kzt"] = df["transaction_amount_kzt"].fillna(0)
+    df["transaction_timestamp"] = df["transaction_timestamp"].astype(str)
+    train_df, _ = generate_features(df, CONFIG)
+    pipeline = Pipeline([
+        ("preprocessor", ColumnTransformer([("num", StandardScaler(), FEATURES)])),
+        ("detector", IsolationForest(random_state=42)),
+    ])
+    pipeline.fit(train_df[FEATURES])
+    joblib.dump(pipeline, os.path.join(models_dir, f"{MODEL_NAME}.joblib"))
+    config = {
+        "model_type": "anomaly_detection",
+        "numerical_features": FEATURES,
+        "categorical_features": [],
+        "date_features": ["transaction_timestamp"],
+        "feature_engineering_config": CONFIG,
+        "feature_engineering_stats": {"amount_mean": float(df["transaction_amount_kzt"].mean())},
+    }
+    with open(os.path.join(models_dir, f"{MODEL_NAME}.json"), "w") as f:
+        json.dump(config, f)
+    rows = df.drop(columns="transaction_timestamp_hour").sort_values("transaction_timestamp")
+    return rows.to_dict(orient="records")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(models_dir: str, port: int, max_rows: int, max_wait_ms: float) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "PYTHONPATH": ROOT_DIR,
+        "MODELS_DIR": models_dir,
+        "MODEL_CACHE_RECENT_PATH": os.path.join(models_dir, ".recent_models.json"),
+        "FEATURE_STORE_SNAPSHOT_SECONDS": "0",
+        "FEATURE_STORE_SNAPSHOT_PATH": os.path.join(models_dir, "feature_store.json.gz"),
+        "MICRO_BATCH_MAX_ROWS": str(max_rows),
+        "MICRO_BATCH_MAX_WAIT_MS": str(max_wait_ms),
+    }
+    env.pop("DATABASE_URL", None)
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", os.path.join(ROOT_DIR, "prediction_service"),
+         "--port", str(port), "--log-level", "warning"],
+        env=env,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/micro_batching/", timeout=1)
+            return server
+        except httpx.TransportError:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError("prediction_service не запустился")
+
+
+async def post_json(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, path: str, payload: dict) -> int:
+    """POST по уже открытому keep-alive соединению; возвращает код ответа."""
+    body = json.dumps(payload).encode()
+    writer.write(
+        f"POST {path} HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+    )
+    await writer.drain()
+    status_line = await reader.readline()
+    length = 0
+    while (line := await reader.readline()) not in (b"\r\n", b""):
+        name, _, value = line.decode().partition(":")
+        if name.lower() == "content-length":
+            length = int(value)
+    await reader.readexactly(length)
+    return int(status_line.split()[1])
+
+
+async def run_load(port: int, rows: list[dict], concurrency: int, duration: float) -> dict:
+    """
+    Каждый виртуальный клиент держит свое keep-alive соединение и шлет запросы подряд.
+    Клиент на голых asyncio-потоках: пул соединений httpx сам упирается в CPU раньше сервера.
+    """
+    latencies = []
+    errors = 0
+    stop_at = time.perf_counter() + duration
+
+    async def worker(offset: int) -> None:
+        nonlocal errors
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        position = offset
+        try:
+            while time.perf_counter() < stop_at:
+                payload = {"model_name": MODEL_NAME, "features": rows[position % len(rows)], "update_feature_state": True}
+                position += concurrency
+                started = time.perf_counter()
+                if await post_json(reader, writer, "/predict_or_score/", payload) == 200:
+                    latencies.append(time.perf_counter() - started)
+                else:
+                    errors += 1
+        finally:
+            writer.close()
+
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=30) as client:
+        # Прогрев: загрузка модели в кэш не входит в замер
+        await client.post("/predict_or_score/", json={"model_name": MODEL_NAME, "features": rows[0]})
+        before = (await client.get("/micro_batching/")).json()
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(offset) for offset in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        after = (await client.get("/micro_batching/")).json()
+
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        "rps": len(latencies) / elapsed,
+        "p50": float(np.percentile(latencies_ms, 50)) if len(latencies) else float("nan"),
+        "p99": float(np.percentile(latencies_ms, 99)) if len(latencies) else float("nan"),
+        # При MICRO_BATCH_MAX_ROWS=1 пачек нет, каждый запрос — отдельный вызов модели
+        "avg_batch": (after["rows"] - before["rows"]) / max(after["batches"] - before["batches"], 1) or 1.0,
+        "errors": errors,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--max-rows", type=int, nargs="+", default=[1, 32, 256])
+    parser.add_argument("--max-wait-ms", type=float, default=2.0)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 128])
+    parser.add_argument("--duration", type=float, default=5.0, help="Секунд на каждую точку")
+    parser.add_argument("--train-rows", type=int, default=50_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as models_dir:
+        rows = train_model(models_dir, args.train_rows)
+        print(f"{'max_rows':>8} {'concurrency':>11} {'req/s':>9} {'p50, ms':>9} {'p99, ms':>9} {'batch':>7} {'errors':>6}")
+        for max_rows in args.max_rows:
+            port = free_port()
+            server = start_server(models_dir, port, max_rows, args.max_wait_ms)
+            try:
+                for concurrency in args.concurrency:
+                    result = asyncio.run(run_load(port, rows, concurrency, args.duration))
+                    print(
+                        f"{max_rows:>8} {concurrency:>11} {result['rps']:>9.1f} {result['p50']:>9.1f} "
+                        f"{result['p99']:>9.1f} {result['avg_batch']:>7.1f} {result['errors']:>6}"
+                    )
+            finally:
+                server.terminate()
+                server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+decision_function по большой матрице признаков: один процесс против пула процессов
+(prediction_service/parallel_scoring.py).
+
+Модель обучается так же, как в training_service (ColumnTransformer + детектор),
+признаки транзакций считаются один раз, затем оценки считаются с разными --n-jobs.
+Перед выводом результат каждого варианта сверяется с последовательным вызовом.
+Ускорение ограничено числом ядер машины (os.cpu_count()).
+
+Запуск из корня репозитория:
+    python benchmarks/parallel_scoring.py --rows 2000000 --n-jobs 1 2 4 8 16
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import IsolationForest
+from sklearn.linear_model import SGDOneClassSVM
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.join(ROOT_DIR, "prediction_service"))
+
+from benchmarks.feature_engineering import CONFIG, make_transactions  # noqa: E402
+from ml_common.features import generate_features  # noqa: E402
+from parallel_scoring import decision_function  # noqa: E402
+
+FEATURES = [
+    "transaction_amount_kzt",
+    "is_night",
+    "card_tx_count_1h",
+    "card_tx_amount_sum_1h",
+    "time_since_last_tx_card",
+    "amount_deviation_from_card_avg",
+]
+DETECTORS = {
+    "IsolationForest": lambda: IsolationForest(random_state=42),
+    # Ядровой OneClassSVM на миллионах строк не обучается за разумное время, поэтому линейный вариант
+    "SGDOneClassSVM": lambda: SGDOneClassSVM(random_state=42),
+}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--train-rows", type=int, default=100_000)
+    parser.add_argument("--n-jobs", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--detector", choices=sorted(DETECTORS), default="IsolationForest")
+    args = parser.parse_args()
+
+    df = make_transactions(args.rows, max(args.rows // 20, 1))
+    df["transaction_amount_kzt"] = df["transaction_amount_kzt"].fillna(0)
+    df, _ = generate_features(df, CONFIG)
+    df = df[FEATURES].reset_index(drop=True)
+    pipeline = Pipeline([
+        ("preprocessor", ColumnTransformer([("num", StandardScaler(), FEATURES)])),
+        ("detector", DETECTORS[args.detector]()),
+    ])
+    pipeline.fit(df.sample(min(args.train_rows, len(df)), random_state=42))
+    print(f"{args.detector}: {len(df):,} строк, ядер: {os.cpu_count()}")
+
+    started = time.perf_counter()
+    expected = pipeline.decision_function(df)
+    baseline = time.perf_counter() - started
+    print(f"{'n_jobs':>6} {'seconds':>9} {'speedup':>8}")
+    print(f"{'serial':>6} {baseline:>9.2f} {1.0:>8.2f}")
+    for n_jobs in args.n_jobs:
+        decision_function(pipeline, df.iloc[:50_000], n_jobs)  # прогрев пула процессов
+        started = time.perf_counter()
+        scores = decision_function(pipeline, df, n_jobs)
+        elapsed = time.perf_counter() - started
+        if not np.array_equal(scores, expected):
+            raise SystemExit(f"n_jobs={n_jobs}: оценки расходятся с последовательным вызовом")
+        print(f"{n_jobs:>6} {elapsed:>9.2f} {baseline / elapsed:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
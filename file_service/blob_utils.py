@@ -0,0 +1,136 @@
+import contextlib
+import os
+import stat
+import tempfile
+import threading
+import time
+
+BLOBS_DIRNAME = ".blobs"
+# Блоб без ссылок удаляется не сразу: ссылка на него может как раз создаваться
+GC_GRACE_SECONDS = int(os.getenv("FILE_SERVICE_GC_GRACE_SECONDS", "600"))
+
+# Запись ссылок и сборка мусора не должны пересекаться внутри процесса
+_store_lock = threading.RLock()
+
+
+def blobs_dir(upload_dir: str) -> str:
+    path = os.path.join(upload_dir, BLOBS_DIRNAME)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def blob_path(upload_dir: str, sha256: str) -> str:
+    return os.path.join(blobs_dir(upload_dir), sha256[:2], sha256)
+
+
+def blob_tempfile(upload_dir: str) -> tuple[int, str]:
+    """Временный файл на той же ФС, что и блобы: его можно сделать блобом через rename."""
+    return tempfile.mkstemp(dir=blobs_dir(upload_dir), prefix=".tmp-")
+
+
+def has_blob(upload_dir: str, sha256: str) -> bool:
+    return os.path.isfile(blob_path(upload_dir, sha256))
+
+
+def _same_file(path: str, other: str) -> bool:
+    try:
+        return os.path.samefile(path, other)
+    except FileNotFoundError:
+        return False
+
+
+def _seal(path: str) -> None:
+    # Имена файлов — жесткие ссылки на блоб, поэтому запись в любое из них испортила бы все копии
+    os.chmod(path, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+
+
+def link_blob(upload_dir: str, sha256: str, filename: str) -> None:
+    """Атомарно направляет имя filename на блоб: прежнее содержимое под этим именем теряет ссылку."""
+    final_path = os.path.join(upload_dir, filename)
+    source = blob_path(upload_dir, sha256)
+    if _same_file(source, final_path):
+        return
+    tmp_path = f"{final_path}.link-tmp"
+    with _store_lock:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(tmp_path)
+        os.link(source, tmp_path)
+        os.replace(tmp_path, final_path)
+
+
+def store_blob(upload_dir: str, source_path: str, sha256: str, filename: str) -> bool:
+    """
+    Превращает полностью записанный файл source_path в блоб sha256 и ссылается на него именем filename.
+    Если такой блоб уже есть, source_path удаляется. Возвращает True, если содержимое уже хранилось.
+    """
+    target = blob_path(upload_dir, sha256)
+    with _store_lock:
+        existed = os.path.isfile(target)
+        if existed:
+            os.remove(source_path)
+        else:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            _seal(source_path)
+            os.replace(source_path, target)
+        link_blob(upload_dir, sha256, filename)
+    return existed
+
+
+def adopt_file(upload_dir: str, filename: str, sha256: str) -> bool:
+    """
+    Переводит уже лежащий в UPLOAD_DIR файл в хранилище блобов: если такое содержимое
+    уже есть, имя становится ссылкой на существующий блоб, иначе файл сам становится блобом.
+    False, если ФС не поддерживает жесткие ссылки — тогда файл остается обычным.
+    """
+    file_path = os.path.join(upload_dir, filename)
+    target = blob_path(upload_dir, sha256)
+    try:
+        with _store_lock:
+            if _same_file(target, file_path):
+                return True
+            if os.path.isfile(target):
+                link_blob(upload_dir, sha256, filename)
+            else:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                _seal(file_path)
+                os.link(file_path, target)
+    except OSError:
+        return False
+    return True
+
+
+def collect_garbage(upload_dir: str, grace_seconds: int = GC_GRACE_SECONDS) -> dict:
+    """
+    Удаляет блобы, на которые не ссылается ни одно имя. Счетчик ссылок — число жестких
+    ссылок на inode: у блоба без имен он равен 1. ctime меняется при каждом link/unlink,
+    поэтому по нему отсчитывается время с момента, когда блоб лишился последней ссылки.
+    """
+    removed, freed, kept = 0, 0, 0
+    now = time.time()
+    root = blobs_dir(upload_dir)
+    with _store_lock:
+        for prefix in os.listdir(root):
+            prefix_dir = os.path.join(root, prefix)
+            if prefix.startswith(".") or not os.path.isdir(prefix_dir):
+                continue
+            for name in os.listdir(prefix_dir):
+                path = os.path.join(prefix_dir, name)
+                try:
+                    info = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                if info.st_nlink > 1 or now - info.st_ctime < grace_seconds:
+                    kept += 1
+                    continue
+                os.remove(path)
+                removed += 1
+                freed += info.st_size
+            with contextlib.suppress(OSError):
+                os.rmdir(prefix_dir)  # удаляется, только если опустел
+        # Временные файлы прерванных загрузок
+        for name in os.listdir(root):
+            path = os.path.join(root, name)
+            if name.startswith(".tmp-") and now - os.stat(path).st_mtime >= grace_seconds:
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(path)
+    return {"removed": removed, "freed_bytes": freed, "kept": kept}
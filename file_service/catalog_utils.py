@@ -0,0 +1,166 @@
+import contextlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+CATALOG_FILENAME = ".catalog.sqlite3"
+JSON_FIELDS = {"columns", "dtypes", "stats"}
+FIELDS = (
+    "size",
+    "mtime_ns",
+    "sha256",
+    "encoding",
+    "delimiter",
+    "row_count",
+    "columns",
+    "dtypes",
+    "stats",
+    "columnar_sha256",
+    "columnar_source_sha256",
+)
+# Поля, которые описывают содержимое файла и устаревают при его перезаписи
+DERIVED_FIELDS = tuple(field for field in FIELDS if field not in {"size", "mtime_ns"})
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS datasets (
+    filename TEXT PRIMARY KEY,
+    size INTEGER,
+    mtime_ns INTEGER,
+    sha256 TEXT,
+    encoding TEXT,
+    delimiter TEXT,
+    row_count INTEGER,
+    columns TEXT,
+    dtypes TEXT,
+    stats TEXT,
+    columnar_sha256 TEXT,
+    columnar_source_sha256 TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+)
+"""
+
+_init_lock = threading.Lock()
+_initialized: set[str] = set()
+
+
+def catalog_path(upload_dir: str) -> str:
+    return os.getenv("FILE_CATALOG_PATH") or os.path.join(upload_dir, CATALOG_FILENAME)
+
+
+@contextlib.contextmanager
+def _connect(upload_dir: str):
+    path = catalog_path(upload_dir)
+    connection = sqlite3.connect(path, timeout=30)
+    connection.row_factory = sqlite3.Row
+    try:
+        if path not in _initialized:
+            with _init_lock:
+                if path not in _initialized:
+                    connection.execute("PRAGMA journal_mode=WAL")
+                    connection.execute(_SCHEMA)
+                    connection.execute("CREATE INDEX IF NOT EXISTS datasets_sha256 ON datasets (sha256)")
+                    _initialized.add(path)
+        with connection:
+            yield connection
+    finally:
+        connection.close()
+
+
+def _decode(row: sqlite3.Row | None) -> dict:
+    if row is None:
+        return {}
+    entry = {key: row[key] for key in row.keys() if row[key] is not None}
+    for field in JSON_FIELDS & entry.keys():
+        entry[field] = json.loads(entry[field])
+    return entry
+
+
+def _encode(fields: dict) -> dict:
+    unknown = fields.keys() - set(FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown catalog fields: {sorted(unknown)}")
+    return {
+        key: json.dumps(value, ensure_ascii=False) if key in JSON_FIELDS and value is not None else value
+        for key, value in fields.items()
+    }
+
+
+def get_dataset(upload_dir: str, filename: str) -> dict:
+    with _connect(upload_dir) as connection:
+        row = connection.execute("SELECT * FROM datasets WHERE filename = ?", (filename,)).fetchone()
+    return _decode(row)
+
+
+def upsert_dataset(upload_dir: str, filename: str, reset: bool = False, **fields) -> dict:
+    """
+    Добавляет или обновляет запись каталога; обновляются только переданные поля.
+    reset=True сбрасывает сведения о содержимом (хэш, схема, статистика) — для перезаписанного файла.
+    """
+    if reset:
+        fields = {**dict.fromkeys(DERIVED_FIELDS), **fields}
+    values = _encode(fields)
+    now = time.time()
+    columns = ["filename", *values, "created_at", "updated_at"]
+    updates = ", ".join(f"{column} = excluded.{column}" for column in [*values, "updated_at"])
+    with _connect(upload_dir) as connection:
+        connection.execute(
+            f"INSERT INTO datasets ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) "
+            f"ON CONFLICT(filename) DO UPDATE SET {updates}",
+            (filename, *values.values(), now, now),
+        )
+        row = connection.execute("SELECT * FROM datasets WHERE filename = ?", (filename,)).fetchone()
+    return _decode(row)
+
+
+def remove_dataset(upload_dir: str, filename: str) -> None:
+    with _connect(upload_dir) as connection:
+        connection.execute("DELETE FROM datasets WHERE filename = ?", (filename,))
+
+
+def list_datasets(upload_dir: str, limit: int | None = None, offset: int = 0) -> tuple[list[str], int]:
+    """Имена датасетов по алфавиту и их общее число."""
+    with _connect(upload_dir) as connection:
+        total = connection.execute("SELECT COUNT(*) FROM datasets").fetchone()[0]
+        rows = connection.execute(
+            "SELECT filename FROM datasets ORDER BY filename LIMIT ? OFFSET ?",
+            (-1 if limit is None else limit, offset),
+        ).fetchall()
+    return [row["filename"] for row in rows], total
+
+
+def find_by_hash(upload_dir: str, sha256: str) -> list[str]:
+    """Имена, под которыми хранится содержимое с данным SHA-256."""
+    with _connect(upload_dir) as connection:
+        rows = connection.execute(
+            "SELECT filename FROM datasets WHERE sha256 = ? ORDER BY filename", (sha256,)
+        ).fetchall()
+    return [row["filename"] for row in rows]
+
+
+def sync_catalog(upload_dir: str, supported_extensions: set[str]) -> None:
+    """
+    Сверяет каталог с диском при старте: регистрирует файлы, загруженные до появления каталога
+    (переносит сведения из старых .meta/*.json), и удаляет записи о пропавших файлах.
+    """
+    on_disk = {
+        name: os.stat(os.path.join(upload_dir, name))
+        for name in os.listdir(upload_dir)
+        if os.path.splitext(name)[1].lower() in supported_extensions and os.path.isfile(os.path.join(upload_dir, name))
+    }
+    with _connect(upload_dir) as connection:
+        known = {row["filename"] for row in connection.execute("SELECT filename FROM datasets")}
+    for name in known - on_disk.keys():
+        remove_dataset(upload_dir, name)
+
+    for name in on_disk.keys() - known:
+        legacy = {}
+        with contextlib.suppress(FileNotFoundError, ValueError):
+            with open(os.path.join(upload_dir, ".meta", f"{name}.json"), "r", encoding="utf-8") as f:
+                legacy = {key: value for key, value in json.load(f).items() if key in FIELDS}
+        stat = on_disk[name]
+        if legacy.get("size") != stat.st_size or legacy.get("mtime_ns") != stat.st_mtime_ns:
+            legacy = {}
+        upsert_dataset(upload_dir, name, **{**legacy, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns})
@@ -0,0 +1,216 @@
+import hashlib
+import json
+import math
+import os
+import re
+import shutil
+import uuid
+
+from metadata_utils import HASH_CHUNK_SIZE
+
+PART_FILENAME = "data.part"
+RECEIVED_SUFFIX = ".received"
+SESSIONS_DIRNAME = ".sessions"
+SESSION_MANIFEST = "session.json"
+SESSION_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+
+def preallocate(fd: int, size: int) -> None:
+    """Резервирует место под файл заранее: меньше фрагментации и ранняя ошибка при нехватке диска."""
+    if size <= 0:
+        return
+    if hasattr(os, "posix_fallocate"):
+        try:
+            os.posix_fallocate(fd, 0, size)
+            return
+        except OSError:
+            pass  # ФС без поддержки fallocate
+    if os.fstat(fd).st_size < size:
+        os.ftruncate(fd, size)
+
+
+def write_at(fd: int, source, offset: int, digest=None, limit: int | None = None) -> int:
+    """
+    Пишет поток source в файл с позиции offset, возвращает число записанных байт.
+    За offset + limit запись не выходит: если в source больше limit байт, ValueError.
+    """
+    written = 0
+    for block in iter(lambda: source.read(HASH_CHUNK_SIZE if limit is None else min(HASH_CHUNK_SIZE, limit - written)), b""):
+        if digest is not None:
+            digest.update(block)
+        view = memoryview(block)
+        while view:
+            count = os.pwrite(fd, view, offset + written)
+            view = view[count:]
+            written += count
+        if limit is not None and written == limit:
+            if source.read(1):
+                raise ValueError(f"Source is larger than {limit} bytes.")
+            break
+    return written
+
+
+def copy_into(src_path: str, dst_fd: int, offset: int) -> int:
+    """
+    Копирует файл src_path в dst_fd с позиции offset без прохода данных через Python:
+    copy_file_range (Linux, возможен reflink), затем sendfile, затем copyfileobj большими блоками.
+    """
+    size = os.path.getsize(src_path)
+    with open(src_path, "rb") as src:
+        src_fd = src.fileno()
+        copied = 0
+        if hasattr(os, "copy_file_range"):
+            try:
+                while copied < size:
+                    count = os.copy_file_range(src_fd, dst_fd, size - copied, copied, offset + copied)
+                    if count == 0:
+                        break
+                    copied += count
+                if copied == size:
+                    return size
+            except OSError:
+                pass  # например, разные ФС на старых ядрах
+
+        if hasattr(os, "sendfile"):
+            try:
+                os.lseek(dst_fd, offset + copied, os.SEEK_SET)
+                while copied < size:
+                    count = os.sendfile(dst_fd, src_fd, copied, size - copied)
+                    if count == 0:
+                        break
+                    copied += count
+                if copied == size:
+                    return size
+            except OSError:
+                pass
+
+        src.seek(copied)
+        os.lseek(dst_fd, offset + copied, os.SEEK_SET)
+        with open(dst_fd, "wb", closefd=False) as dst:
+            shutil.copyfileobj(src, dst, length=HASH_CHUNK_SIZE)
+        return size
+
+
+def mark_received(session_path: str, chunk_index: int, size: int) -> None:
+    marker_path = os.path.join(session_path, f"{chunk_index}{RECEIVED_SUFFIX}")
+    with open(marker_path, "w", encoding="utf-8") as f:
+        f.write(str(size))
+
+
+def unmark_received(session_path: str, chunk_index: int) -> None:
+    try:
+        os.remove(os.path.join(session_path, f"{chunk_index}{RECEIVED_SUFFIX}"))
+    except FileNotFoundError:
+        pass
+
+
+def received_chunks(session_path: str) -> dict[int, int]:
+    chunks = {}
+    for name in os.listdir(session_path):
+        if name.endswith(RECEIVED_SUFFIX):
+            with open(os.path.join(session_path, name), "r", encoding="utf-8") as f:
+                chunks[int(name[: -len(RECEIVED_SUFFIX)])] = int(f.read())
+    return chunks
+
+
+def finalize_part_file(session_path: str, chunk_size: int, final_path: str) -> int:
+    """
+    Проверяет, что чанки пришли без пропусков, обрезает предвыделенный хвост
+    и переименовывает собранный файл в final_path. Возвращает размер файла.
+    """
+    chunks = received_chunks(session_path)
+    if not chunks:
+        raise ValueError("No chunks were uploaded for this session.")
+    last_index = max(chunks)
+    missing = sorted(set(range(last_index + 1)) - set(chunks))
+    if missing:
+        raise ValueError(f"Missing chunks: {missing}")
+    short = [index for index, size in chunks.items() if index != last_index and size != chunk_size]
+    if short:
+        raise ValueError(f"Chunks {sorted(short)} are shorter than chunk_size={chunk_size}.")
+
+    total_size = last_index * chunk_size + chunks[last_index]
+    part_path = os.path.join(session_path, PART_FILENAME)
+    os.truncate(part_path, total_size)
+    os.replace(part_path, final_path)
+    return total_size
+
+
+# --- Сессии загрузки: размер, число чанков и хэши объявляются заранее ---
+
+def session_path(upload_dir: str, session_id: str) -> str | None:
+    """Путь к каталогу сессии; None для некорректного или несуществующего session_id."""
+    if not SESSION_ID_PATTERN.match(session_id):
+        return None
+    path = os.path.join(upload_dir, SESSIONS_DIRNAME, session_id)
+    return path if os.path.isfile(os.path.join(path, SESSION_MANIFEST)) else None
+
+
+def create_session(upload_dir: str, filename: str, total_size: int, chunk_size: int, sha256: str | None) -> dict:
+    session_id = uuid.uuid4().hex
+    path = os.path.join(upload_dir, SESSIONS_DIRNAME, session_id)
+    os.makedirs(path)
+    session = {
+        "session_id": session_id,
+        "filename": filename,
+        "total_size": total_size,
+        "chunk_size": chunk_size,
+        "chunk_count": max(math.ceil(total_size / chunk_size), 1),
+        "sha256": sha256,
+    }
+    fd = os.open(os.path.join(path, PART_FILENAME), os.O_WRONLY | os.O_CREAT, 0o644)
+    try:
+        preallocate(fd, total_size)
+    finally:
+        os.close(fd)
+    with open(os.path.join(path, SESSION_MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(session, f)
+    return session
+
+
+def read_session(path: str) -> dict:
+    with open(os.path.join(path, SESSION_MANIFEST), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def expected_chunk_size(session: dict, chunk_index: int) -> int:
+    if chunk_index < session["chunk_count"] - 1:
+        return session["chunk_size"]
+    return session["total_size"] - session["chunk_size"] * (session["chunk_count"] - 1)
+
+
+def write_session_chunk(path: str, session: dict, chunk_index: int, source, sha256: str) -> None:
+    """
+    Пишет чанк на его место в файле сессии. Повтор того же чанка перезаписывает
+    те же байты, поэтому дублей не бывает. Чанк засчитывается, только если совпали размер и SHA-256.
+    """
+    if not 0 <= chunk_index < session["chunk_count"]:
+        raise ValueError(f"chunk_index must be in [0, {session['chunk_count'] - 1}].")
+
+    expected = expected_chunk_size(session, chunk_index)
+    # Размер проверяется до записи: лишние байты затерли бы соседний чанк
+    source.seek(0, os.SEEK_END)
+    size = source.tell()
+    source.seek(0)
+    if size != expected:
+        raise ValueError(f"Chunk {chunk_index} has {size} bytes, expected {expected}.")
+
+    unmark_received(path, chunk_index)
+    digest = hashlib.sha256()
+    fd = os.open(os.path.join(path, PART_FILENAME), os.O_WRONLY)
+    try:
+        written = write_at(fd, source, chunk_index * session["chunk_size"], digest, limit=expected)
+    finally:
+        os.close(fd)
+
+    if written != expected:
+        raise ValueError(f"Chunk {chunk_index} has {written} bytes, expected {expected}.")
+    if digest.hexdigest() != sha256.lower():
+        raise ValueError(f"Chunk {chunk_index} SHA-256 mismatch.")
+    mark_received(path, chunk_index, written)
+
+
+def session_status(path: str, session: dict) -> dict:
+    received = sorted(received_chunks(path))
+    missing = sorted(set(range(session["chunk_count"])) - set(received))
+    return {**session, "received": received, "missing": missing}
@@ -0,0 +1,338 @@
+import csv
+import json
+import math
+import os
+import tempfile
+from typing import Iterator
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from metadata_utils import file_sha256, write_metadata
+
+CSV_ENCODINGS = ("utf-8", "utf-8-sig", "cp1251", "windows-1251")
+COLUMNAR_FORMAT_VERSION = 1
+# Строк в части файла при построении Parquet-копии: в памяти file_service одна часть, а не весь файл
+COLUMNAR_CHUNK_ROWS = int(os.getenv("COLUMNAR_CHUNK_ROWS", "200000"))
+# Ключ, под которым в метаданных Parquet-схемы лежат сведения об исходном файле
+METADATA_KEY = b"ai_analyst"
+
+
+def read_parquet_table(file_path: str, nrows: int | None = None) -> pd.DataFrame:
+    """Parquet-файл как есть: схема уже типизирована, header и кодировка не нужны."""
+    parquet_file = pq.ParquetFile(file_path)
+    if nrows == 0:
+        return parquet_file.schema_arrow.empty_table().to_pandas()
+    df = parquet_file.read().to_pandas()
+    return df if nrows is None else df.head(nrows)
+
+
+def read_uploaded_table_with_encoding(file_path: str, **kwargs) -> tuple[pd.DataFrame, str | None]:
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension in {".xlsx", ".xls"}:
+        return pd.read_excel(file_path, **kwargs), None
+    if extension == ".parquet":
+        return read_parquet_table(file_path, nrows=kwargs.get("nrows")), None
+
+    last_error: Exception | None = None
+    for encoding in CSV_ENCODINGS:
+        try:
+            return pd.read_csv(file_path, encoding=encoding, **kwargs), encoding
+        except UnicodeDecodeError as exc:
+            last_error = exc
+
+    try:
+        return pd.read_csv(file_path, encoding="latin1", **kwargs), "latin1"
+    except Exception as exc:
+        raise last_error or exc
+
+
+def read_uploaded_table(file_path: str, **kwargs) -> pd.DataFrame:
+    return read_uploaded_table_with_encoding(file_path, **kwargs)[0]
+
+
+def columnar_dir(upload_dir: str) -> str:
+    path = os.path.join(upload_dir, ".columnar")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def columnar_path(upload_dir: str, filename: str) -> str:
+    return os.path.join(columnar_dir(upload_dir), f"{filename}.parquet")
+
+
+def remove_columnar_copy(upload_dir: str, filename: str) -> None:
+    try:
+        os.remove(columnar_path(upload_dir, filename))
+    except FileNotFoundError:
+        pass
+
+
+def _to_arrow_column(series: pd.Series) -> pa.Array:
+    try:
+        return pa.array(series, from_pandas=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # Смешанные типы в object-колонке: храним как строки, пропуски остаются null
+        return pa.array(series.where(series.isna(), series.astype(str)), type=pa.string(), from_pandas=True)
+
+
+def sniff_delimiter(file_path: str, encoding: str | None) -> str | None:
+    if encoding is None:
+        return None
+    with open(file_path, "r", encoding=encoding, errors="replace", newline="") as f:
+        sample = f.read(64 * 1024)
+    try:
+        return csv.Sniffer().sniff(sample, delimiters=",;\t|").delimiter
+    except csv.Error:
+        return None
+
+
+def _json_number(value) -> float | None:
+    value = float(value)
+    return value if math.isfinite(value) else None
+
+
+def _sorted_unique(values: np.ndarray) -> np.ndarray:
+    # Сортировка быстрее np.unique для миллионов uint64 (numpy 2 выбирает для них хэш-таблицу)
+    values = np.sort(values)
+    return values[np.concatenate(([True], values[1:] != values[:-1]))] if len(values) else values
+
+
+class ColumnStatsAccumulator:
+    """
+    Статистика по колонкам для каталога, собираемая по частям файла: пропуски, уникальные
+    значения (по 64-битным хэшам), min/max/mean/std для чисел (среднее и дисперсия объединяются
+    по формуле Чана).
+    """
+
+    # Сколько хэшей копится до схлопывания в уникальные
+    UNIQUE_FLUSH_SIZE = 1_000_000
+
+    def __init__(self) -> None:
+        self._columns: dict[str, dict] = {}
+
+    def update(self, df: pd.DataFrame) -> None:
+        for column in df.columns:
+            series = df[column]
+            acc = self._columns.setdefault(
+                column, {"non_null": 0, "nulls": 0, "hashes": [], "pending": 0, "numeric": None}
+            )
+            values = series.dropna()
+            acc["non_null"] += int(len(values))
+            acc["nulls"] += int(len(series) - len(values))
+            if len(values):
+                hashes = _sorted_unique(pd.util.hash_array(values.to_numpy()))
+                acc["hashes"].append(hashes)
+                acc["pending"] += len(hashes)
+                if acc["pending"] > self.UNIQUE_FLUSH_SIZE:
+                    acc["hashes"] = [_sorted_unique(np.concatenate(acc["hashes"]))]
+                    acc["pending"] = len(acc["hashes"][0])
+            if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series) and len(values):
+                self._update_numeric(acc, values.to_numpy(dtype=np.float64))
+
+    @staticmethod
+    def _update_numeric(acc: dict, values: np.ndarray) -> None:
+        n, mean = len(values), float(values.mean())
+        m2 = float(((values - mean) ** 2).sum())
+        current = acc["numeric"]
+        if current is None:
+            acc["numeric"] = {"n": n, "mean": mean, "m2": m2, "min": float(values.min()), "max": float(values.max())}
+            return
+        total = current["n"] + n
+        delta = mean - current["mean"]
+        current["m2"] += m2 + delta ** 2 * current["n"] * n / total
+        current["mean"] += delta * n / total
+        current["n"] = total
+        current["min"] = min(current["min"], float(values.min()))
+        current["max"] = max(current["max"], float(values.max()))
+
+    def result(self) -> dict:
+        stats = {}
+        for column, acc in self._columns.items():
+            entry = {
+                "non_null": acc["non_null"],
+                "nulls": acc["nulls"],
+                "unique": int(len(_sorted_unique(np.concatenate(acc["hashes"])))) if acc["hashes"] else 0,
+            }
+            numeric = acc["numeric"]
+            if numeric is not None:
+                entry.update(
+                    min=_json_number(numeric["min"]),
+                    max=_json_number(numeric["max"]),
+                    mean=_json_number(numeric["mean"]),
+                    std=_json_number(math.sqrt(numeric["m2"] / (numeric["n"] - 1))) if numeric["n"] > 1 else None,
+                )
+            stats[column] = entry
+        return stats
+
+
+def column_stats(df: pd.DataFrame) -> dict:
+    """Базовая статистика по колонкам для каталога: пропуски, уникальные значения, min/max/mean/std для чисел."""
+    accumulator = ColumnStatsAccumulator()
+    accumulator.update(df)
+    return accumulator.result()
+
+
+def _chunk_kind(series: pd.Series) -> str | None:
+    """Тип значений колонки в части CSV; None, если в части одни пропуски."""
+    if not series.notna().any():
+        return None
+    if pd.api.types.is_bool_dtype(series):
+        return "bool"
+    if pd.api.types.is_integer_dtype(series):
+        return "int"
+    if pd.api.types.is_float_dtype(series):
+        return "float"
+    if series.dtype == object and series.dropna().map(type).eq(bool).all():
+        return "bool"  # True/False с пропусками
+    return "str"
+
+
+def _merged_dtype(kinds: set, has_nulls: bool) -> str:
+    """
+    Тип колонки, который pandas вывел бы по всему файлу сразу: целые с пропусками — float64,
+    смесь чисел и строк — str. True/False с пропусками pandas читает как object, здесь — boolean:
+    в части могут оказаться одни пропуски.
+    """
+    if not kinds or kinds <= {"int", "float"}:
+        return "int64" if kinds == {"int"} and not has_nulls else "float64"
+    if kinds == {"bool"}:
+        return "bool" if not has_nulls else "boolean"
+    return "str"
+
+
+def _csv_column_dtypes(source_path: str, encoding: str, chunk_rows: int) -> dict:
+    """Первый проход по CSV: общий для всех частей тип каждой колонки."""
+    kinds: dict[str, set] = {}
+    has_nulls: dict[str, bool] = {}
+    rows = 0
+    for chunk in pd.read_csv(source_path, encoding=encoding, chunksize=chunk_rows):
+        rows += len(chunk)
+        for column in chunk.columns:
+            kind = _chunk_kind(chunk[column])
+            kinds.setdefault(column, set())
+            if kind is not None:
+                kinds[column].add(kind)
+            has_nulls[column] = has_nulls.get(column, False) or bool(chunk[column].isna().any())
+    if not rows:
+        return {}  # только заголовок: типы оставляем как у pandas
+    return {column: _merged_dtype(column_kinds, has_nulls[column]) for column, column_kinds in kinds.items()}
+
+
+def iter_uploaded_chunks(source_path: str, chunk_rows: int) -> tuple[str | None, Iterator[pd.DataFrame]]:
+    """
+    Кодировка и части загруженного файла с одинаковыми типами колонок во всех частях.
+    CSV читается в два прохода по chunk_rows строк: сначала типы и кодировка, затем данные,
+    поэтому в памяти одна часть, а не весь файл. Parquet читается по row group-ам,
+    Excel — целиком (формат не читается по частям).
+    """
+    extension = os.path.splitext(source_path)[1].lower()
+    if extension in {".xlsx", ".xls"}:
+        return None, iter([pd.read_excel(source_path)])
+    if extension == ".parquet":
+        parquet_file = pq.ParquetFile(source_path)
+        if parquet_file.metadata.num_rows == 0:
+            return None, iter([parquet_file.schema_arrow.empty_table().to_pandas()])
+        return None, (batch.to_pandas() for batch in parquet_file.iter_batches(batch_size=chunk_rows))
+
+    last_error: Exception | None = None
+    for encoding in (*CSV_ENCODINGS, "latin1"):
+        try:
+            dtypes = _csv_column_dtypes(source_path, encoding, chunk_rows)
+            break
+        except UnicodeDecodeError as exc:
+            last_error = exc
+    else:
+        raise last_error
+
+    # boolean задается после чтения части: read_csv не разбирает пропуски в такой колонке
+    forced = {column: dtype for column, dtype in dtypes.items() if dtype != "boolean"}
+
+    def chunks():
+        for chunk in pd.read_csv(source_path, encoding=encoding, chunksize=chunk_rows, dtype=forced):
+            for column in chunk.columns:
+                if dtypes.get(column) == "boolean":
+                    chunk[column] = chunk[column].astype("boolean")
+            yield chunk
+
+    return encoding, chunks()
+
+
+def _cast_to_schema(array: pa.Array, field: pa.Field) -> pa.Array:
+    return array if array.type == field.type else array.cast(field.type)
+
+
+def build_columnar_copy(upload_dir: str, filename: str, source_sha256: str | None = None) -> dict:
+    """
+    Один раз парсит загруженный CSV/Excel и сохраняет типизированную Parquet-копию.
+    Файл конвертируется по COLUMNAR_CHUNK_ROWS строк (iter_uploaded_chunks), статистика
+    копится по частям. Кодировка, dtypes и число строк пишутся в метаданные Parquet,
+    а вместе со схемой и статистикой по колонкам — в каталог датасетов.
+    """
+    source_path = os.path.join(upload_dir, filename)
+    source_sha256 = source_sha256 or file_sha256(source_path)
+    encoding, chunks = iter_uploaded_chunks(source_path, COLUMNAR_CHUNK_ROWS)
+
+    target_path = columnar_path(upload_dir, filename)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(target_path), prefix=".tmp-")
+    os.close(fd)
+    stats = ColumnStatsAccumulator()
+    row_count = 0
+    columns: list[str] = []
+    dtypes: dict[str, str] = {}
+    schema = None
+    writer = None
+    try:
+        for chunk in chunks:
+            chunk.columns = [str(column) for column in chunk.columns]
+            arrays = [_to_arrow_column(chunk[column]) for column in chunk.columns]
+            if schema is None:
+                columns = list(chunk.columns)
+                dtypes = {column: str(dtype) for column, dtype in chunk.dtypes.items()}
+                # Колонка из одних пропусков в первой части: тип уточняется по следующим
+                schema = pa.schema(
+                    pa.field(column, pa.string() if array.type == pa.null() and len(chunk) else array.type)
+                    for column, array in zip(columns, arrays)
+                )
+                writer = pq.ParquetWriter(tmp_path, schema, compression="zstd")
+            table = pa.Table.from_arrays(
+                [_cast_to_schema(array, field) for array, field in zip(arrays, schema)], schema=schema
+            )
+            writer.write_table(table)
+            stats.update(chunk)
+            row_count += len(chunk)
+        info = {
+            "format_version": COLUMNAR_FORMAT_VERSION,
+            "source_filename": filename,
+            "source_sha256": source_sha256,
+            "encoding": encoding,
+            "row_count": row_count,
+            "dtypes": dtypes,
+        }
+        # Число строк известно только после последней части, поэтому метаданные пишутся в футер
+        writer.add_key_value_metadata({METADATA_KEY: json.dumps(info, ensure_ascii=False).encode("utf-8")})
+        writer.close()
+        writer = None
+        os.replace(tmp_path, target_path)
+    finally:
+        if writer is not None:
+            writer.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    columnar_sha256 = file_sha256(target_path)
+    write_metadata(
+        upload_dir,
+        filename,
+        encoding=encoding,
+        delimiter=sniff_delimiter(source_path, encoding),
+        row_count=info["row_count"],
+        columns=columns,
+        dtypes=info["dtypes"],
+        stats=stats.result(),
+        columnar_sha256=columnar_sha256,
+        columnar_source_sha256=info["source_sha256"],
+    )
+    return {**info, "columnar_sha256": columnar_sha256}
@@ -0,0 +1,105 @@
+import contextlib
+import os
+import tempfile
+import threading
+
+import pyarrow as pa
+
+from metadata_utils import HASH_CHUNK_SIZE
+
+# Content-Encoding -> расширение предсжатой копии. Порядок задает предпочтение при выборе кодировки
+ENCODINGS = {"zstd": ".zst", "gzip": ".gz"}
+# xlsx — уже zip-архив, повторное сжатие почти ничего не дает
+COMPRESSIBLE_EXTENSIONS = {".csv", ".xls"}
+MIN_COMPRESS_SIZE = 64 * 1024
+
+_building_guard = threading.Lock()
+_building: set[str] = set()
+
+
+def compressed_dir(upload_dir: str) -> str:
+    path = os.path.join(upload_dir, ".compressed")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def compressed_path(upload_dir: str, filename: str, sha256: str, encoding: str) -> str:
+    # Хэш исходника в имени: копия от прежней версии файла никогда не будет отдана по ошибке
+    return os.path.join(compressed_dir(upload_dir), f"{filename}.{sha256}{ENCODINGS[encoding]}")
+
+
+def supports_compression(upload_dir: str, filename: str) -> bool:
+    if os.path.splitext(filename)[1].lower() not in COMPRESSIBLE_EXTENSIONS:
+        return False
+    return os.path.getsize(os.path.join(upload_dir, filename)) >= MIN_COMPRESS_SIZE
+
+
+def parse_accept_encoding(header: str | None) -> list[str]:
+    """Поддерживаемые кодировки из Accept-Encoding в порядке ENCODINGS; q=0 означает отказ."""
+    accepted = set()
+    for item in (header or "").split(","):
+        name, _, params = item.strip().partition(";")
+        quality = params.strip()
+        if quality.startswith("q="):
+            try:
+                if float(quality[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(name.strip().lower())
+    return [encoding for encoding in ENCODINGS if encoding in accepted]
+
+
+def find_compressed_copy(upload_dir: str, filename: str, sha256: str, encodings: list[str]) -> tuple[str, str] | None:
+    """Первая готовая предсжатая копия из encodings: (кодировка, путь)."""
+    for encoding in encodings:
+        path = compressed_path(upload_dir, filename, sha256, encoding)
+        if os.path.isfile(path):
+            return encoding, path
+    return None
+
+
+def remove_compressed_copies(upload_dir: str, filename: str, keep_sha256: str | None = None) -> None:
+    prefix = f"{filename}."
+    directory = compressed_dir(upload_dir)
+    for name in os.listdir(directory):
+        if not name.startswith(prefix) or not name.endswith(tuple(ENCODINGS.values())):
+            continue
+        sha256 = os.path.splitext(name[len(prefix):])[0]
+        if len(sha256) == 64 and sha256 != keep_sha256:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(os.path.join(directory, name))
+
+
+def build_compressed_copy(upload_dir: str, filename: str, sha256: str, encoding: str) -> str:
+    """
+    Сжимает файл потоково во временный файл и публикует его через rename,
+    поэтому читатели видят либо готовую копию, либо никакой.
+    """
+    target_path = compressed_path(upload_dir, filename, sha256, encoding)
+    with _building_guard:
+        # Несколько запросов подряд не должны сжимать один и тот же файл параллельно
+        if os.path.isfile(target_path) or target_path in _building:
+            return target_path
+        _building.add(target_path)
+    try:
+        _write_compressed(upload_dir, filename, target_path, encoding)
+    finally:
+        with _building_guard:
+            _building.discard(target_path)
+    remove_compressed_copies(upload_dir, filename, keep_sha256=sha256)
+    return target_path
+
+
+def _write_compressed(upload_dir: str, filename: str, target_path: str, encoding: str) -> None:
+    fd, tmp_path = tempfile.mkstemp(dir=compressed_dir(upload_dir), prefix=".tmp-")
+    os.close(fd)
+    try:
+        with open(os.path.join(upload_dir, filename), "rb") as source, \
+                pa.output_stream(tmp_path, compression=encoding) as sink:
+            for block in iter(lambda: source.read(HASH_CHUNK_SIZE), b""):
+                sink.write(block)
+        os.replace(tmp_path, target_path)
+    finally:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(tmp_path)
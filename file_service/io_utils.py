@@ -0,0 +1,18 @@
+import functools
+import os
+
+import anyio
+import anyio.to_thread
+
+# Дисковые операции уходят в отдельный ограниченный пул потоков, чтобы не блокировать event loop
+DISK_IO_LIMITER = anyio.CapacityLimiter(int(os.getenv("FILE_SERVICE_IO_THREADS", "8")))
+# Разбор pandas/pyarrow тяжелее по CPU и памяти, поэтому пул для него меньше
+PARSE_LIMITER = anyio.CapacityLimiter(int(os.getenv("FILE_SERVICE_PARSE_THREADS", "2")))
+
+
+async def run_io(func, *args, **kwargs):
+    return await anyio.to_thread.run_sync(functools.partial(func, *args, **kwargs), limiter=DISK_IO_LIMITER)
+
+
+async def run_parse(func, *args, **kwargs):
+    return await anyio.to_thread.run_sync(functools.partial(func, *args, **kwargs), limiter=PARSE_LIMITER)
@@ -1,19 +1,66 @@
 #file_service/main.py
 import os
 import shutil
+import hashlib
 import pandas as pd
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, BackgroundTasks, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse
 from typing import List
+import contextlib
 import logging
+import re
+
+from io_utils import run_io, run_parse
+from catalog_utils import DERIVED_FIELDS, find_by_hash, list_datasets, sync_catalog
+from blob_utils import adopt_file, blob_tempfile, collect_garbage, has_blob, link_blob, store_blob
+from metadata_utils import (
+    HASH_CHUNK_SIZE,
+    get_file_hash,
+    is_current,
+    read_metadata,
+    record_file_hash,
+    register_file,
+    write_metadata,
+)
+from columnar_utils import build_columnar_copy, columnar_path, read_uploaded_table, remove_columnar_copy
+from compression_utils import (
+    build_compressed_copy,
+    find_compressed_copy,
+    parse_accept_encoding,
+    remove_compressed_copies,
+    supports_compression,
+)
+from row_index import (
+    RowOffsetIndexer,
+    build_row_index,
+    read_row_index,
+    read_rows,
+    remove_row_index,
+    supports_row_index,
+    write_row_index,
+)
+from chunk_utils import (
+    PART_FILENAME,
+    copy_into,
+    create_session,
+    finalize_part_file,
+    mark_received,
+    preallocate,
+    read_session,
+    session_path as get_session_path,
+    session_status,
+    write_at,
+    write_session_chunk,
+)
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 UPLOAD_DIR = "/app/uploads"
-SUPPORTED_EXTENSIONS = {".csv", ".xlsx", ".xls"}
-CSV_ENCODINGS = ("utf-8", "utf-8-sig", "cp1251", "windows-1251")
+# .parquet — файлы результатов, которые сервисы выгружают сами (например, оценки prediction_service)
+SUPPORTED_EXTENSIONS = {".csv", ".xlsx", ".xls", ".parquet"}
+MAX_ROWS_PER_REQUEST = 1000
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
 app = FastAPI(title="File Ingestion Service")
@@ -27,146 +74,619 @@ app.add_middleware(
 )
 
 
-def read_uploaded_table(file_path: str, **kwargs) -> pd.DataFrame:
-    extension = os.path.splitext(file_path)[1].lower()
-    if extension in {".xlsx", ".xls"}:
-        return pd.read_excel(file_path, **kwargs)
+def _adopt_catalogued_files() -> None:
+    # Файлы, загруженные до появления хранилища блобов, переводятся в него, если их хэш уже известен
+    for filename in list_datasets(UPLOAD_DIR)[0]:
+        metadata = read_metadata(UPLOAD_DIR, filename)
+        file_path = os.path.join(UPLOAD_DIR, filename)
+        if metadata.get("sha256") and os.path.isfile(file_path) and is_current(metadata, file_path):
+            adopt_file(UPLOAD_DIR, filename, metadata["sha256"])
 
-    last_error: Exception | None = None
-    for encoding in CSV_ENCODINGS:
-        try:
-            return pd.read_csv(file_path, encoding=encoding, **kwargs)
-        except UnicodeDecodeError as exc:
-            last_error = exc
 
+def _collect_garbage_safe() -> None:
+    try:
+        result = collect_garbage(UPLOAD_DIR)
+        if result["removed"]:
+            logger.info(f"Удалено блобов без ссылок: {result['removed']}, освобождено {result['freed_bytes']} байт")
+    except Exception as e:
+        logger.warning(f"Не удалось собрать мусор в хранилище блобов: {e}")
+
+
+@app.on_event("startup")
+async def on_startup():
+    # Файлы, загруженные до появления каталога, регистрируются один раз при старте
+    await run_io(sync_catalog, UPLOAD_DIR, SUPPORTED_EXTENSIONS)
+    await run_io(_adopt_catalogued_files)
+    await run_io(_collect_garbage_safe)
+
+
+def _reuse_columnar_copy(filename: str, sha256: str) -> bool:
+    """
+    Parquet-копия уже есть для этого содержимого: у самого файла или у такого же файла под
+    другим именем. Во втором случае копия, схема и статистика переносятся без разбора файла.
+    """
+    for other in find_by_hash(UPLOAD_DIR, sha256):
+        metadata = read_metadata(UPLOAD_DIR, other)
+        other_path = columnar_path(UPLOAD_DIR, other)
+        if metadata.get("columnar_source_sha256") != sha256 or not os.path.isfile(other_path):
+            continue
+        if other != filename:
+            target_path = columnar_path(UPLOAD_DIR, filename)
+            shutil.copyfile(other_path, f"{target_path}.tmp")
+            os.replace(f"{target_path}.tmp", target_path)
+            write_metadata(
+                UPLOAD_DIR, filename, **{field: metadata[field] for field in DERIVED_FIELDS if field in metadata}
+            )
+        return True
+    return False
+
+
+def _build_columnar_copy_safe(filename: str, source_sha256: str | None = None) -> None:
+    # Фоновая задача: ошибка конвертации не должна ломать загрузку, ML-сервисы прочитают исходный файл
+    try:
+        if source_sha256 and _reuse_columnar_copy(filename, source_sha256):
+            return
+        info = build_columnar_copy(UPLOAD_DIR, filename, source_sha256)
+        logger.info(f"Parquet-копия '{filename}' готова: {info['row_count']} строк, кодировка {info['encoding']}")
+    except Exception as e:
+        logger.warning(f"Не удалось построить Parquet-копию '{filename}': {e}")
+
+
+def _build_compressed_copy_safe(filename: str, sha256: str, encoding: str = "zstd") -> None:
+    # Фоновая задача: пока копии нет, /download/ отдает файл без сжатия
+    try:
+        if supports_compression(UPLOAD_DIR, filename):
+            build_compressed_copy(UPLOAD_DIR, filename, sha256, encoding)
+    except Exception as e:
+        logger.warning(f"Не удалось построить {encoding}-копию '{filename}': {e}")
+
+
+def _build_derived_copies(filename: str, sha256: str) -> None:
+    _build_columnar_copy_safe(filename, sha256)
+    _build_compressed_copy_safe(filename, sha256)
+    _collect_garbage_safe()
+
+
+def _store_chunk(source, session_id: str, chunk_index: int, chunk_size: int | None, total_size: int | None) -> None:
+    session_path = os.path.join(UPLOAD_DIR, session_id)
+    os.makedirs(session_path, exist_ok=True)
+
+    if chunk_size is None:
+        chunk_path = os.path.join(session_path, f"chunk_{chunk_index}")
+        with open(chunk_path, "wb") as buffer:
+            shutil.copyfileobj(source, buffer, length=HASH_CHUNK_SIZE)
+        return
+
+    if chunk_size <= 0 or chunk_index < 0:
+        raise HTTPException(status_code=400, detail="chunk_size must be positive and chunk_index non-negative.")
+    # Размер проверяется до записи: лишние байты затерли бы следующий чанк
+    source.seek(0, os.SEEK_END)
+    size = source.tell()
+    source.seek(0)
+    if size > chunk_size:
+        raise HTTPException(status_code=400, detail=f"Chunk {chunk_index} is larger than chunk_size={chunk_size}.")
+    part_path = os.path.join(session_path, PART_FILENAME)
+    fd = os.open(part_path, os.O_RDWR | os.O_CREAT, 0o644)
     try:
-        return pd.read_csv(file_path, encoding="latin1", **kwargs)
-    except Exception as exc:
-        raise last_error or exc
+        if total_size and os.fstat(fd).st_size < total_size:
+            preallocate(fd, total_size)
+        written = write_at(fd, source, chunk_index * chunk_size, limit=chunk_size)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Chunk {chunk_index} is larger than chunk_size={chunk_size}.")
+    finally:
+        os.close(fd)
+    mark_received(session_path, chunk_index, written)
+
 
 @app.post("/upload/")
 async def upload_chunk(
     file: UploadFile = File(...),
     session_id: str = Form(...), # Уникальный ID для каждой сессии загрузки
-    chunk_index: int = Form(...) # Номер текущей части файла
+    chunk_index: int = Form(...), # Номер текущей части файла
+    chunk_size: int | None = Form(None), # Размер всех частей, кроме последней
+    total_size: int | None = Form(None) # Полный размер файла, для предвыделения места
 ):
 
-# Принимает одну часть (чанк) файла и сохраняет ее
+# Принимает одну часть (чанк) файла и сохраняет ее.
+# Если передан chunk_size, часть сразу пишется на свое место в общий файл сессии,
+# и /assemble/ сводится к переименованию. Без chunk_size — старый формат chunk_N.
 
     try:
-        session_path = os.path.join(UPLOAD_DIR, session_id)
-        os.makedirs(session_path, exist_ok=True)
-
-        chunk_path = os.path.join(session_path, f"chunk_{chunk_index}")
-        with open(chunk_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-
+        await run_io(_store_chunk, file.file, session_id, chunk_index, chunk_size, total_size)
         return {"status": "success", "message": f"Chunk {chunk_index} uploaded"}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.post("/assemble/{session_id}")
-async def assemble_chunks(
-    session_id: str,
-    filename: str = Form(...)
-):
+def _index_assembled_file(filename: str, sha256: str | None = None) -> None:
+    # Хэш, индекс строк и Parquet-копия считаются в фоне, чтобы /assemble/ не читал файл целиком
+    try:
+        if sha256 is None:
+            sha256 = record_file_hash(UPLOAD_DIR, filename)
+            adopt_file(UPLOAD_DIR, filename, sha256)
+        if supports_row_index(filename) and read_row_index(UPLOAD_DIR, filename).get("source_sha256") != sha256:
+            build_row_index(UPLOAD_DIR, filename, sha256)
+    except Exception as e:
+        logger.warning(f"Не удалось проиндексировать '{filename}': {e}")
+        return
+    _build_derived_copies(filename, sha256)
+
+
+def _assemble_chunks(session_id: str, filename: str, chunk_size: int | None) -> None:
     session_path = os.path.join(UPLOAD_DIR, session_id)
     final_file_path = os.path.join(UPLOAD_DIR, filename)
 
-    try:
+    _remove_derived_copies(filename)
+    if os.path.exists(os.path.join(session_path, PART_FILENAME)):
+        if chunk_size is None:
+            raise HTTPException(status_code=400, detail="chunk_size is required for this session.")
+        try:
+            finalize_part_file(session_path, chunk_size, final_file_path)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    else:
         chunks = sorted(
             os.listdir(session_path),
             key=lambda x: int(x.split('_')[1])
         )
-        with open(final_file_path, "wb") as final_file:
-            for chunk_name in chunks:
-                chunk_path = os.path.join(session_path, chunk_name)
-                with open(chunk_path, "rb") as chunk_file:
-                    final_file.write(chunk_file.read())
-        shutil.rmtree(session_path)
+        chunk_paths = [os.path.join(session_path, chunk_name) for chunk_name in chunks]
+        tmp_path = os.path.join(session_path, PART_FILENAME)
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            preallocate(fd, sum(os.path.getsize(path) for path in chunk_paths))
+            offset = 0
+            for chunk_path in chunk_paths:
+                offset += copy_into(chunk_path, fd, offset)
+            os.ftruncate(fd, offset)
+        finally:
+            os.close(fd)
+        os.replace(tmp_path, final_file_path)
+    shutil.rmtree(session_path)
+    register_file(UPLOAD_DIR, filename)
+
+
+@app.post("/assemble/{session_id}")
+async def assemble_chunks(
+    session_id: str,
+    background_tasks: BackgroundTasks,
+    filename: str = Form(...),
+    chunk_size: int | None = Form(None)
+):
+    final_file_path = os.path.join(UPLOAD_DIR, filename)
+
+    try:
+        await run_io(_assemble_chunks, session_id, filename, chunk_size)
+        background_tasks.add_task(run_parse, _index_assembled_file, filename)
 
         return {"status": "success", "message": f"File '{filename}' assembled successfully at {final_file_path}"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def _remove_derived_copies(filename: str) -> None:
+    remove_columnar_copy(UPLOAD_DIR, filename)
+    remove_compressed_copies(UPLOAD_DIR, filename)
+    remove_row_index(UPLOAD_DIR, filename)
+
+
+def _references_content(filename: str, sha256: str) -> bool:
+    """Имя filename уже указывает на содержимое с этим SHA-256."""
+    file_path = os.path.join(UPLOAD_DIR, filename)
+    metadata = read_metadata(UPLOAD_DIR, filename)
+    return metadata.get("sha256") == sha256 and os.path.isfile(file_path) and is_current(metadata, file_path)
+
+
+def _link_known_content(filename: str, sha256: str) -> bool:
+    """
+    Если содержимое с этим SHA-256 уже хранится, имя filename становится ссылкой на него
+    без передачи данных. False, если такого содержимого нет.
+    """
+    if _references_content(filename, sha256):
+        return True
+    if not has_blob(UPLOAD_DIR, sha256) or not find_by_hash(UPLOAD_DIR, sha256):
+        return False
+    _remove_derived_copies(filename)
+    link_blob(UPLOAD_DIR, sha256, filename)
+    register_file(UPLOAD_DIR, filename, sha256)
+    return True
+
+
+# --- Сессии загрузки: докачка и проверка целостности ---
+def _load_session(session_id: str) -> tuple[str, dict]:
+    path = get_session_path(UPLOAD_DIR, session_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    return path, read_session(path)
+
+
+@app.post("/upload-sessions/")
+async def create_upload_session(
+    background_tasks: BackgroundTasks,
+    filename: str = Form(...),
+    total_size: int = Form(...),
+    chunk_size: int = Form(...),
+    sha256: str | None = Form(None) # SHA-256 всего файла, проверяется при финализации
+):
+    """
+    Создает сессию загрузки: клиент заранее объявляет размер файла и размер чанка,
+    а сервер сообщает число чанков. Место под файл выделяется сразу.
+    Если файл с объявленным SHA-256 уже хранится, сессия не создается: имя сразу
+    связывается с существующим содержимым, и ответ приходит с deduplicated=true.
+    """
+    filename = os.path.basename(filename)
+    if not filename or os.path.splitext(filename)[1].lower() not in SUPPORTED_EXTENSIONS:
+        raise HTTPException(status_code=400, detail="Only CSV, Excel and Parquet files are supported.")
+    if total_size < 0 or chunk_size <= 0:
+        raise HTTPException(status_code=400, detail="total_size must be non-negative and chunk_size positive.")
+    sha256 = sha256.lower() if sha256 else None
+    try:
+        if sha256 and await run_io(_link_known_content, filename, sha256):
+            background_tasks.add_task(run_parse, _index_assembled_file, filename, sha256)
+            return {"status": "success", "filename": filename, "sha256": sha256, "deduplicated": True}
+        return await run_io(create_session, UPLOAD_DIR, filename, total_size, chunk_size, sha256)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/upload-sessions/{session_id}")
+async def get_upload_session(session_id: str):
+    """Состояние сессии: какие чанки приняты и какие нужно (до)отправить."""
+    path, session = await run_io(_load_session, session_id)
+    return await run_io(session_status, path, session)
+
+
+@app.put("/upload-sessions/{session_id}/chunks/{chunk_index}")
+async def upload_session_chunk(
+    session_id: str,
+    chunk_index: int,
+    file: UploadFile = File(...),
+    sha256: str = Form(...)
+):
+    """Принимает чанк; повторная отправка того же чанка безопасна."""
+    path, session = await run_io(_load_session, session_id)
+    try:
+        await run_io(write_session_chunk, path, session, chunk_index, file.file, sha256)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"status": "success", "chunk_index": chunk_index}
+
+
+def _finalize_session(path: str, session: dict) -> tuple[str, bool]:
+    status = session_status(path, session)
+    if status["missing"]:
+        raise HTTPException(
+            status_code=409,
+            detail={"message": "Not all chunks were uploaded", "missing": status["missing"]},
+        )
+
+    filename = session["filename"]
+    part_path = os.path.join(path, PART_FILENAME)
+    os.truncate(part_path, session["total_size"])
+    digest = hashlib.sha256()
+    indexer = RowOffsetIndexer() if supports_row_index(filename) else None
+    with open(part_path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(block)
+            if indexer:
+                indexer.feed(block)
+    sha256 = digest.hexdigest()
+    if session["sha256"] and sha256 != session["sha256"]:
+        shutil.rmtree(path)
+        raise HTTPException(
+            status_code=422,
+            detail="File SHA-256 mismatch: the upload is corrupted, start a new session.",
+        )
+
+    if _references_content(filename, sha256):
+        shutil.rmtree(path)
+        return sha256, True
+
+    _remove_derived_copies(filename)
+    deduplicated = store_blob(UPLOAD_DIR, part_path, sha256, filename)
+    shutil.rmtree(path)
+    register_file(UPLOAD_DIR, filename, sha256)
+    if indexer:
+        write_row_index(UPLOAD_DIR, filename, indexer.finish(), sha256)
+    return sha256, deduplicated
+
+
+@app.post("/upload-sessions/{session_id}/finalize")
+async def finalize_upload_session(session_id: str, background_tasks: BackgroundTasks):
+    """
+    Проверяет, что получены все чанки и SHA-256 всего файла совпадает с объявленным,
+    и публикует файл. Хэш и индекс строк считаются за один проход по файлу.
+    """
+    path, session = await run_io(_load_session, session_id)
+    filename = session["filename"]
+    try:
+        sha256, deduplicated = await run_io(_finalize_session, path, session)
+        background_tasks.add_task(run_parse, _build_derived_copies, filename, sha256)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return {
+        "status": "success",
+        "filename": filename,
+        "sha256": sha256,
+        "size": session["total_size"],
+        "deduplicated": deduplicated,
+    }
+
+
+@app.delete("/upload-sessions/{session_id}")
+async def abort_upload_session(session_id: str):
+    path, _ = await run_io(_load_session, session_id)
+    await run_io(shutil.rmtree, path, ignore_errors=True)
+    return {"status": "success"}
+
+
 @app.get("/files/", response_model=List[str])
-async def get_uploaded_files():
+async def get_uploaded_files(
+    response: Response,
+    limit: int | None = Query(None, ge=1, le=10000),
+    offset: int = Query(0, ge=0)
+):
+    # Список берется из каталога датасетов, без обхода каталога загрузок
     try:
-        files = [f for f in os.listdir(UPLOAD_DIR) if
-                 os.path.splitext(f)[1].lower() in SUPPORTED_EXTENSIONS and os.path.isfile(os.path.join(UPLOAD_DIR, f))]
+        files, total = await run_io(list_datasets, UPLOAD_DIR, limit, offset)
+        response.headers["X-Total-Count"] = str(total)
         return files
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Could not read upload directory: {e}")
 
 
+@app.post("/storage/gc")
+async def run_storage_gc():
+    """Удаляет блобы, на которые больше не ссылается ни одно имя файла."""
+    return await run_io(collect_garbage, UPLOAD_DIR)
+
+
+def _existing_upload(filename: str, sha256: str) -> str | None:
+    """Повторная загрузка того же файла: имя вида name.csv или name_N.csv с тем же содержимым."""
+    name, suffix = os.path.splitext(filename)
+    pattern = re.compile(rf"{re.escape(name)}(_\d+)?{re.escape(suffix)}")
+    for candidate in find_by_hash(UPLOAD_DIR, sha256):
+        if pattern.fullmatch(candidate) and _references_content(candidate, sha256):
+            return candidate
+    return None
+
+
+def _store_direct_upload(source, filename: str) -> tuple[str, str, bool]:
+    digest = hashlib.sha256()
+    indexer = RowOffsetIndexer() if supports_row_index(filename) else None
+    fd, tmp_path = blob_tempfile(UPLOAD_DIR)
+    try:
+        with os.fdopen(fd, "wb") as buffer:
+            for block in iter(lambda: source.read(HASH_CHUNK_SIZE), b""):
+                digest.update(block)
+                if indexer:
+                    indexer.feed(block)
+                buffer.write(block)
+        sha256 = digest.hexdigest()
+        existing = _existing_upload(filename, sha256)
+        if existing:
+            return existing, sha256, True
+
+        final_path = os.path.join(UPLOAD_DIR, filename)
+        if os.path.exists(final_path):
+            name, suffix = os.path.splitext(filename)
+            counter = 1
+            while os.path.exists(final_path):
+                final_path = os.path.join(UPLOAD_DIR, f"{name}_{counter}{suffix}")
+                counter += 1
+        stored_name = os.path.basename(final_path)
+        deduplicated = store_blob(UPLOAD_DIR, tmp_path, sha256, stored_name)
+    finally:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(tmp_path)
+
+    register_file(UPLOAD_DIR, stored_name, sha256)
+    if indexer:
+        write_row_index(UPLOAD_DIR, stored_name, indexer.finish(), sha256)
+    return stored_name, sha256, deduplicated
+
+
 @app.post("/upload-direct/")
-async def upload_direct(file: UploadFile = File(...)):
+async def upload_direct(background_tasks: BackgroundTasks, file: UploadFile = File(...)):
     filename = os.path.basename(file.filename or "")
     extension = os.path.splitext(filename)[1].lower()
     if not filename or extension not in SUPPORTED_EXTENSIONS:
-        raise HTTPException(status_code=400, detail="Only CSV and Excel files are supported.")
-
-    final_path = os.path.join(UPLOAD_DIR, filename)
-    if os.path.exists(final_path):
-        name, suffix = os.path.splitext(filename)
-        counter = 1
-        while os.path.exists(final_path):
-            final_path = os.path.join(UPLOAD_DIR, f"{name}_{counter}{suffix}")
-            counter += 1
+        raise HTTPException(status_code=400, detail="Only CSV, Excel and Parquet files are supported.")
 
     try:
-        with open(final_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        return {"status": "success", "filename": os.path.basename(final_path)}
+        stored_name, sha256, deduplicated = await run_io(_store_direct_upload, file.file, filename)
+        background_tasks.add_task(run_parse, _build_derived_copies, stored_name, sha256)
+        return {"status": "success", "filename": stored_name, "sha256": sha256, "deduplicated": deduplicated}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.get("/download/{filename}")
-async def download_file(filename: str):
+def _etag_matches(request: Request, sha256: str) -> bool:
+    """If-None-Match совпадает с содержимым; суффикс кодировки в ETag не учитывается."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = [tag.strip().removeprefix("W/").strip('"') for tag in header.split(",")]
+    return "*" in tags or any(tag.split("-")[0] == sha256 for tag in tags)
+
+
+@app.api_route("/download/{filename}", methods=["GET", "HEAD"])
+async def download_file(filename: str, request: Request, background_tasks: BackgroundTasks):
+    """
+    Отдает файл с поддержкой условного GET (If-None-Match -> 304) и Range-запросов.
+    При Accept-Encoding: zstd/gzip отдается предсжатая копия, если она готова;
+    иначе файл идет без сжатия, а копия строится в фоне для следующих запросов.
+    """
     file_path = os.path.join(UPLOAD_DIR, filename)
     if not os.path.exists(file_path) or not os.path.isfile(file_path):
         raise HTTPException(status_code=404, detail="File not found")
-    return FileResponse(path=file_path, filename=filename, media_type="application/octet-stream")
+    # SHA-256 содержимого: клиенты проверяют по нему целостность и актуальность локальной копии
+    sha256 = await run_io(get_file_hash, UPLOAD_DIR, filename)
+    headers = {"X-Content-SHA256": sha256, "ETag": f'"{sha256}"', "Vary": "Accept-Encoding"}
+    if _etag_matches(request, sha256):
+        return Response(status_code=304, headers=headers)
+
+    encodings = parse_accept_encoding(request.headers.get("accept-encoding"))
+    if encodings and await run_io(supports_compression, UPLOAD_DIR, filename):
+        found = await run_io(find_compressed_copy, UPLOAD_DIR, filename, sha256, encodings)
+        if found:
+            encoding, path = found
+            # У каждого представления свой ETag, иначе If-Range склеил бы байты разных кодировок
+            headers.update({"Content-Encoding": encoding, "ETag": f'"{sha256}-{encoding}"'})
+            return FileResponse(path=path, filename=filename, media_type="application/octet-stream", headers=headers)
+        if request.method == "GET":
+            background_tasks.add_task(run_parse, _build_compressed_copy_safe, filename, sha256, encodings[0])
+
+    return FileResponse(
+        path=file_path,
+        filename=filename,
+        media_type="application/octet-stream",
+        headers=headers,
+    )
+
+
+def _ensure_columnar_copy(filename: str) -> tuple[str, dict, str]:
+    source_sha256 = get_file_hash(UPLOAD_DIR, filename)
+    metadata = read_metadata(UPLOAD_DIR, filename)
+    parquet_path = columnar_path(UPLOAD_DIR, filename)
+    if metadata.get("columnar_source_sha256") != source_sha256 or not os.path.isfile(parquet_path):
+        try:
+            metadata = build_columnar_copy(UPLOAD_DIR, filename, source_sha256)
+        except Exception as e:
+            logger.warning(f"Не удалось построить Parquet-копию '{filename}': {e}")
+            raise HTTPException(status_code=422, detail=f"Could not convert file to Parquet: {e}")
+    return parquet_path, metadata, source_sha256
 
 
-# --- Эндпоинт получения колонок ---
-@app.get("/columns/{filename}", response_model=List[str])
-async def get_file_columns(filename: str):
+@app.api_route("/columnar/{filename}", methods=["GET", "HEAD"])
+async def download_columnar(filename: str, request: Request):
     """
-    Читает CSV-файл (только заголовки)
-    и возвращает список имен колонок
+    Отдает Parquet-копию датасета. Если копии еще нет (файл загружен до появления
+    конвертации) или исходный файл изменился, строит ее синхронно.
     """
     file_path = os.path.join(UPLOAD_DIR, filename)
-    logger.info(f"Запрос колонок для файла: {file_path}")
+    if not os.path.isfile(file_path):
+        raise HTTPException(status_code=404, detail="File not found")
 
-    if not os.path.exists(file_path):
-        logger.error(f"Файл не найден: {file_path}")  # <-- Логирование
+    parquet_path, metadata, source_sha256 = await run_parse(_ensure_columnar_copy, filename)
+    headers = {
+        "X-Content-SHA256": metadata["columnar_sha256"],
+        "X-Source-SHA256": source_sha256,
+        "ETag": f'"{metadata["columnar_sha256"]}"',
+    }
+    # Parquet уже сжат zstd внутри, поэтому здесь только условный GET и Range
+    if _etag_matches(request, metadata["columnar_sha256"]):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(
+        path=parquet_path,
+        filename=f"{filename}.parquet",
+        media_type="application/vnd.apache.parquet",
+        headers=headers,
+    )
+
+
+def _read_requested_rows(filename: str, row_indices: List[int]) -> dict[int, dict]:
+    if supports_row_index(filename):
+        return read_rows(UPLOAD_DIR, filename, row_indices, get_file_hash(UPLOAD_DIR, filename))
+    # Excel не индексируется: файл читается целиком
+    df = read_uploaded_table(os.path.join(UPLOAD_DIR, filename))
+    df = df.astype(object).where(df.notna(), None)
+    return {i: df.iloc[i].to_dict() for i in set(row_indices) if 0 <= i < len(df)}
+
+
+@app.get("/rows/{filename}")
+async def get_rows(filename: str, idx: List[int] = Query(...)):
+    """
+    Возвращает строки датасета по позиционным индексам (?idx=3&idx=17).
+    Для CSV используется разреженный индекс смещений: читается только блок с нужной строкой.
+    """
+    file_path = os.path.join(UPLOAD_DIR, filename)
+    if not os.path.isfile(file_path):
         raise HTTPException(status_code=404, detail="File not found")
+    if len(idx) > MAX_ROWS_PER_REQUEST:
+        raise HTTPException(status_code=400, detail=f"Too many rows requested (max {MAX_ROWS_PER_REQUEST}).")
 
+    try:
+        rows = await run_parse(_read_requested_rows, filename, idx)
+    except Exception as e:
+        logger.error(f"Не удалось прочитать строки '{filename}': {e}")
+        raise HTTPException(status_code=500, detail=f"Could not read rows: {e}")
+
+    return {
+        "filename": filename,
+        "rows": [{"row_index": i, "data": rows[i]} for i in dict.fromkeys(idx) if i in rows],
+    }
+
+
+# --- Эндпоинты каталога датасетов ---
+@app.get("/datasets/{filename}")
+async def get_dataset_info(filename: str):
+    """Запись каталога: размер, хэш, кодировка, разделитель, схема, число строк и статистика по колонкам."""
+    metadata = await run_io(read_metadata, UPLOAD_DIR, filename)
+    if not metadata:
+        raise HTTPException(status_code=404, detail="File not found")
+    return {"filename": filename, **metadata}
+
+
+def _catalog_columns(filename: str) -> List[str] | None:
+    metadata = read_metadata(UPLOAD_DIR, filename)
+    if metadata.get("columns") is not None and is_current(metadata, os.path.join(UPLOAD_DIR, filename)):
+        return metadata["columns"]
+    return None
+
+
+def _parse_file_columns(filename: str) -> List[str]:
+    # Схемы в каталоге еще нет (Parquet-копия строится в фоне): читаем только шапку и сохраняем ее
+    file_path = os.path.join(UPLOAD_DIR, filename)
     try:
         # Читаем первую строку, явно указывая, что это header
         df_cols = read_uploaded_table(file_path, nrows=0, header=0)
-
         column_list = df_cols.columns.tolist()
-
         logger.info(f"Найденные колонки: {column_list}")
 
         # Проверка на странный баг
         if column_list == ["columns"]:
             logger.warning("Pandas вернул ['columns']. Похоже, файл не имеет шапки.")
             df_cols_no_header = read_uploaded_table(file_path, nrows=0, header=None)
-            column_list_no_header = [str(c) for c in df_cols_no_header.columns.tolist()]
-            logger.info(f"Попытка 2 (без шапки): {column_list_no_header}")
-            return column_list_no_header
-
-        return column_list
-
+            column_list = [str(c) for c in df_cols_no_header.columns.tolist()]
+            logger.info(f"Попытка 2 (без шапки): {column_list}")
     except pd.errors.EmptyDataError:
         logger.warning(f"Файл пустой: {file_path}")
-        return []
+        column_list = []
+
+    if not is_current(read_metadata(UPLOAD_DIR, filename), file_path):
+        register_file(UPLOAD_DIR, filename)
+    write_metadata(UPLOAD_DIR, filename, columns=column_list)
+    return column_list
+
+
+# --- Эндпоинт получения колонок ---
+@app.get("/columns/{filename}", response_model=List[str])
+async def get_file_columns(filename: str):
+    """
+    Возвращает список имен колонок из каталога датасетов;
+    если схемы там еще нет, читает только заголовок файла
+    """
+    file_path = os.path.join(UPLOAD_DIR, filename)
+    logger.info(f"Запрос колонок для файла: {file_path}")
+
+    if not os.path.exists(file_path):
+        logger.error(f"Файл не найден: {file_path}")  # <-- Логирование
+        raise HTTPException(status_code=404, detail="File not found")
+
+    try:
+        column_list = await run_io(_catalog_columns, filename)
+        if column_list is None:
+            column_list = await run_parse(_parse_file_columns, filename)
+        return column_list
     except Exception as e:
         logger.error(f"Не удалось прочитать колонки: {e}")
         raise HTTPException(status_code=500, detail=f"Could not read file columns: {e}")
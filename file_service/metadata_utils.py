@@ -0,0 +1,54 @@
+import hashlib
+import os
+
+from catalog_utils import get_dataset, remove_dataset, upsert_dataset
+
+HASH_CHUNK_SIZE = 8 * 1024 * 1024
+
+
+def file_sha256(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def read_metadata(upload_dir: str, filename: str) -> dict:
+    return get_dataset(upload_dir, filename)
+
+
+def write_metadata(upload_dir: str, filename: str, **fields) -> dict:
+    return upsert_dataset(upload_dir, filename, **fields)
+
+
+def remove_metadata(upload_dir: str, filename: str) -> None:
+    remove_dataset(upload_dir, filename)
+
+
+def register_file(upload_dir: str, filename: str, sha256: str | None = None) -> dict:
+    """Регистрирует новый или перезаписанный файл: прежние схема, статистика и хэш сбрасываются."""
+    stat = os.stat(os.path.join(upload_dir, filename))
+    return upsert_dataset(upload_dir, filename, reset=True, size=stat.st_size, mtime_ns=stat.st_mtime_ns, sha256=sha256)
+
+
+def record_file_hash(upload_dir: str, filename: str, sha256: str | None = None) -> str:
+    file_path = os.path.join(upload_dir, filename)
+    stat = os.stat(file_path)
+    sha256 = sha256 or file_sha256(file_path)
+    write_metadata(upload_dir, filename, sha256=sha256, size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+    return sha256
+
+
+def is_current(metadata: dict, file_path: str) -> bool:
+    """Запись каталога относится к текущему содержимому файла (размер и mtime совпадают)."""
+    stat = os.stat(file_path)
+    return metadata.get("size") == stat.st_size and metadata.get("mtime_ns") == stat.st_mtime_ns
+
+
+def get_file_hash(upload_dir: str, filename: str) -> str:
+    """SHA-256 файла; пересчитывается, только если файл изменился с момента записи."""
+    metadata = read_metadata(upload_dir, filename)
+    if metadata.get("sha256") and is_current(metadata, os.path.join(upload_dir, filename)):
+        return metadata["sha256"]
+    return record_file_hash(upload_dir, filename)
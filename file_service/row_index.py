@@ -0,0 +1,181 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from columnar_utils import CSV_ENCODINGS, read_uploaded_table_with_encoding
+from metadata_utils import HASH_CHUNK_SIZE, read_metadata
+
+ROW_INDEX_VERSION = 1
+# Смещение запоминается для каждой ROW_INDEX_STRIDE-й строки: точечное чтение разбирает не больше блока
+ROW_INDEX_STRIDE = 1024
+INDEXED_EXTENSIONS = {".csv"}
+
+_NEWLINE = ord("\n")
+_CARRIAGE_RETURN = ord("\r")
+_QUOTE = ord('"')
+
+
+class RowOffsetIndexer:
+    """
+    Потоково строит разреженный индекс байтовых смещений строк CSV.
+    Перевод строки внутри кавычек не считается концом записи, пустые строки
+    пропускаются так же, как их пропускает pandas.read_csv.
+    Подходит для однобайтовых кодировок и UTF-8: байты '"', '\\r' и '\\n' в них однозначны.
+    """
+
+    def __init__(self, stride: int = ROW_INDEX_STRIDE) -> None:
+        self.stride = stride
+        self.offsets: list[int] = []
+        self._records = 0  # записей с непустым содержимым, включая заголовок
+        self._position = 0
+        self._record_start = 0
+        self._in_quotes = False
+        self._last_byte = -1
+
+    def feed(self, chunk: bytes) -> None:
+        if not chunk:
+            return
+        data = np.frombuffer(chunk, dtype=np.uint8)
+        # Четность числа кавычек до позиции: "" внутри поля меняет ее дважды
+        parity = np.cumsum(data == _QUOTE, dtype=np.uint8) & 1
+        if self._in_quotes:
+            parity ^= 1
+        ends = np.flatnonzero((data == _NEWLINE) & (parity == 0)) + self._position
+
+        if len(ends):
+            starts = np.empty_like(ends)
+            starts[0] = self._record_start
+            starts[1:] = ends[:-1] + 1
+            lengths = ends - starts
+            blank = lengths == 0
+            single = np.flatnonzero(lengths == 1)
+            if len(single):
+                local = starts[single] - self._position
+                first_bytes = np.where(local >= 0, data[np.maximum(local, 0)], self._last_byte)
+                blank[single] = first_bytes == _CARRIAGE_RETURN
+            self._register(starts[~blank])
+            self._record_start = int(ends[-1]) + 1
+
+        self._in_quotes = bool(parity[-1])
+        self._last_byte = int(data[-1])
+        self._position += len(data)
+
+    def _register(self, record_starts: np.ndarray) -> None:
+        # Запись 0 — заголовок, строка данных i — запись i + 1
+        row_numbers = np.arange(self._records, self._records + len(record_starts)) - 1
+        selected = (row_numbers >= 0) & (row_numbers % self.stride == 0)
+        self.offsets.extend(int(offset) for offset in record_starts[selected])
+        self._records += len(record_starts)
+
+    def finish(self) -> dict:
+        trailing = self._position - self._record_start
+        if trailing > 1 or (trailing == 1 and self._last_byte != _CARRIAGE_RETURN):
+            self._register(np.array([self._record_start], dtype=np.int64))
+            self._record_start = self._position
+        return {
+            "version": ROW_INDEX_VERSION,
+            "stride": self.stride,
+            "row_count": max(self._records - 1, 0),
+            "offsets": self.offsets,
+        }
+
+
+def supports_row_index(filename: str) -> bool:
+    return os.path.splitext(filename)[1].lower() in INDEXED_EXTENSIONS
+
+
+def _row_index_path(upload_dir: str, filename: str) -> str:
+    path = os.path.join(upload_dir, ".rowindex")
+    os.makedirs(path, exist_ok=True)
+    return os.path.join(path, f"{filename}.json")
+
+
+def write_row_index(upload_dir: str, filename: str, index: dict, source_sha256: str) -> dict:
+    index = {**index, "source_sha256": source_sha256}
+    index_path = _row_index_path(upload_dir, filename)
+    tmp_path = f"{index_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(index, f)
+    os.replace(tmp_path, index_path)
+    return index
+
+
+def read_row_index(upload_dir: str, filename: str) -> dict:
+    try:
+        with open(_row_index_path(upload_dir, filename), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def remove_row_index(upload_dir: str, filename: str) -> None:
+    try:
+        os.remove(_row_index_path(upload_dir, filename))
+    except FileNotFoundError:
+        pass
+
+
+def build_row_index(upload_dir: str, filename: str, source_sha256: str) -> dict:
+    indexer = RowOffsetIndexer()
+    with open(os.path.join(upload_dir, filename), "rb") as f:
+        for block in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            indexer.feed(block)
+    return write_row_index(upload_dir, filename, indexer.finish(), source_sha256)
+
+
+def _json_record(row: pd.Series) -> dict:
+    return {
+        str(key): None if pd.isna(value) else value.item() if hasattr(value, "item") else value
+        for key, value in row.items()
+    }
+
+
+def _read_block(file_path: str, offset: int, nrows: int, columns: list[str], encodings: list[str]) -> pd.DataFrame:
+    last_error: Exception | None = None
+    for encoding in encodings:
+        try:
+            with open(file_path, "rb") as f:
+                f.seek(offset)
+                return pd.read_csv(f, header=None, names=columns, nrows=nrows, encoding=encoding)
+        except UnicodeDecodeError as exc:
+            last_error = exc
+    raise last_error
+
+
+def read_rows(upload_dir: str, filename: str, row_indices: list[int], source_sha256: str) -> dict[int, dict]:
+    """
+    Строки CSV по позиционным индексам (как df.iloc): переход к ближайшему
+    проиндексированному смещению и разбор только нужного блока. Индексы вне диапазона пропускаются.
+    """
+    file_path = os.path.join(upload_dir, filename)
+    index = read_row_index(upload_dir, filename)
+    if index.get("version") != ROW_INDEX_VERSION or index.get("source_sha256") != source_sha256:
+        index = build_row_index(upload_dir, filename, source_sha256)
+
+    header, detected_encoding = read_uploaded_table_with_encoding(file_path, nrows=0)
+    columns = [str(column) for column in header.columns]
+    encoding = read_metadata(upload_dir, filename).get("encoding") or detected_encoding
+    encodings = list(dict.fromkeys([encoding, *CSV_ENCODINGS, "latin1"]))
+
+    stride = index["stride"]
+    blocks: dict[int, list[int]] = {}
+    for idx in sorted(set(row_indices)):
+        if 0 <= idx < index["row_count"]:
+            blocks.setdefault(idx // stride, []).append(idx)
+
+    rows = {}
+    for block, block_indices in blocks.items():
+        block_start = block * stride
+        df = _read_block(
+            file_path,
+            index["offsets"][block],
+            block_indices[-1] - block_start + 1,
+            columns,
+            encodings,
+        )
+        for idx in block_indices:
+            if idx - block_start < len(df):
+                rows[idx] = _json_record(df.iloc[idx - block_start])
+    return rows
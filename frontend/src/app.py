@@ -4,8 +4,8 @@ import requests
 import os
 import time
 import pandas as pd
-import uuid
-import math
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # --- Конфигурация страницы ---
 st.set_page_config(
@@ -20,6 +20,10 @@ PROFILING_SERVICE_URL = os.getenv("PROFILING_SERVICE_URL", "http://profiling_ser
 GROQ_SERVICE_URL = os.getenv("GROQ_SERVICE_URL", "http://groq_service:8000")
 TRAINING_SERVICE_URL = os.getenv("TRAINING_SERVICE_URL", "http://training_service:8000")
 
+UPLOAD_CHUNK_SIZE = 10 * 1024 * 1024
+UPLOAD_WORKERS = 4
+UPLOAD_ATTEMPTS = 3
+
 
 # --- Вспомогательные функции с кэшированием ---
 
@@ -51,6 +55,68 @@ def get_model_list():
     return []
 
 
+def _send_chunk(session_id: str, index: int, chunk: memoryview):
+    files = {'file': ('chunk', chunk.tobytes())}
+    data = {'sha256': hashlib.sha256(chunk).hexdigest()}
+    response = requests.put(
+        f"{FILE_SERVICE_URL}/upload-sessions/{session_id}/chunks/{index}",
+        files=files, data=data, timeout=60
+    )
+    response.raise_for_status()
+
+
+def upload_file_in_chunks(uploaded_file, progress_bar) -> str:
+    """
+    Загружает файл через сессию file_service: чанки уходят параллельно, каждый с SHA-256.
+    После сбоя сервер сообщает недостающие чанки, и дозагружаются только они.
+    """
+    content = memoryview(uploaded_file.getvalue())
+    session_data = {
+        'filename': uploaded_file.name,
+        'total_size': len(content),
+        'chunk_size': UPLOAD_CHUNK_SIZE,
+        'sha256': hashlib.sha256(content).hexdigest(),
+    }
+    response = requests.post(f"{FILE_SERVICE_URL}/upload-sessions/", data=session_data, timeout=30)
+    response.raise_for_status()
+    session = response.json()
+    if session.get('deduplicated'):
+        # Такой файл уже есть на сервере: передавать содержимое не нужно
+        progress_bar.progress(1.0, text="Файл уже загружен ранее.")
+        return session['filename']
+    session_id, total_chunks = session['session_id'], session['chunk_count']
+
+    missing = list(range(total_chunks))
+    for attempt in range(UPLOAD_ATTEMPTS):
+        errors = []
+        with ThreadPoolExecutor(max_workers=UPLOAD_WORKERS) as executor:
+            futures = [
+                executor.submit(
+                    _send_chunk, session_id, i, content[i * UPLOAD_CHUNK_SIZE:(i + 1) * UPLOAD_CHUNK_SIZE]
+                )
+                for i in missing
+            ]
+            for future in as_completed(futures):
+                if future.exception():
+                    errors.append(future.exception())
+
+        status = requests.get(f"{FILE_SERVICE_URL}/upload-sessions/{session_id}", timeout=30)
+        status.raise_for_status()
+        missing = status.json()['missing']
+        done = total_chunks - len(missing)
+        progress_bar.progress(done / total_chunks, text=f"Загрузка... {done}/{total_chunks} частей")
+        if not missing:
+            break
+        if attempt == UPLOAD_ATTEMPTS - 1:
+            raise errors[0] if errors else RuntimeError(f"Не загружены части: {missing}")
+        time.sleep(2 ** attempt)
+
+    progress_bar.progress(1.0, text="Файл загружен. Проверяем целостность на сервере...")
+    response = requests.post(f"{FILE_SERVICE_URL}/upload-sessions/{session_id}/finalize", timeout=300)
+    response.raise_for_status()
+    return response.json()['filename']
+
+
 # --- Основной интерфейс Дашборда ---
 
 st.title("🌚 Дашборд AI-Аналитика")
@@ -94,32 +160,13 @@ if st.button("Начать загрузку и анализ", key="main_upload_b
     if uploaded_file is not None:
         filename = uploaded_file.name
 
-        CHUNK_SIZE = 10 * 1024 * 1024
-        session_id = str(uuid.uuid4())
-        total_chunks = math.ceil(uploaded_file.size / CHUNK_SIZE)
         progress_bar = st.progress(0, text="Инициализация загрузки...")
 
         analysis_successful = True
 
         try:
-            # Загрузка чанков
-            for i in range(total_chunks):
-                chunk = uploaded_file.read(CHUNK_SIZE)
-                if not chunk: break
-                files = {'file': (filename, chunk)}
-                data = {'session_id': session_id, 'chunk_index': i}
-                service_name = "file_service (upload)"
-                response = requests.post(f"{FILE_SERVICE_URL}/upload/", files=files, data=data, timeout=60)
-                response.raise_for_status()
-                progress_percent = (i + 1) / total_chunks
-                progress_bar.progress(progress_percent, text=f"Загрузка... {i + 1}/{total_chunks} частей")
-
-            # Сборка файла
-            progress_bar.progress(1.0, text="Файл загружен. Собираем на сервере...")
-            assemble_data = {'filename': filename}
-            service_name = "file_service (assemble)"
-            response = requests.post(f"{FILE_SERVICE_URL}/assemble/{session_id}", data=assemble_data, timeout=120)
-            response.raise_for_status()
+            service_name = "file_service (upload)"
+            filename = upload_file_in_chunks(uploaded_file, progress_bar)
 
             st.success(f"✅ Файл '{filename}' успешно загружен!")
             st.info("Запускаем автоматические анализы...")
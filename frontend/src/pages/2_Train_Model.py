@@ -1,6 +1,7 @@
 import streamlit as st
 import requests
 import os
+import time
 
 # --- URL сервисов ---
 FILE_SERVICE_URL = os.getenv("FILE_SERVICE_URL", "http://file_service:8000")
@@ -38,6 +39,56 @@ def get_columns_for_file(filename: str):
              st.error(f"   Ответ: {e.response.text}")
     return []
 
+TRAINING_STAGE_LABELS = {
+    "load": "Загрузка данных",
+    "feature_engineering": "Подготовка признаков",
+    "fit": "Обучение модели",
+    "save": "Сохранение модели",
+}
+
+
+def show_training_job(job_id: str):
+    """Прогресс задачи обучения; пока она не завершилась, страница перезапускается раз в секунду."""
+    try:
+        response = requests.get(f"{TRAINING_SERVICE_URL}/jobs/{job_id}", timeout=10)
+        response.raise_for_status()
+        job = response.json()
+    except requests.exceptions.RequestException as e:
+        st.error(f"❌ Не удалось получить статус обучения от 'training_service': {e}")
+        del st.session_state["training_job_id"]
+        return
+
+    st.header(f"Обучение модели '{job['model_name']}'")
+    if job["status"] == "succeeded":
+        st.success(f"Модель '{job['model_name']}' успешно обучена и сохранена!")
+        for warning in job["result"].get("warnings", []):
+            st.warning(warning)
+        st.json(job["result"])
+        del st.session_state["training_job_id"]
+        return
+    if job["status"] == "cancelled":
+        st.warning("Обучение отменено.")
+        del st.session_state["training_job_id"]
+        return
+    if job["status"] == "failed":
+        st.error(f"❌ Сервис 'training_service' вернул ошибку при обучении: {job['error']['status_code']}")
+        st.error(f"   Сообщение: {job['error']['detail']}")
+        del st.session_state["training_job_id"]
+        return
+
+    if job["status"] == "queued":
+        label = f"В очереди, позиция {job.get('queue_position', 1)}"
+    else:
+        label = TRAINING_STAGE_LABELS.get(job["stage"], "Запуск процесса обучения")
+    st.progress(job["progress"], text=label)
+    if st.button("Отменить обучение"):
+        response = requests.post(f"{TRAINING_SERVICE_URL}/jobs/{job_id}/cancel", timeout=10)
+        if response.status_code == 409:
+            st.warning(response.json().get("detail", response.text))
+    time.sleep(1)
+    st.rerun()
+
+
 # --- Выбор файла ---
 st.header("Шаг 1: Выберите файл для обучения")
 file_list = get_file_list()
@@ -119,10 +170,42 @@ if selected_file:
         # --- OneClassSVM в список ---
         model_type = st.selectbox(
             "Выберите тип модели:",
-            ["IsolationForest", "LocalOutlierFactor", "OneClassSVM"]
+            ["IsolationForest", "LocalOutlierFactor", "OneClassSVM", "SGDOneClassSVM"]
         )
         # ---------------------------------------------------
 
+        with st.expander("Большой датасет: выборка и обучение по частям"):
+            st.caption(
+                "OneClassSVM и LocalOutlierFactor по умолчанию обучаются на ограниченной выборке, "
+                "SGDOneClassSVM — всегда по частям файла."
+            )
+            max_samples = st.number_input(
+                "Размер выборки (0 — по умолчанию)", min_value=0, value=0, step=10000
+            )
+            sampling = st.radio(
+                "Выборка:", ["random", "stratified"], horizontal=True,
+                format_func=lambda value: {"random": "Равномерная", "stratified": "Стратифицированная"}[value],
+            )
+            stratify_column = None
+            if sampling == "stratified":
+                stratify_column = st.selectbox("Колонка, доли значений которой сохраняются:", all_columns)
+            incremental = st.checkbox(
+                "Обучать IsolationForest по частям файла (деревья добавляются на каждую часть)",
+                disabled=model_type != "IsolationForest",
+            )
+
+        with st.expander("Категориальные признаки с большим числом значений"):
+            categorical_encoding = st.radio(
+                "Кодирование:", ["onehot", "frequency", "hashing"], horizontal=True,
+                format_func=lambda value: {
+                    "onehot": "One-hot, редкие — в «прочие»", "frequency": "Частота значения", "hashing": "Хэширование",
+                }[value],
+            )
+            max_categories = st.number_input(
+                "Колонок на признак для one-hot (0 — по умолчанию, 50)", min_value=0, value=0, step=10,
+                disabled=categorical_encoding != "onehot",
+            )
+
         st.markdown("---")
 
         if st.button("Начать обучение детектора аномалий", type="primary"):
@@ -136,40 +219,44 @@ if selected_file:
             elif enable_fe and timestamp_col not in date_features:
                  st.error(f"Ошибка: Если Feature Engineering включен, колонка времени ('{timestamp_col}') должна быть также выбрана в 'Признаках-датах'.")
             else:
-                with st.spinner("Идет обучение модели... Это может занять несколько минут."):
-                    service_name = "training_service"
-                    try:
-                        payload = {
-                            "filename": selected_file,
-                            "model_name": model_name,
-                            "model_type": model_type,
-                            "numerical_features": numerical_features,
-                            "categorical_features": categorical_features,
-                            "date_features": date_features,
-                            "enable_feature_engineering": enable_fe,
-                            "card_id_column": card_id_col,
-                            "timestamp_column": timestamp_col,
-                            "amount_column": amount_col
-                        }
-
-                        response = requests.post(
-                            f"{TRAINING_SERVICE_URL}/train_anomaly_detector/",
-                            json=payload,
-                            timeout=600 # 10 минут
-                        )
-                        response.raise_for_status()
-
-                        st.success(f"Модель '{model_name}' успешно обучена и сохранена!")
-                        st.json(response.json())
-
-                    except requests.exceptions.RequestException as e:
-                        st.error(f"❌ Не удалось связаться с сервисом '{service_name}'. Проверьте Docker.")
-                    except requests.exceptions.HTTPError as e:
-                         st.error(f"❌ Сервис '{service_name}' вернул ошибку при обучении: {e.response.status_code}")
-                         try:
-                             error_detail = e.response.json().get("detail", e.response.text)
-                             st.error(f"   Сообщение: {error_detail}")
-                         except Exception:
-                             st.error(f"   Ответ: {e.response.text}")
-                    except Exception as e:
-                         st.error(f"❌ Непредвиденная ошибка при обучении: {e}")
+                service_name = "training_service"
+                try:
+                    payload = {
+                        "filename": selected_file,
+                        "model_name": model_name,
+                        "model_type": model_type,
+                        "numerical_features": numerical_features,
+                        "categorical_features": categorical_features,
+                        "date_features": date_features,
+                        "enable_feature_engineering": enable_fe,
+                        "card_id_column": card_id_col,
+                        "timestamp_column": timestamp_col,
+                        "amount_column": amount_col,
+                        "max_samples": int(max_samples) or None,
+                        "sampling": sampling,
+                        "stratify_column": stratify_column,
+                        "incremental": incremental and model_type == "IsolationForest",
+                        "categorical_encoding": categorical_encoding,
+                        "max_categories": int(max_categories) or None,
+                    }
+
+                    # Обучение идет задачей в training_service, страница только опрашивает ее статус
+                    response = requests.post(f"{TRAINING_SERVICE_URL}/jobs/train", json=payload, timeout=30)
+                    response.raise_for_status()
+                    st.session_state["training_job_id"] = response.json()["job_id"]
+
+                except requests.exceptions.HTTPError as e:
+                     st.error(f"❌ Сервис '{service_name}' вернул ошибку при обучении: {e.response.status_code}")
+                     try:
+                         error_detail = e.response.json().get("detail", e.response.text)
+                         st.error(f"   Сообщение: {error_detail}")
+                     except Exception:
+                         st.error(f"   Ответ: {e.response.text}")
+                except requests.exceptions.RequestException as e:
+                    st.error(f"❌ Не удалось связаться с сервисом '{service_name}'. Проверьте Docker.")
+                except Exception as e:
+                     st.error(f"❌ Непредвиденная ошибка при обучении: {e}")
+
+# --- Статус задачи обучения ---
+if st.session_state.get("training_job_id"):
+    show_training_job(st.session_state["training_job_id"])
@@ -55,11 +55,11 @@ with tab1:
     st.header("1. Визуализация распределения аномалий (весь файл)")
     st.markdown("""
     Выберите файл и обученную модель (`IsolationForest`).
-    Сервис применит модель ко **всему** файлу и вернет оценки аномальности для каждой строки.
-    Это поможет вам визуально определить порог для выявления аномалий.
+    Сервис применит модель ко **всему** файлу по частям, сохранит оценку каждой строки в файл результата
+    и вернет распределение оценок. Это поможет вам визуально определить порог для выявления аномалий.
     """)
 
-    col1, col2 = st.columns(2)
+    col1, col2, col3 = st.columns([2, 2, 1])
     with col1:
         selected_file_tab1 = st.selectbox(
             "Выберите файл для анализа:",
@@ -76,64 +76,102 @@ with tab1:
             placeholder="Выберите модель...",
             key="tab1_model"
         )
+    with col3:
+        output_format_tab1 = st.selectbox("Формат результата:", options=["csv", "parquet"], key="tab1_format")
 
     if st.button("Рассчитать и визуализировать оценки", key="score_file_button"):
         if selected_file_tab1 and selected_model_tab1:
-            with st.spinner(f"Применяем модель '{selected_model_tab1}' ко всему файлу '{selected_file_tab1}'..."):
-                service_name = "prediction_service (/score_file/)" # Для ошибок
-                try:
-                    payload = {
-                        "model_name": selected_model_tab1,
-                        "filename": selected_file_tab1
-                    }
-                    response = requests.post(f"{PREDICTION_SERVICE_URL}/score_file/", json=payload, timeout=600)
+            service_name = "prediction_service (/score_file_stream/)" # Для ошибок
+            progress_bar = st.progress(0.0, text=f"Применяем модель '{selected_model_tab1}' к файлу '{selected_file_tab1}'...")
+            try:
+                payload = {
+                    "model_name": selected_model_tab1,
+                    "filename": selected_file_tab1,
+                    "output_format": output_format_tab1
+                }
+                # Ответ — NDJSON: прогресс по частям, затем итог со сводкой (полный список оценок не передается)
+                with requests.post(
+                    f"{PREDICTION_SERVICE_URL}/score_file_stream/", json=payload, stream=True, timeout=600
+                ) as response:
                     response.raise_for_status() # Ловим HTTP ошибки
+                    result = None
+                    for line in response.iter_lines():
+                        if not line:
+                            continue
+                        event = json.loads(line)
+                        if "error" in event:
+                            raise RuntimeError(event["error"])
+                        if event.get("done"):
+                            result = event
+                        elif event.get("stage") == "uploading":
+                            progress_bar.progress(1.0, text="Сохраняем файл с оценками...")
+                        elif event.get("rows"):
+                            progress_bar.progress(
+                                event["rows_done"] / event["rows"],
+                                text=f"Обработано {event['rows_done']:,} из {event['rows']:,} строк"
+                            )
 
-                    data = response.json()
-                    scores = data.get("scores")
+                if result and result["summary"].get("count"):
+                    st.session_state['anomaly_summary'] = result
+                    get_file_list.clear()
+                    st.success("Расчет завершен!")
+                else:
+                    st.error("Сервис не вернул оценки.")
 
-                    if scores:
-                        st.session_state['anomaly_scores'] = scores
-                        st.success("Расчет завершен!")
-                    else:
-                        st.error("Сервис вернул пустой список оценок.")
-
-                except requests.exceptions.RequestException as e:
-                    st.error(
-                        f"❌ Не удалось связаться с сервисом '{service_name}'. "
-                        f"Проверьте Docker и обновите страницу."
-                    )
-                except requests.exceptions.HTTPError as e:
-                     st.error(f"❌ Сервис '{service_name}' вернул ошибку: {e.response.status_code}")
-                     try:
-                         error_detail = e.response.json().get("detail", e.response.text)
-                         st.error(f"   Сообщение: {error_detail}")
-                     except Exception:
-                         st.error(f"   Ответ: {e.response.text}")
-                except Exception as e:
-                     st.error(f"❌ Непредвиденная ошибка при расчете оценок: {e}")
+            except requests.exceptions.HTTPError as e:
+                 st.error(f"❌ Сервис '{service_name}' вернул ошибку: {e.response.status_code}")
+                 try:
+                     error_detail = e.response.json().get("detail", e.response.text)
+                     st.error(f"   Сообщение: {error_detail}")
+                 except Exception:
+                     st.error(f"   Ответ: {e.response.text}")
+            except requests.exceptions.RequestException as e:
+                st.error(
+                    f"❌ Не удалось связаться с сервисом '{service_name}'. "
+                    f"Проверьте Docker и обновите страницу."
+                )
+            except Exception as e:
+                 st.error(f"❌ Непредвиденная ошибка при расчете оценок: {e}")
+            finally:
+                progress_bar.empty()
         else:
             st.warning("Пожалуйста, выберите и файл, и модель.")
 
     # --- Отображение результатов для вкладки 1 ---
-    if 'anomaly_scores' in st.session_state:
-        scores = st.session_state['anomaly_scores']
-        df_scores = pd.DataFrame(scores, columns=["score"])
+    if 'anomaly_summary' in st.session_state:
+        result = st.session_state['anomaly_summary']
+        summary = result["summary"]
 
         st.subheader("Результаты анализа")
-        stats_cols = st.columns(4)
-        stats_cols[0].metric("Среднее (Mean)", f"{df_scores['score'].mean():.4f}")
-        stats_cols[1].metric("Медиана (Median)", f"{df_scores['score'].median():.4f}")
-        stats_cols[2].metric("Мин. (Min)", f"{df_scores['score'].min():.4f}")
-        stats_cols[3].metric("Макс. (Max)", f"{df_scores['score'].max():.4f}")
+        stats_cols = st.columns(5)
+        stats_cols[0].metric("Среднее (Mean)", f"{summary['mean']:.4f}")
+        stats_cols[1].metric("Медиана (Median)", f"{summary['quantiles']['p50']:.4f}")
+        stats_cols[2].metric("Мин. (Min)", f"{summary['min']:.4f}")
+        stats_cols[3].metric("Макс. (Max)", f"{summary['max']:.4f}")
+        stats_cols[4].metric("Аномалий (< 0)", f"{summary['anomalies']:,}", f"{summary['anomaly_rate']:.2%}", delta_color="off")
+        st.caption(
+            f"Оценки всех {summary['count']:,} строк сохранены в файл `{result['result_filename']}` "
+            f"(колонки `row_index`, `score`, `is_anomaly_predicted`); он доступен в списке файлов."
+        )
 
         st.markdown("#### Распределение оценок аномальности")
-        fig = px.histogram(
-            df_scores, x="score", nbins=100, title="Распределение оценок аномальности (Anomaly Score)",
-            labels={"score": "Оценка аномальности"}
+        edges = np.array(summary["histogram"]["bin_edges"])
+        df_hist = pd.DataFrame({
+            "score": (edges[:-1] + edges[1:]) / 2,
+            "count": summary["histogram"]["counts"],
+        })
+        fig = px.bar(
+            df_hist, x="score", y="count", title="Распределение оценок аномальности (Anomaly Score)",
+            labels={"score": "Оценка аномальности", "count": "Число строк"}
         )
+        fig.update_traces(width=float(edges[1] - edges[0]) if len(edges) > 1 else None)
+        fig.update_layout(bargap=0)
         fig.add_vline(x=0.0, line_dash="dash", line_color="red", annotation_text="Порог (0.0)")
         st.plotly_chart(fig, use_container_width=True)
+        st.dataframe(
+            pd.DataFrame([summary["quantiles"]], index=["Квантили"]),
+            use_container_width=True
+        )
         st.info("""
         **Как читать этот график:**
         * Модель `IsolationForest` помечает значения **< 0** (слева от красной линии) как **аномалии**.
@@ -171,6 +209,7 @@ with tab2:
                 num_features = config.get('numerical_features', [])
                 cat_features = config.get('categorical_features', [])
                 cat_values = config.get('categorical_values', {})
+                cat_cardinality = config.get('categorical_cardinality', {})
                 gen_date_features = config.get('generated_date_features', []) # Получаем список сгенерированных фичей
 
                 for col in num_features:
@@ -180,7 +219,13 @@ with tab2:
 
                 for col in cat_features:
                     options = cat_values.get(col, [])
-                    if options:
+                    if options and cat_cardinality.get(col, 0) > len(options):
+                        # В конфиге только самые частые значения: остальные можно ввести вручную
+                        input_data[col] = st.selectbox(
+                            f"Выберите или введите '{col}'", options, key=f"cat_{col}", accept_new_options=True,
+                            help=f"Показаны {len(options)} самых частых из {cat_cardinality[col]} значений.",
+                        )
+                    elif options:
                         input_data[col] = st.selectbox(f"Выберите '{col}'", options, key=f"cat_{col}")
                     else:
                          # Если опций нет (редкий случай), даем текстовое поле
@@ -199,7 +244,9 @@ with tab2:
                         try:
                             request_data = {
                                 "model_name": selected_model_tab2,
-                                "features": input_data
+                                "features": input_data,
+                                # Ручная проверка не должна попадать в историю карты как транзакция
+                                "update_feature_state": False,
                             }
                             pred_response = requests.post(f"{PREDICTION_SERVICE_URL}/predict_or_score/", json=request_data)
                             pred_response.raise_for_status() # Ловим HTTP ошибки
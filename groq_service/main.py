@@ -5,15 +5,13 @@ import os
 from groq import Groq, GroqError
 import json
 from typing import List, Dict, Any
-import requests  
+from ml_common.datasets import load_dataset, take_rows
 
 app = FastAPI(title="Groq AI Analyst Service")
 
 # --- КЛЮЧ API И URL СЕРВИСОВ ---
 api_key = os.environ.get("GROQ_API_KEY")
 client = Groq(api_key=api_key) if api_key else None
-# <-- ВАЖНО: Добавили URL для связи с file_service
-FILE_SERVICE_URL = os.getenv("FILE_SERVICE_URL", "http://file_service:8000")
 
 
 # --- Модели данных ---
@@ -73,53 +71,9 @@ class ChatResponse(BaseModel):
 # --- Путь к файлам ---
 UPLOAD_DIR = "/app/uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
-CSV_ENCODINGS = ("utf-8", "utf-8-sig", "cp1251", "windows-1251")
-
-
-def read_dataset(file_path: str, **kwargs) -> pd.DataFrame:
-    extension = os.path.splitext(file_path)[1].lower()
-    if extension in {".xlsx", ".xls"}:
-        return pd.read_excel(file_path, **kwargs)
-
-    last_error: Exception | None = None
-    for encoding in CSV_ENCODINGS:
-        try:
-            return pd.read_csv(file_path, encoding=encoding, **kwargs)
-        except UnicodeDecodeError as exc:
-            last_error = exc
-
-    try:
-        return pd.read_csv(file_path, encoding="latin1", **kwargs)
-    except Exception as exc:
-        raise last_error or exc
 
 
 # --- Вспомогательные функции ---
-def _ensure_uploaded_file(filename: str) -> str:
-    """
-    Проверяет, есть ли файл локально. 
-    Если нет (как при деплое на Render), скачивает его из file_service.
-    """
-    file_path = os.path.join(UPLOAD_DIR, filename)
-    if os.path.exists(file_path):
-        return file_path
-
-    try:
-        response = requests.get(f"{FILE_SERVICE_URL}/download/{filename}", timeout=120, stream=True)
-        if response.status_code == 404:
-            raise HTTPException(status_code=404, detail=f"Файл '{filename}' не найден в file_service.")
-        response.raise_for_status()
-
-        # Сохраняем скачанный файл локально для дальнейшего анализа
-        with open(file_path, "wb") as f:
-            for chunk in response.iter_content(chunk_size=1024 * 1024):
-                if chunk:
-                    f.write(chunk)
-        return file_path
-    except requests.RequestException as e:
-        raise HTTPException(status_code=502, detail=f"Не удалось получить файл '{filename}' из file_service: {e}")
-
-
 def get_chat_context_prompt(dataframe_head: str) -> str:
     return f"""
         Ты продолжаешь диалог с аналитиком данных.
@@ -137,13 +91,11 @@ async def analyze_dataset(request: AnalyzeRequest):
     if not client:
         raise HTTPException(status_code=500, detail="API-ключ Groq не настроен в сервисе.")
 
-    # Используем функцию _ensure_uploaded_file вместо жесткой проверки os.path.exists
-    file_path = _ensure_uploaded_file(request.filename)
+    # Parquet-копия или исходный файл из общего кэша датасетов (скачивается из file_service при необходимости).
+    # Читаем больше строк, чтобы у Groq было больше контекста
+    df = load_dataset(request.filename, nrows=100)
 
     try:
-        # Читаем больше строк, чтобы у Groq было больше контекста
-        df = read_dataset(file_path, nrows=100)
-
         # Попытаемся извлечь час, если есть timestamp
         ts_col = next((col for col in df.columns if 'timestamp' in col.lower()), None)
         hour_col_name = None
@@ -215,14 +167,11 @@ async def analyze_dataset(request: AnalyzeRequest):
         anomalies_list = response_content.get("anomalies", [])
         if anomalies_list:
             try:
-                full_df = read_dataset(file_path)
+                # Только нужные строки из memory-mapped копии, без загрузки всего файла
+                row_indices = [a.get("row_index") for a in anomalies_list if isinstance(a.get("row_index"), int)]
+                rows = take_rows(request.filename, row_indices)
                 for anomaly in anomalies_list:
-                    idx = anomaly.get("row_index")
-                    if idx is not None and 0 <= idx < len(full_df):
-                        anomaly['data'] = {k: v.item() if hasattr(v, 'item') else v for k, v in
-                                           full_df.iloc[idx].to_dict().items()}
-                    else:
-                        anomaly['data'] = {}
+                    anomaly['data'] = rows.get(anomaly.get("row_index"), {})
             except Exception as read_err:
                 print(f"Ошибка при чтении полного файла для аномалий: {read_err}")
                 for anomaly in anomalies_list:
@@ -250,11 +199,9 @@ async def chat_with_analyst(request: ChatRequest):
     if not client: 
         raise HTTPException(status_code=500, detail="API-ключ Groq не настроен.")
     
-    # Также используем функцию _ensure_uploaded_file
-    file_path = _ensure_uploaded_file(request.filename)
+    df_head = load_dataset(request.filename, nrows=20)
     
     try:
-        df_head = read_dataset(file_path, nrows=20)
         df_head_str = df_head.to_string()
         messages_for_api = [
             {"role": "system", "content": get_chat_context_prompt(df_head_str)},
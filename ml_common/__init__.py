@@ -0,0 +1 @@
+"""Общий код ML-сервисов (groq, training, prediction, profiling)."""
@@ -0,0 +1,357 @@
+"""
+Общий кэш датасетов для ML-сервисов (groq, training, prediction, profiling).
+
+Если файл лежит в общем UPLOAD_DIR (docker volume с file_service), используется он.
+Иначе (например, на Render без общего диска) файл скачивается из file_service
+в локальный кэш: запись через временный файл + rename, блокировка на файл,
+проверка SHA-256 и LRU-вытеснение по суммарному размеру. Скачивание идет
+условным GET (ETag) со сжатием zstd/gzip, а оборванная передача докачивается через Range.
+Там же лежат несжатые Arrow IPC копии датасетов, которые открываются через mmap.
+"""
+import contextlib
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from urllib.parse import quote
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import requests
+from fastapi import HTTPException
+
+try:
+    import fcntl
+except ImportError:  # Windows: остаются только блокировки внутри процесса
+    fcntl = None
+
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "/app/uploads")
+FILE_SERVICE_URL = os.getenv("FILE_SERVICE_URL", "http://file_service:8000")
+CACHE_DIR = os.getenv("DATASET_CACHE_DIR", os.path.join(UPLOAD_DIR, ".dataset_cache"))
+CACHE_MAX_BYTES = int(os.getenv("DATASET_CACHE_MAX_BYTES", str(5 * 1024 ** 3)))
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+HASH_SUFFIX = ".sha256"
+# Размер и mtime Parquet-копии, из которой построен Arrow-файл
+SOURCE_SUFFIX = ".source"
+# Недокачанные байты (возможно, сжатые) и ETag их представления для If-Range
+PART_SUFFIX = ".part"
+PART_ETAG_SUFFIX = ".part-etag"
+SIDECAR_SUFFIXES = (HASH_SUFFIX, SOURCE_SUFFIX, PART_SUFFIX, PART_ETAG_SUFFIX)
+ACCEPT_ENCODING = ", ".join(
+    codec for codec in ("zstd", "gzip") if pa.Codec.is_available(codec)
+) or "identity"
+ARROW_BATCH_ROWS = 64 * 1024
+
+logger = logging.getLogger(__name__)
+
+_locks_guard = threading.Lock()
+_file_locks: dict[str, threading.Lock] = {}
+
+
+def _safe_name(filename: str) -> str:
+    name = os.path.basename(filename)
+    if not name or name != filename or name.startswith("."):
+        raise HTTPException(status_code=400, detail=f"Некорректное имя файла: '{filename}'.")
+    return name
+
+
+@contextlib.contextmanager
+def _download_lock(filename: str):
+    with _locks_guard:
+        thread_lock = _file_locks.setdefault(filename, threading.Lock())
+    with thread_lock:
+        if fcntl is None:
+            yield
+            return
+        lock_dir = os.path.join(CACHE_DIR, ".locks")
+        os.makedirs(lock_dir, exist_ok=True)
+        with open(os.path.join(lock_dir, f"{filename}.lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _read_sidecar(cached_path: str, suffix: str = HASH_SUFFIX) -> str | None:
+    try:
+        with open(cached_path + suffix, "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def _write_sidecar(cached_path: str, value: str, suffix: str = HASH_SUFFIX) -> None:
+    tmp_path = f"{cached_path}{suffix}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(value)
+    os.replace(tmp_path, cached_path + suffix)
+
+
+def _remove_cached(cached_path: str) -> None:
+    for path in (cached_path, *(cached_path + suffix for suffix in SIDECAR_SUFFIXES)):
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(path)
+
+
+def _remote_sha256(remote_path: str, filename: str) -> str | None:
+    """SHA-256 файла в file_service; None, если file_service недоступен."""
+    try:
+        response = requests.head(f"{FILE_SERVICE_URL}{remote_path}", timeout=10)
+    except requests.RequestException:
+        return None
+    if response.status_code == 404:
+        raise HTTPException(status_code=404, detail=f"Файл '{filename}' не найден в file_service.")
+    if not response.ok:
+        return None
+    return response.headers.get("X-Content-SHA256")
+
+
+def _request_failed(filename: str, error) -> HTTPException:
+    return HTTPException(status_code=502, detail=f"Не удалось получить файл '{filename}' из file_service: {error}")
+
+
+def _fetch_part(remote_path: str, filename: str, cached_path: str, local_hash: str | None) -> dict | None:
+    """
+    Докачивает представление файла в cached_path + PART_SUFFIX как есть (без распаковки).
+    Возвращает заголовки ответа; None, если локальная копия актуальна (304).
+    """
+    part_path = cached_path + PART_SUFFIX
+    headers = {"Accept-Encoding": ACCEPT_ENCODING}
+    if local_hash:
+        headers["If-None-Match"] = f'"{local_hash}"'
+    part_etag = _read_sidecar(cached_path, PART_ETAG_SUFFIX)
+    offset = os.path.getsize(part_path) if part_etag and os.path.isfile(part_path) else 0
+    if offset:
+        # If-Range: если файл на сервере сменился, придет 200 с полным содержимым
+        headers.update({"Range": f"bytes={offset}-", "If-Range": part_etag})
+
+    response = requests.get(f"{FILE_SERVICE_URL}{remote_path}", headers=headers, timeout=120, stream=True)
+    with response:
+        if response.status_code == 304:
+            return None
+        if response.status_code == 404:
+            raise HTTPException(status_code=404, detail=f"Файл '{filename}' не найден в file_service.")
+        if response.status_code == 206:
+            content_range = response.headers.get("Content-Range", "")
+            if not content_range.startswith(f"bytes {offset}-"):
+                raise requests.RequestException(f"unexpected Content-Range '{content_range}'")
+        elif response.ok:
+            offset = 0
+        else:
+            raise HTTPException(
+                status_code=502,
+                detail=f"Не удалось получить файл '{filename}' из file_service: HTTP {response.status_code}",
+            )
+
+        etag = response.headers.get("ETag")
+        if etag:
+            _write_sidecar(cached_path, etag, PART_ETAG_SUFFIX)
+        with open(part_path, "r+b" if offset else "wb") as f:
+            f.seek(offset)
+            f.truncate()
+            # decode_content=False: сжатые байты пишутся как есть, чтобы их можно было докачать
+            for chunk in response.raw.stream(DOWNLOAD_CHUNK_SIZE, decode_content=False):
+                f.write(chunk)
+        return response.headers
+
+
+def _unpack_part(cached_path: str, encoding: str | None, tmp_path: str) -> str:
+    """Распаковывает скачанное представление в tmp_path и возвращает SHA-256 содержимого."""
+    digest = hashlib.sha256()
+    compression = encoding if encoding in {"zstd", "gzip"} else None
+    with pa.input_stream(cached_path + PART_SUFFIX, compression=compression) as source, open(tmp_path, "wb") as f:
+        while chunk := source.read(DOWNLOAD_CHUNK_SIZE):
+            digest.update(chunk)
+            f.write(chunk)
+    return digest.hexdigest()
+
+
+def _download(remote_path: str, filename: str, cached_path: str, local_hash: str | None = None) -> bool:
+    """
+    Скачивает файл в кэш. False, если локальная копия с хэшем local_hash уже актуальна.
+    При обрыве недокачанная часть остается на диске и следующий вызов продолжит с нее.
+    """
+    try:
+        headers = _fetch_part(remote_path, filename, cached_path, local_hash)
+    except requests.RequestException as e:
+        raise _request_failed(filename, e)
+    if headers is None:
+        return False
+
+    expected_hash = headers.get("X-Content-SHA256")
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(cached_path), prefix=".tmp-")
+    os.close(fd)
+    try:
+        try:
+            actual_hash = _unpack_part(cached_path, headers.get("Content-Encoding"), tmp_path)
+        except (OSError, pa.ArrowException) as e:
+            raise _request_failed(filename, f"поврежденные сжатые данные ({e})")
+        if expected_hash and actual_hash != expected_hash:
+            raise HTTPException(
+                status_code=502,
+                detail=f"Файл '{filename}' поврежден при передаче: контрольная сумма не совпадает.",
+            )
+        os.replace(tmp_path, cached_path)
+    except HTTPException:
+        # Испорченную часть докачивать бессмысленно
+        for suffix in (PART_SUFFIX, PART_ETAG_SUFFIX):
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(cached_path + suffix)
+        raise
+    finally:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(tmp_path)
+
+    for suffix in (PART_SUFFIX, PART_ETAG_SUFFIX):
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(cached_path + suffix)
+    _write_sidecar(cached_path, actual_hash)
+    return True
+
+
+def _evict(keep_path: str) -> None:
+    entries = []
+    for name in os.listdir(CACHE_DIR):
+        path = os.path.join(CACHE_DIR, name)
+        if name.startswith(".") or name.endswith(SIDECAR_SUFFIXES) or not os.path.isfile(path):
+            continue
+        stat = os.stat(path)
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= CACHE_MAX_BYTES:
+            break
+        if path == keep_path:
+            continue
+        _remove_cached(path)
+        total -= size
+
+
+def _ensure_cached(remote_path: str, filename: str, cache_name: str) -> str:
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    cached_path = os.path.join(CACHE_DIR, cache_name)
+    with _download_lock(cache_name):
+        local_hash = _read_sidecar(cached_path) if os.path.isfile(cached_path) else None
+        try:
+            # Условный GET: при неизменном файле file_service ответит 304 без тела
+            downloaded = _download(remote_path, filename, cached_path, local_hash)
+        except HTTPException as e:
+            if not local_hash or e.status_code == 404:
+                raise
+            logger.warning("file_service недоступен, используется кэшированный '%s': %s", filename, e.detail)
+            downloaded = False
+
+        if not downloaded:
+            os.utime(cached_path)  # отмечаем использование для LRU
+            return cached_path
+        _evict(keep_path=cached_path)
+    return cached_path
+
+
+def ensure_uploaded_file(filename: str) -> str:
+    """Возвращает локальный путь к датасету, при необходимости скачивая его из file_service."""
+    filename = _safe_name(filename)
+    shared_path = os.path.join(UPLOAD_DIR, filename)
+    if os.path.isfile(shared_path):
+        return shared_path
+    return _ensure_cached(f"/download/{quote(filename)}", filename, filename)
+
+
+def ensure_columnar_file(filename: str) -> str | None:
+    """
+    Путь к Parquet-копии датасета, которую строит file_service.
+    None, если копии нет и получить ее не удалось: тогда читается исходный CSV/Excel.
+    """
+    filename = _safe_name(filename)
+    remote_path = f"/columnar/{quote(filename)}"
+    shared_source = os.path.join(UPLOAD_DIR, filename)
+    shared_path = os.path.join(UPLOAD_DIR, ".columnar", f"{filename}.parquet")
+
+    def shared_copy_is_fresh() -> bool:
+        # file_service удаляет копию до перезаписи исходника, поэтому копия новее исходника актуальна
+        return os.path.isfile(shared_path) and os.path.getmtime(shared_path) >= os.path.getmtime(shared_source)
+
+    if os.path.isfile(shared_source):
+        if shared_copy_is_fresh():
+            return shared_path
+        # Общий диск с file_service: просим его достроить копию (HEAD строит ее синхронно), не скачивая
+        try:
+            _remote_sha256(remote_path, filename)
+        except HTTPException:
+            return None
+        return shared_path if shared_copy_is_fresh() else None
+
+    try:
+        return _ensure_cached(remote_path, filename, f"{filename}.parquet")
+    except HTTPException:
+        return None
+
+
+def fetch_rows(filename: str, row_indices: list[int]) -> dict[int, dict] | None:
+    """
+    Строки по позиционным индексам через /rows/ file_service: он читает только блок
+    с нужной строкой по индексу смещений. None, если file_service не смог ответить.
+    """
+    filename = _safe_name(filename)
+    try:
+        response = requests.get(
+            f"{FILE_SERVICE_URL}/rows/{quote(filename)}",
+            params={"idx": row_indices},
+            timeout=30,
+        )
+    except requests.RequestException:
+        return None
+    if response.status_code == 404:
+        raise HTTPException(status_code=404, detail=f"Файл '{filename}' не найден в file_service.")
+    if not response.ok:
+        return None
+    return {row["row_index"]: row["data"] for row in response.json()["rows"]}
+
+
+def _convert_to_arrow(parquet_path: str, arrow_path: str) -> None:
+    # По батчам, чтобы конвертация не поднимала весь датасет в память
+    parquet_file = pq.ParquetFile(parquet_path)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(arrow_path), prefix=".tmp-")
+    os.close(fd)
+    try:
+        with pa.OSFile(tmp_path, "wb") as sink, pa.ipc.new_file(sink, parquet_file.schema_arrow) as writer:
+            for batch in parquet_file.iter_batches(batch_size=ARROW_BATCH_ROWS):
+                writer.write_batch(batch)
+        os.replace(tmp_path, arrow_path)
+    finally:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(tmp_path)
+
+
+def ensure_arrow_file(filename: str) -> str | None:
+    """
+    Путь к несжатой Arrow IPC копии датасета в локальном кэше: ее можно открыть через mmap
+    и читать строки и колонки без загрузки всего файла. Строится из Parquet-копии.
+    None, если Parquet-копии нет или конвертация не удалась.
+    """
+    parquet_path = ensure_columnar_file(filename)
+    if not parquet_path:
+        return None
+
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    cache_name = f"{_safe_name(filename)}.arrow"
+    arrow_path = os.path.join(CACHE_DIR, cache_name)
+    with _download_lock(cache_name):
+        stat = os.stat(parquet_path)
+        source_stamp = f"{stat.st_size}:{stat.st_mtime_ns}"
+        if os.path.isfile(arrow_path) and _read_sidecar(arrow_path, SOURCE_SUFFIX) == source_stamp:
+            os.utime(arrow_path)
+            return arrow_path
+
+        _remove_cached(arrow_path)
+        try:
+            _convert_to_arrow(parquet_path, arrow_path)
+        except Exception as e:
+            logger.warning("Не удалось построить Arrow-копию '%s': %s", filename, e)
+            return None
+        _write_sidecar(arrow_path, source_stamp, SOURCE_SUFFIX)
+        _evict(keep_path=arrow_path)
+    return arrow_path
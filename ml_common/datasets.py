@@ -0,0 +1,160 @@
+"""
+Чтение датасетов в ML-сервисах.
+
+Основной путь — Parquet-копия, которую file_service строит один раз при загрузке:
+без повторного парсинга CSV, подбора кодировки и с чтением только нужных колонок.
+Для чтения по строкам и повторного чтения (take_rows, скоринг) она разворачивается
+в несжатый Arrow-файл в локальном кэше, который открывается через mmap: в память
+попадают только выбранные колонки и строки. Остальные чтения берут Parquet напрямую.
+Если копии нет, читается исходный CSV/Excel, как раньше.
+"""
+import logging
+import os
+from collections.abc import Iterable
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from ml_common.dataset_cache import ensure_arrow_file, ensure_columnar_file, ensure_uploaded_file, fetch_rows
+
+logger = logging.getLogger(__name__)
+
+CSV_ENCODINGS = ("utf-8", "utf-8-sig", "cp1251", "windows-1251")
+
+
+def read_raw_dataset(file_path: str, **kwargs) -> pd.DataFrame:
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension in {".xlsx", ".xls"}:
+        return pd.read_excel(file_path, **kwargs)
+    if extension == ".parquet":
+        usecols = kwargs.get("usecols")
+        columns = [name for name in pq.read_schema(file_path).names if usecols(name)] if usecols else None
+        return read_columnar(file_path, columns=columns, nrows=kwargs.get("nrows"))
+
+    last_error: Exception | None = None
+    for encoding in CSV_ENCODINGS:
+        try:
+            return pd.read_csv(file_path, encoding=encoding, **kwargs)
+        except UnicodeDecodeError as exc:
+            last_error = exc
+
+    try:
+        return pd.read_csv(file_path, encoding="latin1", **kwargs)
+    except Exception as exc:
+        raise last_error or exc
+
+
+def _selected_columns(names: list[str], columns: Iterable[str] | None) -> list[str] | None:
+    if columns is None:
+        return None
+    wanted = set(columns)
+    # Отсутствующие колонки пропускаем: понятную ошибку о них выдаст валидация сервиса
+    return [name for name in names if name in wanted]
+
+
+def read_columnar(parquet_path: str, columns: Iterable[str] | None = None, nrows: int | None = None) -> pd.DataFrame:
+    parquet_file = pq.ParquetFile(parquet_path)
+    schema = parquet_file.schema_arrow
+    selected = _selected_columns(schema.names, columns)
+
+    if nrows is None:
+        return parquet_file.read(columns=selected).to_pandas()
+
+    batches = []
+    remaining = max(nrows, 0)
+    if remaining:
+        for batch in parquet_file.iter_batches(batch_size=remaining, columns=selected):
+            batches.append(batch.slice(0, remaining))
+            remaining -= batches[-1].num_rows
+            if remaining <= 0:
+                break
+    table = pa.Table.from_batches(batches) if batches else schema.empty_table().select(selected or schema.names)
+    return table.to_pandas()
+
+
+def open_dataset_table(filename: str) -> pa.Table | None:
+    """
+    Arrow-таблица датасета поверх memory-mapped файла: открытие читает только footer,
+    данные подгружаются страницами ОС при обращении. None, если Arrow-копии нет.
+    """
+    arrow_path = ensure_arrow_file(filename)
+    if not arrow_path:
+        return None
+    try:
+        return pa.ipc.open_file(pa.memory_map(arrow_path, "r")).read_all()
+    except Exception as e:
+        logger.warning("Не удалось открыть Arrow-копию '%s': %s", filename, e)
+        return None
+
+
+def table_to_pandas(table: pa.Table, columns: Iterable[str] | None = None, nrows: int | None = None) -> pd.DataFrame:
+    selected = _selected_columns(table.column_names, columns)
+    if selected is not None:
+        table = table.select(selected)
+    if nrows is not None:
+        table = table.slice(0, max(nrows, 0))
+    return table.to_pandas()
+
+
+def take_rows(filename: str, row_indices: Iterable[int]) -> dict[int, dict]:
+    """
+    Строки датасета по позиционным индексам в виде {индекс: {колонка: значение}}.
+    Индексы вне диапазона пропускаются.
+    """
+    row_indices = list(dict.fromkeys(row_indices))
+    table = open_dataset_table(filename)
+    if table is not None:
+        # slice не копирует данные: материализуются только запрошенные строки
+        return {
+            idx: table.slice(idx, 1).to_pylist()[0]
+            for idx in row_indices
+            if 0 <= idx < table.num_rows
+        }
+
+    if row_indices:
+        rows = fetch_rows(filename, row_indices)
+        if rows is not None:
+            return rows
+
+    df = load_dataset(filename)
+    return {
+        idx: {k: v.item() if hasattr(v, "item") else v for k, v in df.iloc[idx].to_dict().items()}
+        for idx in row_indices
+        if 0 <= idx < len(df)
+    }
+
+
+def load_dataset(
+    filename: str,
+    columns: Iterable[str] | None = None,
+    nrows: int | None = None,
+    memory_map: bool = False,
+) -> pd.DataFrame:
+    """
+    Загружает датасет по имени файла; columns ограничивает набор читаемых колонок.
+    memory_map — читать через Arrow-копию в локальном кэше (для сервисов, которые читают
+    файл повторно); при nrows копия не строится, первые строки читаются из Parquet.
+    """
+    columns = list(dict.fromkeys(columns)) if columns is not None else None
+
+    if memory_map and nrows is None:
+        table = open_dataset_table(filename)
+        if table is not None:
+            return table_to_pandas(table, columns=columns)
+
+    parquet_path = ensure_columnar_file(filename)
+    if parquet_path:
+        try:
+            return read_columnar(parquet_path, columns=columns, nrows=nrows)
+        except Exception as e:
+            logger.warning("Не удалось прочитать Parquet-копию '%s', читаем исходный файл: %s", filename, e)
+
+    file_path = ensure_uploaded_file(filename)
+    kwargs = {}
+    if nrows is not None:
+        kwargs["nrows"] = nrows
+    if columns is not None:
+        wanted = set(columns)
+        kwargs["usecols"] = lambda column: column in wanted
+    return read_raw_dataset(file_path, **kwargs)
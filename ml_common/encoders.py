@@ -0,0 +1,65 @@
+"""
+Кодировщики категориальных признаков для пайплайнов training_service.
+
+Лежат в ml_common, а не в training_service: пайплайн сохраняется через joblib вместе
+с кодировщиком, и prediction_service должен импортировать его класс при загрузке модели.
+Оба кодировщика дают ограниченное число колонок при любой кардинальности:
+FrequencyEncoder — одну колонку на признак (доля значения в обучающих данных),
+HashingEncoder — n_features колонок разреженной матрицы на все признаки.
+"""
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+from sklearn.base import BaseEstimator, TransformerMixin
+from sklearn.feature_extraction import FeatureHasher
+
+
+def _as_frame(X) -> pd.DataFrame:
+    return X if isinstance(X, pd.DataFrame) else pd.DataFrame(X)
+
+
+class FrequencyEncoder(TransformerMixin, BaseEstimator):
+    """Заменяет значение его долей в обучающих данных; незнакомое значение — 0."""
+
+    def fit(self, X, y=None):
+        X = _as_frame(X)
+        self.feature_names_in_ = np.asarray(X.columns, dtype=object)
+        self.n_features_in_ = X.shape[1]
+        self.frequencies_: Dict[str, Dict[str, float]] = {
+            str(column): X[column].astype(str).value_counts(normalize=True).to_dict() for column in X.columns
+        }
+        return self
+
+    def transform(self, X):
+        X = _as_frame(X)
+        return np.column_stack([
+            X[column].astype(str).map(self.frequencies_[str(name)]).fillna(0.0).to_numpy(dtype=np.float64)
+            for column, name in zip(X.columns, self.feature_names_in_)
+        ])
+
+    def get_feature_names_out(self, input_features=None):
+        return np.asarray([f"{name}_frequency" for name in self.feature_names_in_], dtype=object)
+
+
+class HashingEncoder(TransformerMixin, BaseEstimator):
+    """One-hot по хэшу пары «колонка=значение» в n_features колонок; словарь значений не хранится."""
+
+    def __init__(self, n_features: int = 256):
+        self.n_features = n_features
+
+    def fit(self, X, y=None):
+        X = _as_frame(X)
+        self.feature_names_in_ = np.asarray(X.columns, dtype=object)
+        self.n_features_in_ = X.shape[1]
+        return self
+
+    def transform(self, X):
+        X = _as_frame(X)
+        tokens = [f"{name}=" + X[column].astype(str) for column, name in zip(X.columns, self.feature_names_in_)]
+        rows = pd.concat(tokens, axis=1).to_numpy() if tokens else np.empty((len(X), 0), dtype=object)
+        hasher = FeatureHasher(n_features=self.n_features, input_type="string", alternate_sign=False)
+        return hasher.transform(rows)
+
+    def get_feature_names_out(self, input_features=None):
+        return np.asarray([f"hash_{index}" for index in range(self.n_features)], dtype=object)
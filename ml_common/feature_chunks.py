@@ -0,0 +1,104 @@
+"""
+Признаки большого датасета по частям.
+
+Датасет читается частями по chunk_rows строк из Arrow-копии (mmap), поэтому в памяти
+одновременно одна часть с признаками, а не весь файл. Если заданы оконные признаки по карте,
+строки обрабатываются в порядке времени, а состояние карт переносится через границу частей:
+транзакции за последние сутки идут в начало следующей части, а для карт без них время
+последней транзакции хранится отдельно. Признаки получаются такими же, как при обработке
+файла целиком. Используется потоковым скорингом (prediction_service) и обучением
+на выборке или по частям (training_service).
+"""
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from ml_common.datasets import load_dataset, open_dataset_table
+from ml_common.features import DAY_NS, generate_features
+
+
+def open_feature_table(filename: str, columns: Iterable[str] | None) -> pa.Table:
+    """Нужные колонки датасета: Arrow-копия через mmap, если ее нет — загрузка целиком, как раньше."""
+    table = open_dataset_table(filename)
+    if table is None:
+        return pa.Table.from_pandas(load_dataset(filename, columns=columns), preserve_index=False)
+    if columns is None:
+        return table
+    wanted = set(columns)
+    return table.select([name for name in table.column_names if name in wanted])
+
+
+def window_columns(table: pa.Table, feature_engineering_config: Dict[str, Any]) -> Tuple[str, str, str] | None:
+    """Колонки карты, времени и суммы, если оконные признаки заданы и все колонки есть в таблице."""
+    columns = tuple(feature_engineering_config.get(key) for key in ("card_id_column", "timestamp_column", "amount_column"))
+    if all(column and column in table.column_names for column in columns):
+        return columns
+    return None
+
+
+def iter_feature_chunks(
+    table: pa.Table,
+    feature_engineering_config: Dict[str, Any],
+    chunk_rows: int,
+    extract_dates: Callable[[pd.DataFrame], pd.DataFrame],
+) -> Iterator[Tuple[np.ndarray, pd.DataFrame, List[str]]]:
+    """
+    Тройки (позиции строк в файле, строки с признаками в том же порядке, сгенерированные признаки)
+    по частям; для оконных признаков — в порядке времени.
+    """
+    columns = window_columns(table, feature_engineering_config or {})
+    if columns is None:
+        for offset in range(0, table.num_rows, chunk_rows):
+            chunk = extract_dates(table.slice(offset, chunk_rows).to_pandas())
+            yield np.arange(offset, offset + len(chunk)), chunk, []
+        return
+
+    card_col, ts_col, amt_col = columns
+    ts = pd.to_datetime(table.column(ts_col).to_pandas())
+    if ts.isna().any():
+        raise ValueError(f"Колонка '{ts_col}' содержит пустые или нераспознанные даты.")
+    ts_ns = ts.dt.as_unit("ns").astype(np.int64).to_numpy()
+    # Устойчивая сортировка: равные по времени строки идут в порядке файла, как в generate_features
+    order = np.argsort(ts_ns, kind="stable")
+    del ts
+
+    amounts = table.column(amt_col).to_pandas()
+    amount_fill_value = None
+    if pd.api.types.is_numeric_dtype(amounts):
+        values = amounts.to_numpy(dtype=np.float64, na_value=np.nan)
+        amount_fill_value = float(np.nanmean(values)) if np.isfinite(values).any() else 0.0
+    del amounts
+
+    history = None  # строки последних суток после обработки дат; индекс — позиции в файле
+    last_seen = pd.Series(dtype=np.int64)  # карта -> время последней транзакции, нс
+    for offset in range(0, table.num_rows, chunk_rows):
+        positions = order[offset:offset + chunk_rows]
+        chunk = table.take(positions).to_pandas()
+        chunk.index = positions
+        chunk = extract_dates(chunk)
+        frame = chunk if history is None else pd.concat([history, chunk])
+        features, generated = generate_features(frame, feature_engineering_config, amount_fill_value=amount_fill_value)
+        prepared = features.loc[positions]
+
+        cards = chunk[card_col]
+        if 'time_since_last_tx_card' in prepared.columns and len(last_seen):
+            # Первая транзакция карты в части, если за сутки до нее карта не встречалась:
+            # предыдущая транзакция осталась в более ранней части
+            first = cards.notna() & ~cards.duplicated(keep='first')
+            if history is not None:
+                first &= ~cards.isin(history[card_col])
+            previous_ts = cards[first].map(last_seen).dropna()
+            if len(previous_ts):
+                prepared.loc[previous_ts.index, 'time_since_last_tx_card'] = (
+                    ts_ns[previous_ts.index] - previous_ts.to_numpy(dtype=np.int64)
+                ) / 1e9
+
+        yield positions, prepared, generated
+
+        known = cards.notna().to_numpy()
+        chunk_last = pd.Series(ts_ns[positions[known]], index=cards[known].to_numpy()).groupby(level=0).last()
+        last_seen = chunk_last.combine_first(last_seen).astype(np.int64)
+        frame_ts = ts_ns[frame.index.to_numpy()]
+        history = frame[frame_ts >= ts_ns[positions[-1]] - DAY_NS]
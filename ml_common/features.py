@@ -0,0 +1,248 @@
+"""
+Генерация признаков транзакций, общая для training_service и prediction_service.
+
+Оконные признаки по карте (число и сумма за час, среднее за 24 часа, время с прошлой
+транзакции) считаются за один проход по отсортированным массивам numpy, а не тремя
+groupby().rolling(), каждый из которых заново сортирует и переиндексирует данные.
+Окна совпадают с rolling(..., closed='left') из pandas: для строки i в окно входят
+строки той же карты с временем в [t_i - окно, t_i); строки с тем же временем, что у i,
+не входят, даже если стоят раньше.
+Если установлен numba, окна считаются скомпилированным циклом с указателями на границы окон.
+"""
+import logging
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+
+try:
+    import numba
+except ImportError:  # без numba работает векторизованный вариант на numpy
+    numba = None
+
+logger = logging.getLogger(__name__)
+
+HOUR_NS = 3600 * 10 ** 9
+DAY_NS = 24 * HOUR_NS
+NO_PREVIOUS_TX_SECONDS = 86400.0
+NIGHT_START_HOUR = 22
+NIGHT_END_HOUR = 6
+
+
+def _window_bounds(groups: np.ndarray, ts: np.ndarray, windows_ns: tuple[int, ...]) -> tuple:
+    """
+    Границы окон [t - окно, t) той же карты для каждой строки: позиция первой строки с тем же
+    временем (конец окна) и для каждого окна позиция первой строки окна.
+    Строки ищутся searchsorted по ключу «карта, время» в int64; ключи по картам
+    и времени внутри карты неубывают, потому что данные отсортированы.
+    """
+    n = len(ts)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64), [np.zeros(0, dtype=np.int64) for _ in windows_ns]
+    first_in_group = np.ones(n, dtype=bool)
+    first_in_group[1:] = groups[1:] != groups[:-1]
+    group_start = np.maximum.accumulate(np.where(first_in_group, np.arange(n), 0))
+    # Время от первой транзакции карты в наибольшей общей единице (обычно секунды)
+    relative = ts - ts[group_start]
+    unit = int(np.gcd.reduce(np.concatenate((relative, np.asarray(windows_ns, dtype=np.int64)))))
+    relative //= unit
+    span = int(relative.max()) + max(windows_ns) // unit + 1
+    if (int(groups[-1]) + 1) * span < 2 ** 62:
+        keys = groups * span + relative
+        ends = np.searchsorted(keys, keys, side="left")
+        return ends, [np.searchsorted(keys, keys - window_ns // unit, side="left") for window_ns in windows_ns]
+
+    # Иначе время заменяется плотным рангом: рангов не больше числа строк
+    unique_ts, ts_rank = np.unique(ts, return_inverse=True)
+    span = np.int64(len(unique_ts) + 1)
+    keys = groups * span + ts_rank
+    ends = np.searchsorted(keys, keys, side="left")
+    return ends, [
+        np.searchsorted(keys, groups * span + np.searchsorted(unique_ts, ts - window_ns, side="left"), side="left")
+        for window_ns in windows_ns
+    ]
+
+
+def _numpy_window_features(groups: np.ndarray, ts: np.ndarray, amounts: np.ndarray) -> tuple:
+    valid = ~np.isnan(amounts)
+    # Префиксные суммы с нулем в начале: сумма по окну [lo, hi) = prefix[hi] - prefix[lo]
+    count_prefix = np.concatenate(([0], np.cumsum(valid, dtype=np.int64)))
+    sum_prefix = np.concatenate(([0.0], np.cumsum(np.where(valid, amounts, 0.0))))
+
+    hi, (lo_1h, lo_24h) = _window_bounds(groups, ts, (HOUR_NS, DAY_NS))
+    count_1h = count_prefix[hi] - count_prefix[lo_1h]
+    sum_1h = sum_prefix[hi] - sum_prefix[lo_1h]
+    count_24h = count_prefix[hi] - count_prefix[lo_24h]
+    sum_24h = sum_prefix[hi] - sum_prefix[lo_24h]
+    return count_1h, np.where(count_1h > 0, sum_1h, np.nan), count_24h, sum_24h
+
+
+def _loop_window_features(groups: np.ndarray, ts: np.ndarray, amounts: np.ndarray) -> tuple:
+    n = len(ts)
+    count_1h = np.zeros(n, dtype=np.int64)
+    sum_1h = np.full(n, np.nan)
+    count_24h = np.zeros(n, dtype=np.int64)
+    sum_24h = np.zeros(n)
+    lo_1h = lo_24h = hi = 0
+    running_count_1h = running_count_24h = 0
+    running_sum_1h = running_sum_24h = 0.0
+    for i in range(n):
+        if i == 0 or groups[i] != groups[i - 1]:
+            # Новая карта: окна начинаются с текущей строки
+            lo_1h = lo_24h = hi = i
+            running_count_1h = running_count_24h = 0
+            running_sum_1h = running_sum_24h = 0.0
+        # В окна добавляются строки с временем строго меньше текущего
+        while ts[hi] < ts[i]:
+            if not np.isnan(amounts[hi]):
+                running_count_1h += 1
+                running_sum_1h += amounts[hi]
+                running_count_24h += 1
+                running_sum_24h += amounts[hi]
+            hi += 1
+        while ts[lo_1h] < ts[i] - HOUR_NS:
+            if not np.isnan(amounts[lo_1h]):
+                running_count_1h -= 1
+                running_sum_1h -= amounts[lo_1h]
+            lo_1h += 1
+        while ts[lo_24h] < ts[i] - DAY_NS:
+            if not np.isnan(amounts[lo_24h]):
+                running_count_24h -= 1
+                running_sum_24h -= amounts[lo_24h]
+            lo_24h += 1
+        count_1h[i] = running_count_1h
+        if running_count_1h > 0:
+            sum_1h[i] = running_sum_1h
+        count_24h[i] = running_count_24h
+        sum_24h[i] = running_sum_24h
+    return count_1h, sum_1h, count_24h, sum_24h
+
+
+if numba is not None:
+    _loop_window_features = numba.njit(cache=True, nogil=True)(_loop_window_features)
+
+
+def card_window_features(groups: np.ndarray, ts: np.ndarray, amounts: np.ndarray) -> dict[str, np.ndarray]:
+    """
+    Оконные признаки по массивам, отсортированным по (карта, время):
+    groups — неубывающие коды карт, ts — время в наносекундах, amounts — суммы (NaN пропускаются).
+    """
+    groups = np.ascontiguousarray(groups, dtype=np.int64)
+    ts = np.ascontiguousarray(ts, dtype=np.int64)
+    amounts = np.ascontiguousarray(amounts, dtype=np.float64)
+    compute = _loop_window_features if numba is not None else _numpy_window_features
+    count_1h, sum_1h, count_24h, sum_24h = compute(groups, ts, amounts)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        avg_24h = np.where(count_24h > 0, sum_24h / np.maximum(count_24h, 1), np.nan)
+
+    first_in_group = np.ones(len(ts), dtype=bool)
+    first_in_group[1:] = groups[1:] != groups[:-1]
+    since_last = np.empty(len(ts))
+    since_last[1:] = (ts[1:] - ts[:-1]) / 1e9
+    since_last[first_in_group] = NO_PREVIOUS_TX_SECONDS
+
+    return {
+        "card_tx_count_1h": count_1h,
+        "card_tx_amount_sum_1h": np.nan_to_num(sum_1h, nan=0.0),
+        "card_tx_amount_avg_24h": avg_24h,
+        "time_since_last_tx_card": since_last,
+    }
+
+
+def night_flag(hours: pd.Series) -> pd.Series:
+    """1 для транзакций с 22:00 до 06:59, иначе 0 (в том числе для пропусков)."""
+    return ((hours >= NIGHT_START_HOUR) | (hours <= NIGHT_END_HOUR)).astype(int)
+
+
+def hour_column(columns) -> str | None:
+    """Колонка часа, которую date_feature_extractor добавляет для дат (<колонка>_hour)."""
+    return next((column for column in columns if column.endswith('_hour')), None)
+
+
+def parse_timestamp(value) -> pd.Timestamp:
+    """
+    Время одной строки так, как его разобрал бы pd.to_datetime для этой строки отдельно;
+    NaT, если разобрать нельзя. Для пачек строк из разных запросов: общий разбор колонки
+    подбирает формат по первой строке и падает или меняет смысл остальных.
+    """
+    try:
+        return pd.Timestamp(value)
+    except (ValueError, TypeError, OverflowError):
+        return pd.NaT
+
+
+def _card_codes(cards: pd.Series) -> np.ndarray:
+    """Неубывающие коды карт для данных, отсортированных по карте; строки без карты — каждая отдельно."""
+    codes, _ = pd.factorize(cards, use_na_sentinel=True)
+    codes = codes.astype(np.int64)
+    missing = codes < 0
+    if missing.any():
+        # groupby отбрасывает пустые ключи, поэтому у таких строк нет предыдущих транзакций
+        codes[missing] = codes.max(initial=-1) + 1 + np.arange(missing.sum())
+    return codes
+
+
+def generate_features(
+    df: pd.DataFrame, config: Dict[str, Any], amount_fill_value: float | None = None
+) -> (pd.DataFrame, List[str]):
+    """
+    Генерирует новые признаки: время суток, агрегация за час,
+    время с последней транзакции, отклонение от среднего за 24 часа.
+    Строки результата отсортированы по карте и времени.
+    amount_fill_value — среднее для карт без транзакций за 24 часа; по умолчанию среднее по df
+    (при обработке по частям передается среднее по всему файлу).
+    """
+    df_eng = df.copy()
+    generated_eng_features = []
+
+    card_col = config.get("card_id_column")
+    ts_col = config.get("timestamp_column")
+    amt_col = config.get("amount_column")
+
+    required_cols = [col for col in [card_col, ts_col, amt_col] if col]
+    if not all(col in df_eng.columns for col in required_cols):
+        logger.warning("Недостаточно колонок для генерации признаков агрегации.")
+        return df_eng, generated_eng_features
+
+    try:
+        df_eng[ts_col] = pd.to_datetime(df_eng[ts_col])
+        if df_eng[ts_col].isna().any():
+            raise ValueError(f"Column '{ts_col}' contains missing timestamps.")
+        if not pd.api.types.is_numeric_dtype(df_eng[amt_col]):
+            raise TypeError(f"Column '{amt_col}' is not numeric.")
+        df_eng = df_eng.sort_values(by=[card_col, ts_col])
+
+        # --- 1. Признаки времени суток ---
+        hour_col = hour_column(df_eng.columns)
+        if hour_col:
+            df_eng['is_night'] = night_flag(df_eng[hour_col])
+            generated_eng_features.append('is_night')
+
+        # --- 2-4. Оконные признаки по карте за один проход ---
+        amounts = df_eng[amt_col].to_numpy(dtype=np.float64, na_value=np.nan)
+        windows = card_window_features(
+            _card_codes(df_eng[card_col]),
+            df_eng[ts_col].dt.as_unit("ns").astype(np.int64).to_numpy(),
+            amounts,
+        )
+        df_eng['card_tx_count_1h'] = windows['card_tx_count_1h']
+        df_eng['card_tx_amount_sum_1h'] = windows['card_tx_amount_sum_1h']
+        df_eng['time_since_last_tx_card'] = windows['time_since_last_tx_card']
+
+        if amount_fill_value is not None:
+            fill_value_avg = amount_fill_value
+        else:
+            fill_value_avg = np.nanmean(amounts) if np.isfinite(amounts).any() else 0
+        avg_24h = np.where(np.isnan(windows['card_tx_amount_avg_24h']), fill_value_avg, windows['card_tx_amount_avg_24h'])
+        df_eng['amount_deviation_from_card_avg'] = amounts - avg_24h
+        generated_eng_features.extend(
+            ['card_tx_count_1h', 'card_tx_amount_sum_1h', 'time_since_last_tx_card', 'amount_deviation_from_card_avg']
+        )
+        logger.info("Сгенерированы признаки: %s", generated_eng_features)
+
+    except Exception as e:
+        logger.exception("Ошибка во время генерации признаков: %s", e)
+        return df.copy(), []
+
+    return df_eng, generated_eng_features
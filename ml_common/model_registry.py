@@ -0,0 +1,321 @@
+"""
+Реестр моделей в Postgres: неизменяемые версии и указатель на активную версию.
+
+training_service добавляет версию (model_versions) и переключает на нее указатель
+(model_registry); старые версии остаются, поэтому на любую из них можно откатиться.
+Каждое изменение указателя увеличивает общий счетчик model_registry_revision
+и отправляет NOTIFY model_registry с именем модели. prediction_service слушает
+канал (и на всякий случай опрашивает счетчик) и подменяет модели в своем кэше,
+не проверяя БД на каждый запрос.
+"""
+import datetime
+import hashlib
+import json
+import logging
+import select as select_module
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+
+from sqlalchemy import (
+    BigInteger,
+    Column,
+    DateTime,
+    Integer,
+    LargeBinary,
+    String,
+    Text,
+    UniqueConstraint,
+    func,
+    inspect,
+    select,
+    text,
+    update,
+)
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, declarative_base
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_CHANNEL = "model_registry"
+LEGACY_TABLE = "model_artifacts"
+
+Base = declarative_base()
+
+
+class ModelVersion(Base):
+    __tablename__ = "model_versions"
+    __table_args__ = (UniqueConstraint("model_name", "version", name="uq_model_versions_name_version"),)
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    model_name = Column(String, nullable=False, index=True)
+    version = Column(Integer, nullable=False)
+    model_blob = Column(LargeBinary, nullable=False)
+    model_sha256 = Column(String(64), nullable=False)
+    config_json = Column(Text, nullable=False)
+    metrics_json = Column(Text, nullable=True)
+    created_at = Column(DateTime, nullable=False)
+
+
+class RegisteredModel(Base):
+    __tablename__ = "model_registry"
+    model_name = Column(String, primary_key=True)
+    active_version = Column(Integer, nullable=False)
+    updated_at = Column(DateTime, nullable=False)
+
+
+class RegistryRevision(Base):
+    __tablename__ = "model_registry_revision"
+    id = Column(Integer, primary_key=True)
+    revision = Column(BigInteger, nullable=False)
+
+
+def _utcnow() -> datetime.datetime:
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+
+def create_tables(engine) -> None:
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        connection.execute(
+            text("INSERT INTO model_registry_revision (id, revision) VALUES (1, 0) ON CONFLICT (id) DO NOTHING")
+        )
+
+
+def import_legacy_artifacts(engine) -> List[str]:
+    """
+    Переносит модели из прежней таблицы model_artifacts (одна перезаписываемая строка на модель)
+    как версию 1, если в реестре такой модели еще нет. Повторный запуск ничего не делает.
+    """
+    if not inspect(engine).has_table(LEGACY_TABLE):
+        return []
+    imported = []
+    with Session(engine) as session:
+        registered = set(session.scalars(select(RegisteredModel.model_name)))
+        legacy_names = session.execute(text(f"SELECT model_name FROM {LEGACY_TABLE}")).scalars().all()
+        for model_name in legacy_names:
+            if model_name in registered:
+                continue
+            row = session.execute(
+                text(f"SELECT model_blob, config_json FROM {LEGACY_TABLE} WHERE model_name = :name"),
+                {"name": model_name},
+            ).one()
+            try:
+                publish_version(session, model_name, bytes(row.model_blob), row.config_json, metrics=None)
+                session.commit()
+                imported.append(model_name)
+            except IntegrityError:
+                # Другой сервис перенес модель одновременно с нами
+                session.rollback()
+    return imported
+
+
+def publish_version(
+    session: Session,
+    model_name: str,
+    model_bytes: bytes,
+    config_json: str,
+    metrics: Dict[str, Any] | None,
+    activate: bool = True,
+) -> ModelVersion:
+    """Добавляет новую версию модели и, если activate, делает ее активной. Коммит — за вызывающим."""
+    last_version = session.scalar(
+        select(func.max(ModelVersion.version)).where(ModelVersion.model_name == model_name)
+    )
+    model_version = ModelVersion(
+        model_name=model_name,
+        version=(last_version or 0) + 1,
+        model_blob=model_bytes,
+        model_sha256=hashlib.sha256(model_bytes).hexdigest(),
+        config_json=config_json,
+        metrics_json=json.dumps(metrics) if metrics is not None else None,
+        created_at=_utcnow(),
+    )
+    session.add(model_version)
+    session.flush()  # конкурирующая запись той же версии упадет здесь на уникальном ключе
+    if activate:
+        activate_version(session, model_name, model_version.version)
+    return model_version
+
+
+def activate_version(session: Session, model_name: str, version: int) -> None:
+    """Переключает активную версию; KeyError, если такой версии нет. Коммит — за вызывающим."""
+    exists = session.scalar(
+        select(ModelVersion.id).where(ModelVersion.model_name == model_name, ModelVersion.version == version)
+    )
+    if exists is None:
+        raise KeyError(f"{model_name}:{version}")
+    registered = session.get(RegisteredModel, model_name, with_for_update=True)
+    if registered is None:
+        session.add(RegisteredModel(model_name=model_name, active_version=version, updated_at=_utcnow()))
+    else:
+        registered.active_version = version
+        registered.updated_at = _utcnow()
+    session.execute(update(RegistryRevision).where(RegistryRevision.id == 1).values(revision=RegistryRevision.revision + 1))
+    if session.get_bind().dialect.name == "postgresql":
+        # Уведомление уходит слушателям только после коммита транзакции
+        session.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": NOTIFY_CHANNEL, "payload": model_name})
+
+
+def list_models(session: Session) -> List[str]:
+    return list(session.scalars(select(RegisteredModel.model_name).order_by(RegisteredModel.model_name)))
+
+
+def list_versions(session: Session, model_name: str) -> List[Dict[str, Any]]:
+    """Версии модели без самих артефактов, от новых к старым."""
+    active_version = session.scalar(
+        select(RegisteredModel.active_version).where(RegisteredModel.model_name == model_name)
+    )
+    rows = session.execute(
+        select(ModelVersion.version, ModelVersion.model_sha256, ModelVersion.created_at, ModelVersion.metrics_json)
+        .where(ModelVersion.model_name == model_name)
+        .order_by(ModelVersion.version.desc())
+    ).all()
+    return [
+        {
+            "version": row.version,
+            "sha256": row.model_sha256,
+            "created_at": row.created_at.isoformat(),
+            "metrics": json.loads(row.metrics_json) if row.metrics_json else None,
+            "active": row.version == active_version,
+        }
+        for row in rows
+    ]
+
+
+def active_versions(session: Session, model_names: Iterable[str] | None = None) -> Dict[str, Tuple[int, str]]:
+    """Активные версии: имя -> (номер, sha256)."""
+    query = select(RegisteredModel.model_name, ModelVersion.version, ModelVersion.model_sha256).join(
+        ModelVersion,
+        (ModelVersion.model_name == RegisteredModel.model_name)
+        & (ModelVersion.version == RegisteredModel.active_version),
+    )
+    if model_names is not None:
+        query = query.where(RegisteredModel.model_name.in_(list(model_names)))
+    return {row.model_name: (row.version, row.model_sha256) for row in session.execute(query)}
+
+
+def load_active_version(session: Session, model_name: str) -> ModelVersion | None:
+    return session.scalar(
+        select(ModelVersion).join(
+            RegisteredModel,
+            (ModelVersion.model_name == RegisteredModel.model_name)
+            & (ModelVersion.version == RegisteredModel.active_version),
+        ).where(RegisteredModel.model_name == model_name)
+    )
+
+
+def active_config_json(session: Session, model_name: str) -> str | None:
+    """Конфиг активной версии без чтения самой модели."""
+    return session.scalar(
+        select(ModelVersion.config_json).join(
+            RegisteredModel,
+            (ModelVersion.model_name == RegisteredModel.model_name)
+            & (ModelVersion.version == RegisteredModel.active_version),
+        ).where(RegisteredModel.model_name == model_name)
+    )
+
+
+def current_revision(session: Session) -> int:
+    return session.scalar(select(RegistryRevision.revision).where(RegistryRevision.id == 1)) or 0
+
+
+class RegistryWatcher:
+    """
+    Фоновый поток, который держит в памяти активные версии всех моделей.
+    Ждет NOTIFY на отдельном соединении; без уведомлений раз в poll_seconds
+    сверяет счетчик ревизий, поэтому пропущенное уведомление (обрыв соединения,
+    не-Postgres БД) задерживает обновление, но не теряет его.
+    """
+
+    def __init__(
+        self,
+        engine,
+        on_change: Callable[[List[str]], None],
+        poll_seconds: float = 5.0,
+    ) -> None:
+        self._engine = engine
+        self._on_change = on_change
+        self.poll_seconds = poll_seconds
+        self._active: Dict[str, Tuple[int, str]] = {}
+        self._revision: int | None = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self.listening = False
+
+    def active_version(self, model_name: str) -> Tuple[int, str] | None:
+        with self._lock:
+            known = self._active.get(model_name)
+        if known is None and self._revision is not None:
+            # Модель могла появиться после последней проверки — спрашиваем БД только про нее
+            with Session(self._engine) as session:
+                known = active_versions(session, [model_name]).get(model_name)
+            if known is not None:
+                with self._lock:
+                    self._active.setdefault(model_name, known)
+        return known
+
+    def refresh(self) -> List[str]:
+        """Перечитывает активные версии, если счетчик изменился; возвращает изменившиеся модели."""
+        with Session(self._engine) as session:
+            revision = current_revision(session)
+            if revision == self._revision:
+                return []
+            active = active_versions(session)
+        with self._lock:
+            changed = [
+                name for name in set(self._active) | set(active)
+                if self._active.get(name) != active.get(name)
+            ]
+            self._active = active
+            first_load = self._revision is None
+            self._revision = revision
+        if changed and not first_load:
+            logger.info("Изменились активные версии моделей: %s", changed)
+            self._on_change(changed)
+        return changed
+
+    def start(self) -> None:
+        self.refresh()
+        self._thread = threading.Thread(target=self._run, name="model-registry-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.poll_seconds + 1)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            pooled = None
+            try:
+                pooled = self._listen()
+                while not self._stop.is_set():
+                    if pooled is not None:
+                        connection = pooled.driver_connection
+                        readable, _, _ = select_module.select([connection], [], [], self.poll_seconds)
+                        if readable:
+                            connection.poll()
+                            connection.notifies.clear()  # имена не нужны: refresh сам найдет изменения
+                    else:
+                        self._stop.wait(self.poll_seconds)
+                    self.refresh()
+            except Exception as e:
+                logger.warning("Ошибка наблюдения за реестром моделей: %s", e)
+                self._stop.wait(self.poll_seconds)
+            finally:
+                self.listening = False
+                if pooled is not None:
+                    # Соединение с LISTEN и autocommit не должно вернуться в пул
+                    pooled.invalidate()
+
+    def _listen(self):
+        """Соединение из пула, переведенное в autocommit с LISTEN; None, если БД не Postgres."""
+        if self._engine.dialect.name != "postgresql":
+            return None
+        pooled = self._engine.raw_connection()
+        connection = pooled.driver_connection
+        connection.autocommit = True
+        with connection.cursor() as cursor:
+            cursor.execute(f"LISTEN {NOTIFY_CHANNEL}")
+        self.listening = True
+        return pooled
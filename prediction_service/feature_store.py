@@ -0,0 +1,323 @@
+"""
+Онлайн-хранилище оконных признаков по картам для скоринга по одной транзакции.
+
+generate_features считает окна по всей истории датасета. В /predict_or_score/ приходит
+одна строка, поэтому история карты хранится в памяти: транзакции за последний час и
+за 24 часа в двух очередях с текущими суммой и числом. Каждая транзакция сдвигает окна
+за амортизированное O(1) и получает те же признаки, что и при обучении: в окно входят
+транзакции карты со временем в [t - окно, t), транзакции с тем же временем не входят.
+Каждая записанная транзакция учитывается в окнах, как строка датасета при обучении:
+две транзакции с одинаковыми картой, временем и суммой — это две транзакции.
+
+Только транзакции с update=True меняют историю; оценка с update=False (ручная проверка,
+повтор запроса, оценка той же транзакции другой моделью) считает признаки, не трогая окна.
+Поэтому каждую транзакцию потока с update=True должен отправлять один писатель и один раз.
+Карты без транзакций за сутки удаляются при expire().
+
+Время берется из колонки времени транзакции, а не из часов сервера. Транзакции,
+пришедшие с опозданием (раньше последней по карте), учитываются, но видят только
+ту часть окна, которая еще хранится.
+"""
+import bisect
+import gzip
+import json
+import logging
+import math
+import threading
+from collections import deque
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+
+from ml_common.features import (
+    DAY_NS,
+    HOUR_NS,
+    NO_PREVIOUS_TX_SECONDS,
+    generate_features,
+    hour_column,
+    night_flag,
+    parse_timestamp,
+)
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 1
+
+
+class _Window:
+    """Транзакции карты за окно window_ns и их сумма/число (пропуски в сумме не учитываются)."""
+
+    __slots__ = ("window_ns", "events", "total", "count")
+
+    def __init__(self, window_ns: int) -> None:
+        self.window_ns = window_ns
+        self.events: deque[tuple[int, float]] = deque()
+        self.total = 0.0
+        self.count = 0
+
+    def evict(self, ts: int) -> None:
+        events = self.events
+        while events and events[0][0] < ts - self.window_ns:
+            _, amount = events.popleft()
+            if not math.isnan(amount):
+                self.total -= amount
+                self.count -= 1
+        if not events:
+            # Пустое окно сбрасывает накопленную ошибку округления
+            self.total, self.count = 0.0, 0
+
+    def stats(self, ts: int) -> tuple[int, float]:
+        """Число и сумма транзакций в [ts - окно, ts); окно не меняется."""
+        events = self.events
+        if not events or (events[0][0] >= ts - self.window_ns and events[-1][0] < ts):
+            return self.count, self.total
+        # Опоздавшая транзакция, транзакции с тем же временем или не вытесненные старые
+        count, total = 0, 0.0
+        for event_ts, amount in events:
+            if event_ts >= ts:
+                break
+            if event_ts >= ts - self.window_ns and not math.isnan(amount):
+                count += 1
+                total += amount
+        return count, total
+
+    def add(self, ts: int, amount: float) -> None:
+        if self.events and self.events[-1][0] > ts:
+            self.events.insert(bisect.bisect_right(self.events, (ts, math.inf)), (ts, amount))
+        else:
+            self.events.append((ts, amount))
+        if not math.isnan(amount):
+            self.total += amount
+            self.count += 1
+
+
+class _CardState:
+    __slots__ = ("hour", "day", "timestamps")
+
+    def __init__(self) -> None:
+        self.hour = _Window(HOUR_NS)
+        self.day = _Window(DAY_NS)
+        # Времена транзакций за сутки и последняя до них — для time_since_last_tx_card
+        self.timestamps: deque[int] = deque()
+
+    def previous_ts(self, ts: int) -> int | None:
+        """Время последней транзакции не позже ts."""
+        position = bisect.bisect_right(self.timestamps, ts)
+        return self.timestamps[position - 1] if position else None
+
+
+class OnlineFeatureStore:
+    """Состояние окон по картам, разделенное по потокам (набору колонок карта/время/сумма)."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._streams: dict[str, dict[str, _CardState]] = {}
+        # Сумма и число всех сумм потока: запасное среднее, если в конфиге модели его нет
+        self._totals: dict[str, list[float]] = {}
+        self.dirty = False
+
+    def observe(self, stream: str, card: str, ts: int, amount: float, update: bool = True) -> dict[str, Any]:
+        """Признаки транзакции по предыдущим транзакциям карты; при update=True она добавляется в историю."""
+        with self._lock:
+            cards = self._streams.setdefault(stream, {})
+            state = cards.get(card)
+            if state is None:
+                state = _CardState()
+                if update:
+                    cards[card] = state
+
+            if update:
+                state.hour.evict(ts)
+                state.day.evict(ts)
+            count_1h, sum_1h = state.hour.stats(ts)
+            count_24h, sum_24h = state.day.stats(ts)
+            previous = state.previous_ts(ts)
+            totals = self._totals.setdefault(stream, [0.0, 0])
+            features = {
+                "card_tx_count_1h": count_1h,
+                "card_tx_amount_sum_1h": sum_1h if count_1h else 0.0,
+                "card_tx_amount_avg_24h": sum_24h / count_24h if count_24h else None,
+                "time_since_last_tx_card": (ts - previous) / 1e9 if previous is not None else NO_PREVIOUS_TX_SECONDS,
+                "stream_amount_mean": totals[0] / totals[1] if totals[1] else None,
+            }
+
+            if update:
+                state.hour.add(ts, amount)
+                state.day.add(ts, amount)
+                self._remember_ts(state, ts)
+                if not math.isnan(amount):
+                    totals[0] += amount
+                    totals[1] += 1
+                self.dirty = True
+            return features
+
+    @staticmethod
+    def _remember_ts(state: _CardState, ts: int) -> None:
+        timestamps = state.timestamps
+        if timestamps and timestamps[-1] > ts:
+            timestamps.insert(bisect.bisect_right(timestamps, ts), ts)
+        else:
+            timestamps.append(ts)
+        # Храним сутки плюс одну более раннюю отметку, чтобы знать время прошлой транзакции
+        while len(timestamps) > 1 and timestamps[1] < timestamps[-1] - DAY_NS:
+            timestamps.popleft()
+
+    def expire(self) -> int:
+        """
+        Удаляет карты, по которым не было транзакций больше суток относительно самой поздней
+        транзакции потока: их окна пусты. Вернувшаяся карта считается новой.
+        """
+        removed = 0
+        with self._lock:
+            for cards in self._streams.values():
+                latest = max((state.timestamps[-1] for state in cards.values() if state.timestamps), default=None)
+                if latest is None:
+                    continue
+                stale = [
+                    card for card, state in cards.items()
+                    if not state.timestamps or state.timestamps[-1] < latest - DAY_NS
+                ]
+                for card in stale:
+                    del cards[card]
+                removed += len(stale)
+            if removed:
+                self.dirty = True
+        return removed
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "streams": {
+                    stream: {
+                        "cards": len(cards),
+                        "events_24h": sum(len(state.day.events) for state in cards.values()),
+                    }
+                    for stream, cards in self._streams.items()
+                }
+            }
+
+    def snapshot(self) -> bytes:
+        """Сжатый JSON со всеми окнами; сбрасывает флаг изменений."""
+        with self._lock:
+            payload = {
+                "version": SNAPSHOT_VERSION,
+                "totals": self._totals,
+                "streams": {
+                    stream: {
+                        card: {
+                            "day": [[ts, None if math.isnan(amount) else amount] for ts, amount in state.day.events],
+                            "timestamps": list(state.timestamps),
+                        }
+                        for card, state in cards.items()
+                    }
+                    for stream, cards in self._streams.items()
+                },
+            }
+            self.dirty = False
+        return gzip.compress(json.dumps(payload, separators=(",", ":")).encode("utf-8"))
+
+    def restore(self, data: bytes) -> None:
+        payload = json.loads(gzip.decompress(data))
+        if payload.get("version") != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported feature store snapshot version: {payload.get('version')}")
+        streams = {}
+        for stream, cards in payload["streams"].items():
+            streams[stream] = {}
+            for card, saved in cards.items():
+                state = _CardState()
+                for ts, amount in saved["day"]:
+                    amount = math.nan if amount is None else amount
+                    state.day.add(ts, amount)
+                    state.hour.add(ts, amount)
+                state.timestamps.extend(saved["timestamps"])
+                if state.day.events:
+                    # Часовое окно восстанавливается из суточного относительно последней транзакции
+                    state.hour.evict(state.day.events[-1][0])
+                streams[stream][card] = state
+        with self._lock:
+            self._streams = streams
+            self._totals = {stream: list(totals) for stream, totals in payload.get("totals", {}).items()}
+            self.dirty = False
+
+
+def stream_key(feature_engineering_config: Dict[str, Any]) -> str:
+    return "|".join(
+        str(feature_engineering_config.get(key))
+        for key in ("card_id_column", "timestamp_column", "amount_column")
+    )
+
+
+WINDOW_FEATURES = (
+    'card_tx_count_1h',
+    'card_tx_amount_sum_1h',
+    'time_since_last_tx_card',
+    'amount_deviation_from_card_avg',
+)
+
+
+def online_features(
+    store: OnlineFeatureStore,
+    df: pd.DataFrame,
+    config: Dict[str, Any],
+    update: bool = True,
+) -> tuple[pd.DataFrame, List[str]]:
+    """
+    Те же признаки, что и generate_features, но по истории карт из store.
+    Строки обрабатываются по порядку, время разбирается по каждой строке отдельно.
+    Строки без карты или с неразобранным временем считаются generate_features каждая
+    отдельно, как раньше, и не влияют на признаки остальных строк.
+    Store меняется последним шагом: если функция упала, история карт не тронута.
+    """
+    fe_config = config.get("feature_engineering_config") or {}
+    card_col = fe_config.get("card_id_column")
+    ts_col = fe_config.get("timestamp_column")
+    amt_col = fe_config.get("amount_column")
+    if not all(column in df.columns for column in (card_col, ts_col, amt_col)):
+        logger.warning("Для онлайн-признаков нужны колонки карты, времени и суммы транзакции.")
+        return generate_features(df, fe_config)
+
+    timestamps = [parse_timestamp(value) for value in df[ts_col]]
+    has_card = df[card_col].notna().to_numpy()
+    online = [bool(card) and ts is not pd.NaT for card, ts in zip(has_card, timestamps)]
+
+    # Признаки каждой строки: имя признака -> значение
+    row_features: List[Dict[str, Any]] = [{} for _ in range(len(df))]
+    fallback = [position for position, is_online in enumerate(online) if not is_online]
+    if fallback:
+        logger.warning("Строк без карты или времени транзакции: %d, признаки считаются по самим строкам.", len(fallback))
+    for position in fallback:
+        row_df, generated = generate_features(df.iloc[[position]], fe_config)
+        row_features[position] = {column: row_df[column].iloc[0] for column in generated}
+
+    df_eng = df.copy()
+    hour_col = hour_column(df_eng.columns)
+    night = night_flag(df_eng[hour_col]).tolist() if hour_col else None
+
+    stream = stream_key(fe_config)
+    amount_mean = (config.get("feature_engineering_stats") or {}).get("amount_mean")
+    amounts = pd.to_numeric(df_eng[amt_col], errors="coerce").astype(float).tolist()
+    cards = df_eng[card_col].astype(str).tolist()
+    for position, is_online in enumerate(online):
+        if not is_online:
+            continue
+        amount = amounts[position]
+        features = store.observe(stream, cards[position], timestamps[position].value, amount, update=update)
+        avg_24h = features["card_tx_amount_avg_24h"]
+        if avg_24h is None:
+            # Как в generate_features: без истории за сутки сравниваем со средним по обучающим данным
+            avg_24h = next(
+                (value for value in (amount_mean, features["stream_amount_mean"], amount) if value is not None),
+                0.0,
+            )
+        features["amount_deviation_from_card_avg"] = amount - avg_24h
+        if night is not None:
+            features["is_night"] = night[position]
+        row_features[position] = features
+
+    generated_eng_features = []
+    for column in ('is_night', *WINDOW_FEATURES):
+        if any(column in features for features in row_features):
+            df_eng[column] = [features.get(column, np.nan) for features in row_features]
+            generated_eng_features.append(column)
+    return df_eng, generated_eng_features
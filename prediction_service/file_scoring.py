@@ -0,0 +1,115 @@
+"""
+Потоковый скоринг файла по частям (/score_file_stream/).
+
+Датасет читается частями по chunk_rows строк (ml_common/feature_chunks.py), поэтому в памяти
+одновременно одна часть с признаками и массив оценок, а не весь файл. Оконные признаки
+по карте получаются такими же, как при обработке файла целиком.
+
+Оценки пишутся в CSV или Parquet в исходном порядке строк и загружаются в file_service
+через сессию загрузки; клиенту возвращается только сводка: квантили и гистограмма.
+"""
+import hashlib
+import os
+from typing import Any, Callable, Dict, Iterator, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+import requests
+
+from ml_common.dataset_cache import FILE_SERVICE_URL
+from ml_common.feature_chunks import iter_feature_chunks
+from parallel_scoring import decision_function
+
+RESULT_FORMATS = ("csv", "parquet")
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+HISTOGRAM_BINS = 100
+QUANTILES = (0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99)
+
+
+def score_chunks(
+    model,
+    config: Dict[str, Any],
+    table: pa.Table,
+    chunk_rows: int,
+    extract_dates: Callable[[pd.DataFrame], pd.DataFrame],
+    n_jobs: int | None = 1,
+) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """Пары (позиции строк в файле, оценки) по частям; для оконных признаков — в порядке времени."""
+    feature_engineering_config = config.get('feature_engineering_config') or {}
+    for positions, prepared, _ in iter_feature_chunks(table, feature_engineering_config, chunk_rows, extract_dates):
+        yield positions, decision_function(model, prepared, n_jobs)
+
+
+def summarize_scores(scores: np.ndarray) -> Dict[str, Any]:
+    """Сводка для графика и метрик вместо полного списка оценок."""
+    if not len(scores):
+        return {"count": 0}
+    counts, edges = np.histogram(scores, bins=HISTOGRAM_BINS)
+    anomalies = int((scores < 0).sum())
+    return {
+        "count": int(len(scores)),
+        "mean": float(scores.mean()),
+        "std": float(scores.std()),
+        "min": float(scores.min()),
+        "max": float(scores.max()),
+        "anomalies": anomalies,
+        "anomaly_rate": anomalies / len(scores),
+        "quantiles": {f"p{round(q * 100):02d}": float(v) for q, v in zip(QUANTILES, np.quantile(scores, QUANTILES))},
+        "histogram": {"bin_edges": edges.tolist(), "counts": counts.tolist()},
+    }
+
+
+def write_scores(scores: np.ndarray, path: str, output_format: str, chunk_rows: int) -> None:
+    """Файл результата: номер строки исходного файла, оценка и признак аномалии — по частям."""
+    schema = pa.schema([("row_index", pa.int64()), ("score", pa.float64()), ("is_anomaly_predicted", pa.bool_())])
+    if output_format == "parquet":
+        writer = pq.ParquetWriter(path, schema, compression="zstd")
+    else:
+        writer = pa_csv.CSVWriter(path, schema)
+    with writer:
+        for offset in range(0, len(scores), chunk_rows):
+            values = scores[offset:offset + chunk_rows]
+            writer.write_table(pa.table({
+                "row_index": np.arange(offset, offset + len(values), dtype=np.int64),
+                "score": values,
+                "is_anomaly_predicted": values < 0,
+            }, schema=schema))
+
+
+def upload_result(path: str, filename: str) -> str:
+    """Загружает файл в file_service через сессию по чанкам; возвращает имя файла на сервере."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(UPLOAD_CHUNK_SIZE), b""):
+            digest.update(block)
+    response = requests.post(
+        f"{FILE_SERVICE_URL}/upload-sessions/",
+        data={
+            "filename": filename,
+            "total_size": os.path.getsize(path),
+            "chunk_size": UPLOAD_CHUNK_SIZE,
+            "sha256": digest.hexdigest(),
+        },
+        timeout=30,
+    )
+    response.raise_for_status()
+    session = response.json()
+    if session.get("deduplicated"):
+        return session["filename"]
+
+    session_id = session["session_id"]
+    with open(path, "rb") as f:
+        for index, block in enumerate(iter(lambda: f.read(UPLOAD_CHUNK_SIZE), b"")):
+            response = requests.put(
+                f"{FILE_SERVICE_URL}/upload-sessions/{session_id}/chunks/{index}",
+                files={"file": ("chunk", block)},
+                data={"sha256": hashlib.sha256(block).hexdigest()},
+                timeout=60,
+            )
+            response.raise_for_status()
+    response = requests.post(f"{FILE_SERVICE_URL}/upload-sessions/{session_id}/finalize", timeout=300)
+    response.raise_for_status()
+    return response.json()["filename"]
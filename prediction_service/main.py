@@ -3,39 +3,36 @@ import joblib
 import json
 import os
 import io
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel, conlist
+import asyncio
+import contextlib
+import datetime
+import tempfile
+import threading
+import numpy as np
+import pyarrow as pa
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel, ValidationError, conlist
 from typing import Dict, Any, List
-from sqlalchemy import create_engine, Column, String, LargeBinary, Text
+from sqlalchemy import create_engine, Column, String, LargeBinary, DateTime
 from sqlalchemy.orm import declarative_base, sessionmaker
-import requests
+from ml_common.datasets import load_dataset
+from ml_common.feature_chunks import open_feature_table
+from ml_common.features import generate_features, parse_timestamp
+from ml_common import model_registry
+from feature_store import OnlineFeatureStore, online_features
+from model_cache import LoadedModel, ModelCache
+from micro_batcher import MicroBatcher
+from parallel_scoring import decision_function
+from file_scoring import RESULT_FORMATS, score_chunks, summarize_scores, upload_result, write_scores
 
 app = FastAPI(title="Prediction Service")
 
 # --- Директории ---
-MODELS_DIR = "/app/models"
+MODELS_DIR = os.getenv("MODELS_DIR", "/app/models")
 UPLOAD_DIR = "/app/uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
-FILE_SERVICE_URL = os.getenv("FILE_SERVICE_URL", "http://file_service:8000")
-CSV_ENCODINGS = ("utf-8", "utf-8-sig", "cp1251", "windows-1251")
-
-
-def read_dataset(file_path: str, **kwargs) -> pd.DataFrame:
-    extension = os.path.splitext(file_path)[1].lower()
-    if extension in {".xlsx", ".xls"}:
-        return pd.read_excel(file_path, **kwargs)
-
-    last_error: Exception | None = None
-    for encoding in CSV_ENCODINGS:
-        try:
-            return pd.read_csv(file_path, encoding=encoding, **kwargs)
-        except UnicodeDecodeError as exc:
-            last_error = exc
-
-    try:
-        return pd.read_csv(file_path, encoding="latin1", **kwargs)
-    except Exception as exc:
-        raise last_error or exc
 
 # --- Хранилище моделей ---
 # Render services do not share a local filesystem.
@@ -46,37 +43,151 @@ USE_DB_STORAGE = bool(DATABASE_URL)
 Base = declarative_base()
 
 
-class ModelArtifact(Base):
-    __tablename__ = "model_artifacts"
-    model_name = Column(String, primary_key=True, index=True)
-    model_blob = Column(LargeBinary, nullable=False)
-    config_json = Column(Text, nullable=False)
+class FeatureStoreSnapshot(Base):
+    __tablename__ = "feature_store_snapshots"
+    name = Column(String, primary_key=True)
+    payload = Column(LargeBinary, nullable=False)
+    updated_at = Column(DateTime, nullable=False)
 
 
 engine = create_engine(DATABASE_URL, pool_pre_ping=True) if USE_DB_STORAGE else None
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine) if USE_DB_STORAGE else None
 
+# --- Онлайн-признаки по картам ---
+# История карт для /predict_or_score/ живет в памяти и периодически сохраняется:
+# в Postgres, если он подключен, иначе в файл рядом с моделями. 0 отключает периодическое сохранение.
+FEATURE_STORE_SNAPSHOT_NAME = "default"
+FEATURE_STORE_SNAPSHOT_PATH = os.getenv(
+    "FEATURE_STORE_SNAPSHOT_PATH", os.path.join(MODELS_DIR, "feature_store.json.gz")
+)
+FEATURE_STORE_SNAPSHOT_SECONDS = int(os.getenv("FEATURE_STORE_SNAPSHOT_SECONDS", "60"))
+
+feature_store = OnlineFeatureStore()
+_snapshot_task: asyncio.Task | None = None
+
+
+def load_feature_store_snapshot() -> bool:
+    if USE_DB_STORAGE:
+        db = SessionLocal()
+        try:
+            snapshot = db.get(FeatureStoreSnapshot, FEATURE_STORE_SNAPSHOT_NAME)
+            data = snapshot.payload if snapshot is not None else None
+        finally:
+            db.close()
+    else:
+        if not os.path.exists(FEATURE_STORE_SNAPSHOT_PATH):
+            return False
+        with open(FEATURE_STORE_SNAPSHOT_PATH, "rb") as f:
+            data = f.read()
+    if data is None:
+        return False
+    feature_store.restore(data)
+    return True
+
+
+def save_feature_store_snapshot() -> int:
+    """Сохраняет состояние и отбрасывает карты без транзакций за сутки; возвращает размер снимка."""
+    feature_store.expire()
+    data = feature_store.snapshot()
+    if USE_DB_STORAGE:
+        db = SessionLocal()
+        try:
+            db.merge(FeatureStoreSnapshot(
+                name=FEATURE_STORE_SNAPSHOT_NAME,
+                payload=data,
+                updated_at=datetime.datetime.utcnow(),
+            ))
+            db.commit()
+        finally:
+            db.close()
+    else:
+        os.makedirs(os.path.dirname(FEATURE_STORE_SNAPSHOT_PATH) or ".", exist_ok=True)
+        tmp_path = f"{FEATURE_STORE_SNAPSHOT_PATH}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, FEATURE_STORE_SNAPSHOT_PATH)
+    return len(data)
+
+
+async def _snapshot_periodically():
+    while True:
+        await asyncio.sleep(FEATURE_STORE_SNAPSHOT_SECONDS)
+        if not feature_store.dirty:
+            continue
+        try:
+            await run_in_threadpool(save_feature_store_snapshot)
+        except Exception as e:
+            print(f"Warning: Could not save feature store snapshot: {e}")
+
 
 @app.on_event("startup")
 def on_startup():
+    global _snapshot_task
     if USE_DB_STORAGE:
         Base.metadata.create_all(bind=engine)
+        model_registry.create_tables(engine)
+        model_registry.import_legacy_artifacts(engine)
+        registry_watcher.start()
+    threading.Thread(target=warmup_model_cache, name="model-cache-warmup", daemon=True).start()
+    try:
+        if load_feature_store_snapshot():
+            print(f"Feature store restored: {feature_store.stats()}")
+    except Exception as e:
+        print(f"Warning: Could not restore feature store snapshot: {e}")
+    if FEATURE_STORE_SNAPSHOT_SECONDS > 0:
+        _snapshot_task = asyncio.get_event_loop().create_task(_snapshot_periodically())
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    if registry_watcher is not None:
+        registry_watcher.stop()
+    if _snapshot_task is not None:
+        _snapshot_task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await _snapshot_task
+    if feature_store.dirty:
+        try:
+            await run_in_threadpool(save_feature_store_snapshot)
+        except Exception as e:
+            print(f"Warning: Could not save feature store snapshot: {e}")
 
 # --- Pydantic Модели ---
 class DynamicRequest(BaseModel):
     model_name: str
     features: Dict[str, Any]
+    # True — добавить транзакцию в историю карты; по умолчанию признаки только считаются по истории
+    update_feature_state: bool = False
+
+class BatchRequest(BaseModel):
+    model_name: str
+    # Колоночный формат: имя колонки -> значения по строкам, все списки одной длины
+    columns: Dict[str, List[Any]]
+    update_feature_state: bool = False
 
 class ScoreFileRequest(BaseModel):
     model_name: str
     filename: str
+    # Процессов для decision_function: -1 — все ядра; по умолчанию SCORE_FILE_N_JOBS
+    n_jobs: int | None = None
 
 class ScoreFileResponse(BaseModel):
     scores: List[float]
 
+class ScoreFileStreamRequest(BaseModel):
+    model_name: str
+    filename: str
+    # Формат файла с оценками: "csv" или "parquet"
+    output_format: str = "csv"
+    # Имя файла результата в file_service; по умолчанию <файл>_scores_<модель>.<формат>
+    result_filename: str | None = None
+    chunk_rows: int | None = None
+    n_jobs: int | None = None
+
 
 # --- (СКОПИРОВАНО ИЗ training_service) Вспомогательная функция обработки дат ---
-def date_feature_extractor(df: pd.DataFrame, date_features: List[str]) -> (pd.DataFrame, List[str]):
+# per_row — разбирать даты каждой строки отдельно (пачка одновременных запросов, форматы могут различаться)
+def date_feature_extractor(df: pd.DataFrame, date_features: List[str], per_row: bool = False) -> (pd.DataFrame, List[str]):
     df_processed = df.copy()
     generated_features = []
 
@@ -85,216 +196,540 @@ def date_feature_extractor(df: pd.DataFrame, date_features: List[str]) -> (pd.Da
             print(f"Warning: Date feature column '{col}' not found in input data.")
             continue
         try:
-            datetime_col = pd.to_datetime(df_processed[col])
             hour_col = f"{col}_hour"
             day_of_week_col = f"{col}_day_of_week"
-            df_processed[hour_col] = datetime_col.dt.hour
-            df_processed[day_of_week_col] = datetime_col.dt.dayofweek
+            if per_row:
+                timestamps = [parse_timestamp(value) for value in df_processed[col]]
+                df_processed[hour_col] = [ts.hour for ts in timestamps]
+                df_processed[day_of_week_col] = [ts.dayofweek for ts in timestamps]
+            else:
+                datetime_col = pd.to_datetime(df_processed[col])
+                df_processed[hour_col] = datetime_col.dt.hour
+                df_processed[day_of_week_col] = datetime_col.dt.dayofweek
             generated_features.extend([hour_col, day_of_week_col])
         except Exception as e:
             print(f"Warning: Could not process date feature {col}: {e}")
 
     return df_processed, generated_features
 
-def generate_features(df: pd.DataFrame, config: Dict[str, Any]) -> (pd.DataFrame, List[str]):
-    """
-    Генерирует новые признаки: время суток, агрегация за час,
-    время с последней транзакции, отклонение от среднего.
-    ДОЛЖНА БЫТЬ ИДЕНТИЧНА ВЕРСИИ В training_service!
-    """
-    df_eng = df.copy()
-    generated_eng_features = []
-
-    card_col = config.get("card_id_column")
-    ts_col = config.get("timestamp_column")
-    amt_col = config.get("amount_column")
+# --- Загрузка модели и конфига через кэш ---
+# Бюджет памяти под загруженные модели. В режиме Postgres активные версии приходят из реестра
+# (NOTIFY или опрос раз в MODEL_REGISTRY_POLL_SECONDS), и новая версия подменяет старую в кэше в фоне.
+# В файловом режиме mtime файлов сверяется не чаще раза в MODEL_CACHE_VALIDATE_SECONDS.
+# При старте в фоне загружаются модели из MODEL_CACHE_WARMUP (через запятую) и недавно использованные.
+MODEL_CACHE_MAX_BYTES = int(os.getenv("MODEL_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+MODEL_CACHE_VALIDATE_SECONDS = float(os.getenv("MODEL_CACHE_VALIDATE_SECONDS", "5"))
+MODEL_CACHE_WARMUP = [name.strip() for name in os.getenv("MODEL_CACHE_WARMUP", "").split(",") if name.strip()]
+MODEL_CACHE_RECENT_PATH = os.getenv("MODEL_CACHE_RECENT_PATH", os.path.join(MODELS_DIR, ".recent_models.json"))
+MODEL_REGISTRY_POLL_SECONDS = float(os.getenv("MODEL_REGISTRY_POLL_SECONDS", "5"))
 
-    required_cols = [col for col in [card_col, ts_col, amt_col] if col]
-    if not all(col in df_eng.columns for col in required_cols):
-        print("Warning: Недостаточно колонок для генерации признаков агрегации в prediction.")
-        return df_eng, generated_eng_features
 
+def artifact_version(model_name: str):
+    """Дешевая версия артефакта; None, если модели нет."""
+    if USE_DB_STORAGE:
+        return registry_watcher.active_version(model_name)
+    model_path = os.path.join(MODELS_DIR, f"{model_name}.joblib")
+    config_path = os.path.join(MODELS_DIR, f"{model_name}.json")
     try:
-        # --- Преобразования ---
-        df_eng[ts_col] = pd.to_datetime(df_eng[ts_col])
-        df_eng = df_eng.sort_values(by=[card_col, ts_col]) # Сортировка важна для diff()
-
-        # --- 1. Признаки времени суток ---
-        hour_cols = [col for col in df_eng.columns if col.endswith('_hour')]
-        if hour_cols:
-            hour_col = hour_cols[0]
-            df_eng['is_night'] = df_eng[hour_col].apply(lambda x: 1 if (x >= 22 or x <= 6) else 0)
-            generated_eng_features.append('is_night')
-
-        # --- 2. Агрегация за последний час (rolling) ---
-        # ВНИМАНИЕ: Для /predict_or_score/ (одна строка) rolling window будет
-        # Для /score_file/ (весь файл) это будет работать правильно.
-        rolling_window_1h = df_eng.groupby(card_col, group_keys=False)[amt_col].rolling('1H', on=ts_col, closed='left')
-        df_eng['card_tx_count_1h'] = rolling_window_1h.count().reset_index(level=0, drop=True).fillna(0).astype(int)
-        generated_eng_features.append('card_tx_count_1h')
-        df_eng['card_tx_amount_sum_1h'] = rolling_window_1h.sum().reset_index(level=0, drop=True).fillna(0)
-        generated_eng_features.append('card_tx_amount_sum_1h')
-
-        # --- 3. Время с последней транзакции по карте ---
-        df_eng['time_since_last_tx_card'] = df_eng.groupby(card_col)[ts_col].diff().dt.total_seconds()
-        df_eng['time_since_last_tx_card'] = df_eng['time_since_last_tx_card'].fillna(86400)
-        generated_eng_features.append('time_since_last_tx_card')
-
-        # --- 4. Отклонение от среднего по карте за окно (24 часа) ---
-        rolling_window_24h_avg = df_eng.groupby(card_col, group_keys=False)[amt_col].rolling('24H', on=ts_col, closed='left').mean()
-        df_eng['card_tx_amount_avg_24h'] = rolling_window_24h_avg.reset_index(level=0, drop=True)
-        fill_value_avg = df_eng[amt_col].mean() if not df_eng.empty else 0
-        df_eng['card_tx_amount_avg_24h'] = df_eng['card_tx_amount_avg_24h'].fillna(fill_value_avg)
-
-        df_eng['amount_deviation_from_card_avg'] = df_eng[amt_col] - df_eng['card_tx_amount_avg_24h']
-        generated_eng_features.append('amount_deviation_from_card_avg')
-
-        df_eng = df_eng.drop(columns=['card_tx_amount_avg_24h'], errors='ignore')
-
-        print(f"Сгенерированы признаки (prediction): {generated_eng_features}")
+        model_stat, config_stat = os.stat(model_path), os.stat(config_path)
+    except FileNotFoundError:
+        return None
+    return model_stat.st_mtime_ns, model_stat.st_size, config_stat.st_mtime_ns, config_stat.st_size
 
-    except Exception as e:
-        print(f"Ошибка во время генерации признаков (prediction): {e}")
-        import traceback
-        traceback.print_exc()
-        return df.copy(), []
 
-    return df_eng, generated_eng_features
-
-# --- Вспомогательная функция загрузки модели и конфига ---
-def load_model_and_config(model_name: str):
+def read_model_artifact(model_name: str) -> LoadedModel:
     if USE_DB_STORAGE:
         db = SessionLocal()
         try:
-            artifact = db.get(ModelArtifact, model_name)
+            artifact = model_registry.load_active_version(db, model_name)
             if artifact is None:
-                raise HTTPException(status_code=404, detail=f"Модель '{model_name}' или ее конфиг не найдены.")
+                raise KeyError(model_name)
             model = joblib.load(io.BytesIO(artifact.model_blob))
             config = json.loads(artifact.config_json)
-            return model, config
+            version = (artifact.version, artifact.model_sha256)
+            return LoadedModel(model, config, version, len(artifact.model_blob))
         finally:
             db.close()
-    else:
-        model_path = os.path.join(MODELS_DIR, f"{model_name}.joblib")
-        config_path = os.path.join(MODELS_DIR, f"{model_name}.json")
-        if not os.path.exists(model_path) or not os.path.exists(config_path):
-            raise HTTPException(status_code=404, detail=f"Модель '{model_name}' или ее конфиг не найдены.")
+    # Версия снимается до чтения: если файлы перезапишут во время загрузки, кэш увидит новую версию
+    version = artifact_version(model_name)
+    if version is None:
+        raise KeyError(model_name)
+    model_path = os.path.join(MODELS_DIR, f"{model_name}.joblib")
+    config_path = os.path.join(MODELS_DIR, f"{model_name}.json")
+    model = joblib.load(model_path)
+    with open(config_path, 'r') as f:
+        config = json.load(f)
+    return LoadedModel(model, config, version, os.path.getsize(model_path))
+
+
+model_cache = ModelCache(
+    artifact_version,
+    read_model_artifact,
+    max_bytes=MODEL_CACHE_MAX_BYTES,
+    # Версия из реестра уже в памяти, ее можно сверять на каждом запросе
+    validate_seconds=0 if USE_DB_STORAGE else MODEL_CACHE_VALIDATE_SECONDS,
+    recent_path=MODEL_CACHE_RECENT_PATH,
+)
+
+
+def swap_changed_models(model_names: List[str]):
+    for model_name in model_names:
         try:
-            model = joblib.load(model_path)
-            with open(config_path, 'r') as f:
-                config = json.load(f)
-            return model, config
+            if model_cache.reload(model_name):
+                print(f"Model '{model_name}' switched to the new active version.")
         except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Ошибка при загрузке модели: {e}")
+            print(f"Warning: Could not load the new version of model '{model_name}': {e}")
+
+
+registry_watcher = (
+    model_registry.RegistryWatcher(engine, swap_changed_models, poll_seconds=MODEL_REGISTRY_POLL_SECONDS)
+    if USE_DB_STORAGE else None
+)
+
 
+def warmup_model_cache():
+    names = MODEL_CACHE_WARMUP + model_cache.recent_models()
+    if names:
+        print(f"Model cache warmed up: {model_cache.warmup(names)}")
 
-def _ensure_uploaded_file(filename: str) -> str:
-    file_path = os.path.join(UPLOAD_DIR, filename)
-    if os.path.exists(file_path):
-        return file_path
 
+def load_model_and_config(model_name: str):
     try:
-        response = requests.get(f"{FILE_SERVICE_URL}/download/{filename}", timeout=120, stream=True)
-        if response.status_code == 404:
-            raise HTTPException(status_code=404, detail=f"Файл данных '{filename}' не найден.")
-        response.raise_for_status()
+        return model_cache.get(model_name)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Модель '{model_name}' или ее конфиг не найдены.")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Ошибка при загрузке модели: {e}")
 
-        with open(file_path, "wb") as f:
-            for chunk in response.iter_content(chunk_size=1024 * 1024):
-                if chunk:
-                    f.write(chunk)
-        return file_path
-    except requests.RequestException as e:
-        raise HTTPException(status_code=502, detail=f"Не удалось получить файл '{filename}' из file_service: {e}")
+
+def source_columns(config: Dict[str, Any]) -> List[str] | None:
+    """Исходные колонки датасета, которые нужны модели; None — читать все колонки."""
+    feature_engineering_config = config.get('feature_engineering_config') or {}
+    columns = [
+        *config.get('numerical_features', []),
+        *config.get('categorical_features', []),
+        *config.get('date_features', []),
+        *[column for column in feature_engineering_config.values() if column],
+    ]
+    return columns or None
 
 
 # --- Эндпоинты ---
 
-@app.post("/predict_or_score/")
-async def predict_or_score(request: DynamicRequest):
-    model, config = load_model_and_config(request.model_name)
-    input_df = pd.DataFrame([request.features])
+def prepare_input(
+    input_df: pd.DataFrame, config: Dict[str, Any], update_feature_state: bool, per_row: bool = False
+) -> pd.DataFrame:
+    """
+    Обработка дат и генерация признаков для строк, пришедших на скоринг; порядок строк сохраняется.
+    История карт меняется последним шагом, поэтому после ошибки строки можно подготовить заново.
+    """
+    index = input_df.index
 
     # 1. Обработка дат
     date_features = config.get('date_features', [])
     if date_features:
-        input_df, _ = date_feature_extractor(input_df, date_features)
+        input_df, _ = date_feature_extractor(input_df, date_features, per_row=per_row)
 
-    # 2. Генерация признаков
+    # 2. Генерация признаков по истории карты из онлайн-хранилища
     feature_engineering_config = config.get('feature_engineering_config', {})
     if feature_engineering_config:
-        print("Warning: Feature Engineering для одной строки может быть неточным без истории.")
-        input_df, generated_eng_features = generate_features(input_df, feature_engineering_config)
+        input_df, generated_eng_features = online_features(
+            feature_store, input_df, config, update=update_feature_state
+        )
+        # Запасной путь через generate_features сортирует строки по карте и времени
+        input_df = input_df.loc[index]
+    return input_df
+
 
+def score_rows(model, config: Dict[str, Any], rows: List[Dict[str, Any]], update_feature_state: bool) -> List[Dict[str, Any]]:
+    """Подготовка признаков и оценка нескольких строк одним вызовом модели; ответы — как у /predict_or_score/."""
+    input_df = prepare_input(pd.DataFrame(rows), config, update_feature_state)
+    return score_prepared(model, config, input_df)
+
+
+def score_prepared(model, config: Dict[str, Any], input_df: pd.DataFrame) -> List[Dict[str, Any]]:
     # 3. Определение типа модели
     model_type = config.get('model_type', 'classification')
 
     # 4. Предсказание/Оценка
     try:
         if model_type == 'anomaly_detection':
-            # Логика decision_function остается прежней
             scores = model.decision_function(input_df)
-            anomaly_score = scores[0]
-            is_anomaly = anomaly_score < 0
-            return {
-                "model_type": "anomaly_detection",
-                "anomaly_score": float(anomaly_score),
-                "is_anomaly_predicted": bool(is_anomaly)
-            }
-        else:
-            prediction = model.predict(input_df)
-            probabilities = {}
-            if hasattr(model, "predict_proba"):
-                try:
-                     probs = model.predict_proba(input_df)[0]
-                     classes = model.named_steps.get('classifier', model).classes_
-                     probabilities = dict(zip(classes, probs))
-                except Exception as prob_e:
-                     print(f"Warning: Could not get probabilities: {prob_e}")
-            return {
+            return [
+                {
+                    "model_type": "anomaly_detection",
+                    "anomaly_score": float(anomaly_score),
+                    "is_anomaly_predicted": bool(anomaly_score < 0)
+                }
+                for anomaly_score in scores
+            ]
+        predictions = model.predict(input_df).tolist()
+        probabilities = [{} for _ in predictions]
+        if hasattr(model, "predict_proba"):
+            try:
+                probs = model.predict_proba(input_df).tolist()
+                classes = model.named_steps.get('classifier', model).classes_.tolist()
+                probabilities = [dict(zip(classes, row_probs)) for row_probs in probs]
+            except Exception as prob_e:
+                print(f"Warning: Could not get probabilities: {prob_e}")
+        return [
+            {
                 "model_type": "classification",
-                "prediction": prediction[0],
-                "probabilities": probabilities
+                "prediction": prediction,
+                "probabilities": row_probabilities
             }
+            for prediction, row_probabilities in zip(predictions, probabilities)
+        ]
     except KeyError as e:
-         # Эта ошибка может возникать чаще, если FE не сработал корректно
-         raise HTTPException(status_code=400, detail=f"Ошибка: Отсутствует необходимый признак '{e}' во входных данных после обработки.")
+        # Эта ошибка может возникать чаще, если FE не сработал корректно
+        raise HTTPException(status_code=400, detail=f"Ошибка: Отсутствует необходимый признак '{e}' во входных данных после обработки.")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ошибка при предсказании/оценке: {e}")
 
-@app.post("/score_file/", response_model=ScoreFileResponse)
-async def score_file(request: ScoreFileRequest):
-    model, config = load_model_and_config(request.model_name)
-    file_path = _ensure_uploaded_file(request.filename)
 
+def _is_missing(value) -> bool:
+    return value is None or (isinstance(value, float) and np.isnan(value))
+
+
+def batchable(row: Dict[str, Any], config: Dict[str, Any]) -> bool:
+    """
+    Получит ли строка в пачке те же признаки, что и в отдельном запросе: для этого
+    все ее даты должны разбираться, а для онлайн-признаков нужны карта и время.
+    """
+    feature_engineering_config = config.get('feature_engineering_config') or {}
+    card_col = feature_engineering_config.get('card_id_column')
+    ts_col = feature_engineering_config.get('timestamp_column')
+    if feature_engineering_config and card_col in row and ts_col in row:
+        if _is_missing(row[card_col]) or parse_timestamp(row[ts_col]) is pd.NaT:
+            return False
+    return all(
+        _is_missing(row[col]) or parse_timestamp(row[col]) is not pd.NaT
+        for col in config.get('date_features', [])
+        if col in row
+    )
+
+
+def score_group(model, config: Dict[str, Any], rows: List[Dict[str, Any]], update_feature_state: bool) -> List[Any]:
+    """Оценка строк одним вызовом модели; вместо ответа строки с ошибкой — исключение."""
+    try:
+        # Одна строка готовится так же, как отдельный запрос
+        input_df = prepare_input(pd.DataFrame(rows), config, update_feature_state, per_row=len(rows) > 1)
+    except Exception as e:
+        if len(rows) == 1:
+            return [e]
+        # История карт при ошибке не менялась: готовим строки по отдельности
+        return [result for row in rows for result in score_group(model, config, [row], update_feature_state)]
+    try:
+        return score_prepared(model, config, input_df)
+    except Exception as e:
+        if len(rows) == 1:
+            return [e]
+    # Признаки уже записаны в историю карт, поэтому заново оцениваем готовые строки, а не готовим их снова
+    results = []
+    for position in range(len(input_df)):
+        try:
+            results.extend(score_prepared(model, config, input_df.iloc[[position]]))
+        except Exception as e:
+            results.append(e)
+    return results
+
+
+def score_micro_batch(context, rows: List[Dict[str, Any]]) -> List[Any]:
+    """
+    Строки разных клиентов не должны менять признаки друг друга. Вместе готовятся строки
+    с одинаковым набором полей, которые получат в пачке те же признаки, что и по одной;
+    остальные (без карты или времени, с неразобранной датой) готовятся каждая отдельно.
+    """
+    model, config, update_feature_state = context
+    groups: Dict[Any, List[int]] = {}
+    for position, row in enumerate(rows):
+        key = frozenset(row) if batchable(row, config) else position
+        groups.setdefault(key, []).append(position)
+
+    results: List[Any] = [None] * len(rows)
+    for positions in groups.values():
+        group_results = score_group(model, config, [rows[position] for position in positions], update_feature_state)
+        for position, result in zip(positions, group_results):
+            results[position] = result
+    return results
+
+
+# --- Микробатчинг /predict_or_score/ ---
+# Одновременные запросы к одной модели объединяются в пачку до MICRO_BATCH_MAX_ROWS строк
+# или MICRO_BATCH_MAX_WAIT_MS с первого запроса; MICRO_BATCH_MAX_ROWS=1 отключает объединение.
+MICRO_BATCH_MAX_ROWS = int(os.getenv("MICRO_BATCH_MAX_ROWS", "256"))
+MICRO_BATCH_MAX_WAIT_MS = float(os.getenv("MICRO_BATCH_MAX_WAIT_MS", "2"))
+MICRO_BATCH_CONCURRENCY = int(os.getenv("MICRO_BATCH_CONCURRENCY", str(os.cpu_count() or 1)))
+
+micro_batcher = MicroBatcher(
+    score_micro_batch,
+    max_rows=MICRO_BATCH_MAX_ROWS,
+    max_wait_seconds=MICRO_BATCH_MAX_WAIT_MS / 1000,
+    max_concurrency=MICRO_BATCH_CONCURRENCY,
+)
+
+
+@app.post("/predict_or_score/")
+async def predict_or_score(request: DynamicRequest):
+    model, config = await run_in_threadpool(load_model_and_config, request.model_name)
+    if MICRO_BATCH_MAX_ROWS <= 1:
+        return (await run_in_threadpool(score_rows, model, config, [request.features], request.update_feature_state))[0]
+    # Ключ включает сам объект модели: после подмены версии новые запросы не попадут в пачку старой
+    key = (request.model_name, id(model), request.update_feature_state)
+    return await micro_batcher.submit(key, (model, config, request.update_feature_state), request.features)
+
+
+# --- Пакетный скоринг ---
+# Тело: колоночный JSON (BatchRequest) или Arrow IPC stream (Content-Type ARROW_STREAM_TYPE,
+# model_name и update_feature_state в query). Ответ: JSON по умолчанию, NDJSON по частям
+# (Accept: application/x-ndjson) или Arrow IPC (Accept: ARROW_STREAM_TYPE).
+ARROW_STREAM_TYPE = "application/vnd.apache.arrow.stream"
+NDJSON_TYPE = "application/x-ndjson"
+PREDICT_BATCH_MAX_ROWS = int(os.getenv("PREDICT_BATCH_MAX_ROWS", "100000"))
+PREDICT_BATCH_CHUNK_ROWS = int(os.getenv("PREDICT_BATCH_CHUNK_ROWS", "10000"))
+
+
+async def read_batch(request: Request, model_name: str | None, update_feature_state: bool) -> tuple[str, pd.DataFrame, bool]:
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    body = await request.body()
+    if content_type == ARROW_STREAM_TYPE:
+        if not model_name:
+            raise HTTPException(status_code=400, detail="Для Arrow укажите model_name в параметрах запроса.")
+        try:
+            table = pa.ipc.open_stream(body).read_all()
+        except pa.ArrowInvalid as e:
+            raise HTTPException(status_code=400, detail=f"Некорректный Arrow IPC stream: {e}")
+        if table.num_rows > PREDICT_BATCH_MAX_ROWS:
+            raise HTTPException(status_code=413, detail=f"Не больше {PREDICT_BATCH_MAX_ROWS} строк за запрос.")
+        return model_name, table.to_pandas(), update_feature_state
+
+    try:
+        batch = BatchRequest.model_validate_json(body)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False))
+    lengths = {len(values) for values in batch.columns.values()}
+    if len(lengths) > 1:
+        raise HTTPException(status_code=400, detail="Все колонки должны быть одной длины.")
+    if lengths and lengths.pop() > PREDICT_BATCH_MAX_ROWS:
+        raise HTTPException(status_code=413, detail=f"Не больше {PREDICT_BATCH_MAX_ROWS} строк за запрос.")
+    return batch.model_name, pd.DataFrame(batch.columns), batch.update_feature_state
+
+
+def score_batch(model, config: Dict[str, Any], input_df: pd.DataFrame) -> np.ndarray:
+    if config.get('model_type', 'classification') == 'anomaly_detection':
+        return model.decision_function(input_df)
+    return model.predict(input_df)
+
+
+def batch_chunks(model, config: Dict[str, Any], input_df: pd.DataFrame):
+    """Строки NDJSON: оценки по частям в порядке строк запроса, затем итоговая строка."""
+    anomaly_detection = config.get('model_type', 'classification') == 'anomaly_detection'
+    for offset in range(0, len(input_df), PREDICT_BATCH_CHUNK_ROWS):
+        try:
+            values = score_batch(model, config, input_df.iloc[offset:offset + PREDICT_BATCH_CHUNK_ROWS])
+        except Exception as e:
+            # Статус 200 уже отправлен, поэтому ошибка сообщается последней строкой потока
+            yield json.dumps({"error": f"Ошибка при пакетной оценке: {e}", "offset": offset}) + "\n"
+            return
+        chunk = {"offset": offset, "scores" if anomaly_detection else "predictions": values.tolist()}
+        if anomaly_detection:
+            chunk["is_anomaly_predicted"] = (values < 0).tolist()
+        yield json.dumps(chunk) + "\n"
+    yield json.dumps({"done": True, "rows": len(input_df)}) + "\n"
+
+
+@app.post("/predict_batch/")
+async def predict_batch(request: Request, model_name: str | None = None, update_feature_state: bool = False):
+    model_name, input_df, update_feature_state = await read_batch(request, model_name, update_feature_state)
+    model, config = await run_in_threadpool(load_model_and_config, model_name)
     model_type = config.get('model_type', 'classification')
-    if model_type != 'anomaly_detection':
-        raise HTTPException(status_code=400, detail=f"Модель '{request.model_name}' не является моделью обнаружения аномалий.")
+    try:
+        input_df = await run_in_threadpool(prepare_input, input_df, config, update_feature_state)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Ошибка при подготовке признаков: {e}")
+
+    accept = request.headers.get("accept", "")
+    if NDJSON_TYPE in accept:
+        # Генератор синхронный: Starlette выполняет его в пуле потоков, часть за частью
+        return StreamingResponse(batch_chunks(model, config, input_df), media_type=NDJSON_TYPE)
+
+    try:
+        values = await run_in_threadpool(score_batch, model, config, input_df)
+    except KeyError as e:
+        raise HTTPException(status_code=400, detail=f"Ошибка: Отсутствует необходимый признак '{e}' во входных данных после обработки.")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Ошибка при пакетной оценке: {e}")
+
+    if ARROW_STREAM_TYPE in accept:
+        columns = {"score" if model_type == 'anomaly_detection' else "prediction": values}
+        if model_type == 'anomaly_detection':
+            columns["is_anomaly_predicted"] = values < 0
+        table = pa.table(columns)
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return Response(content=sink.getvalue().to_pybytes(), media_type=ARROW_STREAM_TYPE)
+
+    if model_type == 'anomaly_detection':
+        return {
+            "model_type": "anomaly_detection",
+            "scores": values.tolist(),
+            "is_anomaly_predicted": (values < 0).tolist(),
+        }
+    return {"model_type": "classification", "predictions": values.tolist()}
+
+
+@app.get("/micro_batching/")
+async def micro_batching_stats():
+    return micro_batcher.stats()
+
+
+@app.get("/model_cache/")
+async def model_cache_stats():
+    stats = model_cache.stats()
+    if registry_watcher is not None:
+        stats["registry_listening"] = registry_watcher.listening
+    return stats
+
 
+@app.get("/feature_store/")
+async def feature_store_stats():
+    return feature_store.stats()
+
+
+@app.post("/feature_store/snapshot")
+async def feature_store_snapshot():
     try:
-        df = read_dataset(file_path)
+        size = await run_in_threadpool(save_feature_store_snapshot)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Ошибка при сохранении состояния признаков: {e}")
+    return {"status": "saved", "bytes": size, **feature_store.stats()}
 
-        # 2. Обрабатываем даты
-        date_features = config.get('date_features', [])
-        if date_features:
-            df, _ = date_feature_extractor(df, date_features)
 
-        # 3. Генерируем признаки
-        feature_engineering_config = config.get('feature_engineering_config', {})
-        if feature_engineering_config:
-             df, generated_eng_features = generate_features(df, feature_engineering_config)
-             # Важно: Убедиться, что df теперь содержит новые колонки
+# --- Скоринг файла ---
+# decision_function по большим файлам считается в SCORE_FILE_N_JOBS процессах (-1 — все ядра);
+# запрос может переопределить число процессов полем n_jobs.
+SCORE_FILE_N_JOBS = int(os.getenv("SCORE_FILE_N_JOBS", "1"))
 
-        # 4. Получаем оценки для ВСЕХ строк
-        all_scores = model.decision_function(df)
 
-        scores_list = [float(score) for score in all_scores]
+def scoring_jobs(n_jobs: int | None) -> int:
+    n_jobs = SCORE_FILE_N_JOBS if n_jobs is None else n_jobs
+    if n_jobs == 0:
+        raise HTTPException(status_code=400, detail="n_jobs не может быть 0: укажите число процессов или -1 для всех ядер.")
+    return n_jobs
 
-        return ScoreFileResponse(scores=scores_list)
 
+def score_whole_file(model, config: Dict[str, Any], filename: str, n_jobs: int) -> np.ndarray:
+    """Читает файл и оценивает все строки; выполняется в пуле потоков, чтобы не занимать event loop."""
+    # Читаем только колонки, которые использует модель
+    df = load_dataset(filename, columns=source_columns(config), memory_map=True)
+
+    # 2. Обрабатываем даты
+    date_features = config.get('date_features', [])
+    if date_features:
+        df, _ = date_feature_extractor(df, date_features)
+
+    # 3. Генерируем признаки
+    feature_engineering_config = config.get('feature_engineering_config', {})
+    if feature_engineering_config:
+        df, _ = generate_features(df, feature_engineering_config)
+
+    # 4. Получаем оценки для ВСЕХ строк
+    return decision_function(model, df, n_jobs)
+
+
+@app.post("/score_file/", response_model=ScoreFileResponse)
+async def score_file(request: ScoreFileRequest):
+    n_jobs = scoring_jobs(request.n_jobs)
+    model, config = await run_in_threadpool(load_model_and_config, request.model_name)
+
+    model_type = config.get('model_type', 'classification')
+    if model_type != 'anomaly_detection':
+        raise HTTPException(status_code=400, detail=f"Модель '{request.model_name}' не является моделью обнаружения аномалий.")
+
+    try:
+        all_scores = await run_in_threadpool(score_whole_file, model, config, request.filename, n_jobs)
+        return ScoreFileResponse(scores=[float(score) for score in all_scores])
+
+    except HTTPException:
+        raise
     except KeyError as e:
          raise HTTPException(status_code=400, detail=f"Ошибка: Не найдена необходимая колонка '{e}' для применения модели.")
     except Exception as e:
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Ошибка при пакетной обработке файла: {e}")
+
+
+# --- Потоковый скоринг файла ---
+# Файл оценивается частями по SCORE_FILE_CHUNK_ROWS строк, оценки пишутся в файл результата
+# в file_service. Ответ — NDJSON: строки прогресса, затем итог со сводкой или строка с ошибкой.
+SCORE_FILE_CHUNK_ROWS = int(os.getenv("SCORE_FILE_CHUNK_ROWS", "200000"))
+
+
+def score_file_events(
+    model, config: Dict[str, Any], table: pa.Table, chunk_rows: int, n_jobs: int, output_format: str, result_filename: str
+):
+    rows = table.num_rows
+    date_features = config.get('date_features', [])
+
+    def extract_dates(df: pd.DataFrame) -> pd.DataFrame:
+        return date_feature_extractor(df, date_features)[0] if date_features else df
+
+    yield json.dumps({"stage": "scoring", "rows": rows, "rows_done": 0}) + "\n"
+    scores = np.empty(rows)
+    rows_done = 0
+    try:
+        for positions, values in score_chunks(model, config, table, chunk_rows, extract_dates, n_jobs):
+            scores[positions] = values
+            rows_done += len(positions)
+            yield json.dumps({"stage": "scoring", "rows": rows, "rows_done": rows_done}) + "\n"
+
+        yield json.dumps({"stage": "uploading", "rows": rows, "rows_done": rows_done}) + "\n"
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            result_path = os.path.join(tmp_dir, result_filename)
+            write_scores(scores, result_path, output_format, chunk_rows)
+            stored_filename = upload_result(result_path, result_filename)
+    except KeyError as e:
+        # Статус 200 уже отправлен, поэтому ошибка сообщается последней строкой потока
+        yield json.dumps({"error": f"Ошибка: Не найдена необходимая колонка '{e}' для применения модели.", "rows_done": rows_done}) + "\n"
+        return
+    except Exception as e:
+        yield json.dumps({"error": f"Ошибка при пакетной обработке файла: {e}", "rows_done": rows_done}) + "\n"
+        return
+
+    yield json.dumps({
+        "done": True,
+        "rows": rows,
+        "result_filename": stored_filename,
+        "output_format": output_format,
+        "summary": summarize_scores(scores),
+    }) + "\n"
+
+
+@app.post("/score_file_stream/")
+async def score_file_stream(request: ScoreFileStreamRequest):
+    if request.output_format not in RESULT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"output_format: одно из {', '.join(RESULT_FORMATS)}.")
+    result_filename = request.result_filename or (
+        f"{os.path.splitext(request.filename)[0]}_scores_{request.model_name}.{request.output_format}"
+    )
+    if (
+        os.path.basename(result_filename) != result_filename
+        or result_filename.startswith(".")
+        or os.path.splitext(result_filename)[1].lower() != f".{request.output_format}"
+    ):
+        raise HTTPException(status_code=400, detail=f"Некорректное имя файла результата: '{result_filename}'.")
+    chunk_rows = max(request.chunk_rows or SCORE_FILE_CHUNK_ROWS, 1)
+    n_jobs = scoring_jobs(request.n_jobs)
+
+    model, config = await run_in_threadpool(load_model_and_config, request.model_name)
+    if config.get('model_type', 'classification') != 'anomaly_detection':
+        raise HTTPException(status_code=400, detail=f"Модель '{request.model_name}' не является моделью обнаружения аномалий.")
+    table = await run_in_threadpool(open_feature_table, request.filename, source_columns(config))
+
+    # Генератор синхронный: Starlette выполняет его в пуле потоков, часть за частью
+    return StreamingResponse(
+        score_file_events(model, config, table, chunk_rows, n_jobs, request.output_format, result_filename),
+        media_type=NDJSON_TYPE,
+    )
@@ -0,0 +1,124 @@
+"""
+Динамический микробатчинг одиночных запросов скоринга.
+
+Одновременные запросы к одной модели собираются в пачку: она уходит на обработку,
+когда набралось max_rows строк или прошло max_wait_seconds с первой строки. Пачка
+обрабатывается одним векторизованным вызовом в пуле потоков, результаты раздаются
+ожидающим запросам по порядку. Пока все max_concurrency слотов заняты, пачка
+продолжает набирать запросы и после max_wait_seconds, поэтому под нагрузкой пачки
+растут сами, а при малой нагрузке задержка не больше max_wait_seconds.
+"""
+import asyncio
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Hashable, List
+
+from fastapi.concurrency import run_in_threadpool
+
+
+@dataclass
+class _Batch:
+    context: Any
+    items: List[Any] = field(default_factory=list)
+    futures: List[asyncio.Future] = field(default_factory=list)
+    timer: asyncio.TimerHandle | None = None
+    # Время ожидания вышло, но все слоты заняты: пачка продолжает набирать строки до освобождения слота
+    due: bool = False
+
+
+class MicroBatcher:
+    def __init__(
+        self,
+        process: Callable[[Any, List[Any]], List[Any]],
+        max_rows: int,
+        max_wait_seconds: float,
+        max_concurrency: int,
+    ) -> None:
+        """
+        process(context, items) -> результаты в том же порядке; выполняется в пуле потоков.
+        Для одного ключа context берется из первого запроса пачки.
+        """
+        self._process = process
+        self.max_rows = max_rows
+        self.max_wait_seconds = max_wait_seconds
+        self.max_concurrency = max_concurrency
+        self._pending: Dict[Hashable, _Batch] = {}
+        # Заполненные пачки, ждущие свободного слота
+        self._ready: deque[_Batch] = deque()
+        self._inflight = 0
+        self._tasks: set[asyncio.Task] = set()
+        self.metrics = {"requests": 0, "batches": 0, "rows": 0, "max_batch_rows": 0}
+
+    async def submit(self, key: Hashable, context: Any, item: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        batch = self._pending.get(key)
+        if batch is None:
+            batch = self._pending[key] = _Batch(context)
+            batch.timer = loop.call_later(self.max_wait_seconds, self._on_timer, key, batch)
+        batch.items.append(item)
+        batch.futures.append(future)
+        self.metrics["requests"] += 1
+        if len(batch.items) >= self.max_rows:
+            self._close(key, batch)
+        return await future
+
+    def _on_timer(self, key: Hashable, batch: _Batch) -> None:
+        batch.due = True
+        if self._inflight < self.max_concurrency:
+            self._close(key, batch)
+
+    def _close(self, key: Hashable, batch: _Batch) -> None:
+        """Пачка больше не принимает строки и встает в очередь на обработку."""
+        if self._pending.get(key) is batch:
+            del self._pending[key]
+        if batch.timer is not None:
+            batch.timer.cancel()
+        self._ready.append(batch)
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        while self._inflight < self.max_concurrency:
+            if not self._ready:
+                # Свободный слот забирает самую старую пачку, у которой вышло время ожидания
+                due = next(((key, batch) for key, batch in self._pending.items() if batch.due), None)
+                if due is None:
+                    return
+                key, batch = due
+                del self._pending[key]
+                self._ready.append(batch)
+            self._inflight += 1
+            task = asyncio.get_running_loop().create_task(self._run(self._ready.popleft()))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: _Batch) -> None:
+        self.metrics["batches"] += 1
+        self.metrics["rows"] += len(batch.items)
+        self.metrics["max_batch_rows"] = max(self.metrics["max_batch_rows"], len(batch.items))
+        try:
+            results = await run_in_threadpool(self._process, batch.context, batch.items)
+        except Exception as e:
+            results = [e] * len(batch.items)
+        finally:
+            self._inflight -= 1
+            self._dispatch()
+        for future, result in zip(batch.futures, results):
+            # Запрос мог быть отменен, пока пачка считалась (клиент отключился)
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def stats(self) -> Dict[str, Any]:
+        batches = self.metrics["batches"]
+        return {
+            **self.metrics,
+            "avg_batch_rows": self.metrics["rows"] / batches if batches else None,
+            "inflight": self._inflight,
+            "max_rows": self.max_rows,
+            "max_wait_ms": self.max_wait_seconds * 1000,
+            "max_concurrency": self.max_concurrency,
+        }
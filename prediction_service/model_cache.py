@@ -0,0 +1,243 @@
+"""
+LRU-кэш загруженных моделей prediction_service.
+
+Десериализация joblib-пайплайна (а в режиме Postgres еще и чтение model_blob целиком)
+занимает больше времени, чем само предсказание по одной строке. Кэш хранит готовые пары
+(модель, конфиг) в пределах бюджета памяти и перед использованием сверяет версию
+артефакта: mtime и размер файлов или хэш модели в БД. Версия проверяется не чаще раза
+в validate_seconds, поэтому переобученная модель подхватывается с этой задержкой.
+
+Объем модели в памяти оценивается размером сериализованного артефакта: у моделей
+sklearn основную часть занимают массивы numpy, которые в joblib хранятся как есть.
+"""
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class LoadedModel:
+    model: Any
+    config: Dict[str, Any]
+    version: Hashable
+    size: int
+    validated_at: float = 0.0
+
+
+class ModelCache:
+    def __init__(
+        self,
+        version_of: Callable[[str], Hashable | None],
+        load: Callable[[str], LoadedModel],
+        max_bytes: int,
+        validate_seconds: float = 0.0,
+        recent_path: str | None = None,
+        recent_limit: int = 20,
+    ) -> None:
+        """
+        version_of(name) — дешевая версия артефакта, None, если модели нет;
+        load(name) — полная загрузка модели с версией и размером.
+        """
+        self._version_of = version_of
+        self._load = load
+        self.max_bytes = max_bytes
+        self.validate_seconds = validate_seconds
+        self._recent_path = recent_path
+        self._recent_limit = recent_limit
+        # Запись списка недавних моделей: по одной за раз и только если порядок изменился
+        self._recent_lock = threading.Lock()
+        self._saved_recent: List[str] | None = None
+        self._entries: OrderedDict[str, LoadedModel] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        # Одновременные промахи по одной модели загружают ее один раз
+        self._loading: Dict[str, threading.Lock] = {}
+        # Модели, новая версия которых загружается в фоне: до подмены запросы получают прежнюю
+        self._reloading: set[str] = set()
+        self._metrics = {"hits": 0, "misses": 0, "stale": 0, "reloads": 0, "evictions": 0, "uncacheable": 0}
+
+    def get(self, name: str) -> Tuple[Any, Dict[str, Any]]:
+        """Модель и конфиг; KeyError, если артефакта нет."""
+        entry = self._fresh_entry(name)
+        if entry is not None:
+            return entry.model, entry.config
+
+        with self._lock:
+            loading = self._loading.setdefault(name, threading.Lock())
+        with loading:
+            # Пока ждали, модель мог загрузить соседний запрос
+            entry = self._fresh_entry(name, count=False)
+            if entry is not None:
+                return entry.model, entry.config
+            loaded = self._load(name)
+            loaded.validated_at = time.monotonic()
+            self._put(name, loaded)
+        return loaded.model, loaded.config
+
+    def _fresh_entry(self, name: str, count: bool = True) -> LoadedModel | None:
+        with self._lock:
+            entry = self._entries.get(name)
+        if entry is not None and time.monotonic() - entry.validated_at < self.validate_seconds:
+            self._hit(name, count)
+            return entry
+
+        version = self._version_of(name)
+        if version is None:
+            self.discard(name)
+            raise KeyError(name)
+        if entry is not None and entry.version == version:
+            entry.validated_at = time.monotonic()
+            self._hit(name, count)
+            return entry
+        with self._lock:
+            reloading = name in self._reloading
+        if entry is not None and reloading:
+            self._hit(name, count)
+            return entry
+
+        if count:
+            with self._lock:
+                self._metrics["stale" if entry is not None else "misses"] += 1
+        return None
+
+    def reload(self, name: str) -> bool:
+        """
+        Загружает новую версию модели, которая уже есть в кэше, и подменяет ее целиком.
+        Нужна при уведомлении об изменении: запросы не ждут загрузки, а получают прежнюю версию до подмены.
+        """
+        with self._lock:
+            if name not in self._entries or name in self._reloading:
+                return False
+            self._reloading.add(name)
+            loading = self._loading.setdefault(name, threading.Lock())
+        try:
+            with loading:
+                loaded = self._load(name)
+                loaded.validated_at = time.monotonic()
+                self._put(name, loaded)
+            with self._lock:
+                self._metrics["reloads"] += 1
+            return True
+        except KeyError:
+            self.discard(name)
+            return False
+        finally:
+            with self._lock:
+                self._reloading.discard(name)
+
+    def cached_models(self) -> List[str]:
+        with self._lock:
+            return list(self._entries)
+
+    def _hit(self, name: str, count: bool) -> None:
+        with self._lock:
+            if name in self._entries:
+                self._entries.move_to_end(name)
+            if count:
+                self._metrics["hits"] += 1
+
+    def _put(self, name: str, loaded: LoadedModel) -> None:
+        with self._lock:
+            previous = self._entries.pop(name, None)
+            if previous is not None:
+                self._bytes -= previous.size
+            if loaded.size > self.max_bytes:
+                # Модель больше всего бюджета: кэшировать ее значило бы вытеснить все остальное
+                self._metrics["uncacheable"] += 1
+                logger.warning("Модель '%s' (%d байт) больше бюджета кэша и не кэшируется.", name, loaded.size)
+                return
+            self._entries[name] = loaded
+            self._bytes += loaded.size
+            while self._bytes > self.max_bytes:
+                evicted_name, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.size
+                self._metrics["evictions"] += 1
+                logger.info("Модель '%s' вытеснена из кэша.", evicted_name)
+        self._save_recent()
+
+    def discard(self, name: str) -> None:
+        with self._lock:
+            entry = self._entries.pop(name, None)
+            if entry is not None:
+                self._bytes -= entry.size
+
+    def _save_recent(self) -> None:
+        if not self._recent_path:
+            return
+        with self._recent_lock:
+            # Порядок читается под блокировкой записи: последним пишется самый новый список
+            with self._lock:
+                names = list(reversed(self._entries))[: self._recent_limit]
+            if names == self._saved_recent:
+                return
+            tmp_path = None
+            try:
+                fd, tmp_path = tempfile.mkstemp(
+                    dir=os.path.dirname(os.path.abspath(self._recent_path)), prefix=".recent-", suffix=".tmp"
+                )
+                with os.fdopen(fd, "w") as f:
+                    json.dump(names, f)
+                os.replace(tmp_path, self._recent_path)
+                self._saved_recent = names
+            except OSError as e:
+                logger.warning("Не удалось сохранить список недавних моделей: %s", e)
+                if tmp_path and os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+    def recent_models(self) -> List[str]:
+        if not self._recent_path or not os.path.exists(self._recent_path):
+            return []
+        try:
+            with open(self._recent_path) as f:
+                return [name for name in json.load(f) if isinstance(name, str)]
+        except (OSError, ValueError) as e:
+            logger.warning("Не удалось прочитать список недавних моделей: %s", e)
+            return []
+
+    def warmup(self, names: List[str]) -> List[str]:
+        """
+        Загружает модели, начиная с самой недавней, пока они помещаются в бюджет;
+        возвращает загруженные. Порядок LRU после прогрева совпадает с порядком names.
+        """
+        warmed = []
+        for name in dict.fromkeys(names):
+            with self._lock:
+                evictions = self._metrics["evictions"]
+            try:
+                self.get(name)
+            except KeyError:
+                continue
+            except Exception as e:
+                logger.warning("Не удалось прогреть модель '%s': %s", name, e)
+                continue
+            with self._lock:
+                if name in self._entries:
+                    warmed.append(name)
+                if self._metrics["evictions"] > evictions:
+                    break  # бюджет исчерпан, остальные модели менее востребованы
+        with self._lock:
+            for name in reversed(warmed):
+                if name in self._entries:
+                    self._entries.move_to_end(name)
+            warmed = [name for name in warmed if name in self._entries]
+        return warmed
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._metrics["hits"] + self._metrics["misses"] + self._metrics["stale"]
+            return {
+                **self._metrics,
+                "hit_ratio": self._metrics["hits"] / lookups if lookups else None,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "models": [{"name": name, "bytes": entry.size} for name, entry in reversed(self._entries.items())],
+            }
@@ -0,0 +1,97 @@
+"""
+Пачка /predict_or_score/: некорректная строка одного клиента не меняет признаки и оценку
+строк других клиентов из той же пачки.
+
+Запуск из корня репозитория:
+    python -m pytest prediction_service/tests
+"""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import IsolationForest
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path[:0] = [ROOT_DIR, os.path.join(ROOT_DIR, "prediction_service")]
+
+import main  # noqa: E402
+from feature_store import OnlineFeatureStore  # noqa: E402
+
+FEATURES = [
+    "transaction_amount_kzt",
+    "is_night",
+    "card_tx_count_1h",
+    "card_tx_amount_sum_1h",
+    "time_since_last_tx_card",
+    "amount_deviation_from_card_avg",
+]
+CONFIG = {
+    "model_type": "anomaly_detection",
+    "numerical_features": FEATURES,
+    "categorical_features": [],
+    "date_features": ["transaction_timestamp"],
+    "feature_engineering_config": {
+        "card_id_column": "card_id",
+        "timestamp_column": "transaction_timestamp",
+        "amount_column": "transaction_amount_kzt",
+    },
+    "feature_engineering_stats": {"amount_mean": 5000.0},
+}
+# Три транзакции карты за час до оцениваемой, последняя — за 10 минут
+HISTORY = ["2024-03-01 11:10:00", "2024-03-01 11:30:00", "2024-03-01 11:50:00"]
+VALID_ROW = {"card_id": "card-1", "transaction_timestamp": "2024-03-01 12:00:00", "transaction_amount_kzt": 7000.0}
+
+
+@pytest.fixture(scope="module")
+def model():
+    rng = np.random.default_rng(0)
+    train = pd.DataFrame(rng.normal(size=(500, len(FEATURES))), columns=FEATURES)
+    pipeline = Pipeline([
+        ("preprocessor", ColumnTransformer([("num", StandardScaler(), FEATURES)])),
+        ("detector", IsolationForest(n_estimators=20, random_state=0)),
+    ])
+    return pipeline.fit(train)
+
+
+@pytest.fixture
+def store(monkeypatch):
+    store = OnlineFeatureStore()
+    for ts in HISTORY:
+        store.observe("card_id|transaction_timestamp|transaction_amount_kzt", "card-1", pd.Timestamp(ts).value, 5000.0)
+    monkeypatch.setattr(main, "feature_store", store)
+    return store
+
+
+def card_features(row: dict) -> dict:
+    prepared = main.prepare_input(pd.DataFrame([row]), CONFIG, update_feature_state=False)
+    return prepared.iloc[0][["card_tx_count_1h", "time_since_last_tx_card"]].to_dict()
+
+
+def score_alone(model, row: dict) -> dict:
+    return main.score_micro_batch((model, CONFIG, False), [row])[0]
+
+
+@pytest.mark.parametrize(
+    "invalid_row",
+    [
+        {"card_id": None, "transaction_timestamp": "2024-03-01 12:00:05", "transaction_amount_kzt": 100.0},
+        {"card_id": "card-2", "transaction_timestamp": "01.03.2024 12:00", "transaction_amount_kzt": 100.0},
+        {"card_id": "card-2", "transaction_timestamp": "не дата", "transaction_amount_kzt": 100.0},
+    ],
+    ids=["no-card", "other-format", "bad-timestamp"],
+)
+def test_invalid_row_does_not_change_valid_row(model, store, invalid_row):
+    assert card_features(VALID_ROW) == {"card_tx_count_1h": 3, "time_since_last_tx_card": 600.0}
+    expected = score_alone(model, VALID_ROW)
+
+    results = main.score_micro_batch((model, CONFIG, True), [VALID_ROW, invalid_row])
+
+    assert results[0] == expected
+    # Транзакция из пачки записана в историю карты
+    next_row = {**VALID_ROW, "transaction_timestamp": "2024-03-01 12:05:00"}
+    assert card_features(next_row) == {"card_tx_count_1h": 4, "time_since_last_tx_card": 300.0}
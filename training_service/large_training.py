@@ -0,0 +1,125 @@
+"""
+Обучение на больших датасетах: выборка строк и обучение по частям файла.
+
+Ядровой OneClassSVM (O(n²) по памяти и времени) и LocalOutlierFactor (kNN) не обучаются
+на всем файле из миллионов строк, поэтому модель учится на выборке из max_samples строк.
+Позиции выборки выбираются заранее: число строк Arrow-таблицы известно, поэтому равномерная
+выборка без возвращения дает то же, что reservoir sampling, без второго прохода.
+Стратифицированная выборка сохраняет доли значений колонки, и каждое значение попадает
+в выборку хотя бы одной строкой.
+
+Оконные признаки по карте зависят от соседних транзакций, поэтому при их генерации файл
+проходится целиком по частям (ml_common/feature_chunks.py), а в выборку попадают уже
+посчитанные строки. В памяти одновременно одна часть файла и выборка.
+
+При обучении по частям препроцессор обучается на выборке, а детектор — на всех частях файла:
+IsolationForest с warm_start добавляет деревья на каждую часть, SGDOneClassSVM делает partial_fit.
+"""
+import math
+from typing import Callable, Dict, Any, Iterable
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from sklearn.ensemble import IsolationForest
+
+from ml_common.feature_chunks import iter_feature_chunks, window_columns
+
+SAMPLING_METHODS = ("random", "stratified")
+# Деревьев в IsolationForest при обучении по частям, как n_estimators по умолчанию
+INCREMENTAL_TREES = 100
+# Подвыборка одного дерева IsolationForest (max_samples='auto'); части меньше нее не используются,
+# иначе нормировка длины пути разойдется с остальными деревьями
+ISOLATION_TREE_SAMPLES = 256
+
+
+def sample_positions(
+    table: pa.Table,
+    max_samples: int,
+    sampling: str = "random",
+    stratify_column: str | None = None,
+    random_state: int = 42,
+) -> np.ndarray:
+    """Отсортированные позиции строк выборки; все строки, если их не больше max_samples."""
+    total = table.num_rows
+    if max_samples >= total:
+        return np.arange(total)
+    rng = np.random.default_rng(random_state)
+    if sampling != "stratified":
+        return np.sort(rng.choice(total, size=max_samples, replace=False))
+
+    codes, _ = pd.factorize(table.column(stratify_column).to_pandas(), use_na_sentinel=False)
+    counts = np.bincount(codes)
+    quotas = _stratified_quotas(counts, max_samples)
+    # Внутри значения строки упорядочены случайно, берутся первые quota строк
+    order = np.lexsort((rng.random(total), codes))
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    ranks = np.arange(total) - starts[codes[order]]
+    return np.sort(order[ranks < quotas[codes[order]]])
+
+
+def _stratified_quotas(counts: np.ndarray, max_samples: int) -> np.ndarray:
+    """
+    Строк выборки на каждое значение: пропорционально числу строк, не меньше одной,
+    остаток после округления вниз раздается по наибольшим дробным частям. В сумме ровно
+    max_samples, если значений не больше max_samples.
+    """
+    exact = counts * max_samples / counts.sum()
+    quotas = np.minimum(np.maximum(np.floor(exact), 1), counts).astype(np.int64)
+    remainders = exact - quotas
+    leftover = max_samples - int(quotas.sum())
+    while leftover > 0 and (candidates := np.flatnonzero(quotas < counts)).size:
+        chosen = candidates[np.argsort(-remainders[candidates], kind="stable")[:leftover]]
+        quotas[chosen] += 1
+        remainders[chosen] -= 1
+        leftover -= len(chosen)
+    # Строки, добавленные значениям с долей меньше одной строки, забираются у остальных
+    while leftover < 0 and (candidates := np.flatnonzero(quotas > 1)).size:
+        chosen = candidates[np.argsort(remainders[candidates], kind="stable")[:-leftover]]
+        quotas[chosen] -= 1
+        remainders[chosen] += 1
+        leftover += len(chosen)
+    return quotas
+
+
+def collect_rows(
+    table: pa.Table,
+    positions: np.ndarray,
+    feature_engineering_config: Dict[str, Any],
+    chunk_rows: int,
+    extract_dates: Callable[[pd.DataFrame], pd.DataFrame],
+) -> tuple[pd.DataFrame, list[str]]:
+    """Строки выборки с обработанными датами и признаками; второй элемент — сгенерированные признаки."""
+    if window_columns(table, feature_engineering_config or {}) is None:
+        rows = extract_dates(table.take(positions).to_pandas())
+        return rows, []
+
+    parts = []
+    generated: list[str] = []
+    for chunk_positions, prepared, generated in iter_feature_chunks(
+        table, feature_engineering_config, chunk_rows, extract_dates
+    ):
+        parts.append(prepared[np.isin(chunk_positions, positions, assume_unique=True)])
+    return pd.concat(parts), generated
+
+
+def fit_incremental(preprocessor, detector, chunks: Iterable[pd.DataFrame], n_chunks: int, random_state: int = 42) -> int:
+    """
+    Обучает детектор по частям на уже обученном препроцессоре; возвращает число использованных строк.
+    IsolationForest получает около INCREMENTAL_TREES деревьев, поровну на каждую часть.
+    """
+    rng = np.random.default_rng(random_state)
+    trees_per_chunk = max(1, math.ceil(INCREMENTAL_TREES / max(n_chunks, 1)))
+    rows = 0
+    for chunk in chunks:
+        X = preprocessor.transform(chunk)
+        if isinstance(detector, IsolationForest):
+            if X.shape[0] < ISOLATION_TREE_SAMPLES and hasattr(detector, "estimators_"):
+                continue  # хвост файла
+            detector.set_params(warm_start=True, n_estimators=len(getattr(detector, "estimators_", [])) + trees_per_chunk)
+            detector.fit(X)
+        else:
+            # Части идут в порядке времени или файла, внутри части строки перемешиваются для SGD
+            detector.partial_fit(X[rng.permutation(X.shape[0])])
+        rows += X.shape[0]
+    return rows
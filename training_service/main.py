@@ -3,17 +3,27 @@ import joblib
 import json
 import os
 import io
+import time
+import asyncio
+import numpy as np
 from fastapi import FastAPI, HTTPException, Body
 from pydantic import BaseModel, Field
-from typing import List, Dict, Any
-from sqlalchemy import create_engine, Column, String, LargeBinary, Text
-from sqlalchemy.orm import declarative_base, sessionmaker
-import requests
+from typing import List, Dict, Any, Callable
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from ml_common.datasets import load_dataset
+from ml_common.feature_chunks import iter_feature_chunks, open_feature_table
+from ml_common.encoders import FrequencyEncoder, HashingEncoder
+from ml_common.features import generate_features
+from ml_common import model_registry
+from training_jobs import JobStateError, TrainingJobManager
+from large_training import SAMPLING_METHODS, collect_rows, fit_incremental, sample_positions
 
 from sklearn.preprocessing import StandardScaler, OneHotEncoder
 from sklearn.compose import ColumnTransformer
 from sklearn.pipeline import Pipeline
 from sklearn.ensemble import IsolationForest
+from sklearn.linear_model import SGDOneClassSVM
 from sklearn.neighbors import LocalOutlierFactor
 from sklearn.svm import OneClassSVM
 
@@ -21,44 +31,48 @@ app = FastAPI(title="Model Training Service")
 
 # --- Директории ---
 UPLOAD_DIR = "/app/uploads"
-MODELS_DIR = "/app/models"
+MODELS_DIR = os.getenv("MODELS_DIR", "/app/models")
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 os.makedirs(MODELS_DIR, exist_ok=True)
-FILE_SERVICE_URL = os.getenv("FILE_SERVICE_URL", "http://file_service:8000")
-CSV_ENCODINGS = ("utf-8", "utf-8-sig", "cp1251", "windows-1251")
 
-
-def read_dataset(file_path: str, **kwargs) -> pd.DataFrame:
-    extension = os.path.splitext(file_path)[1].lower()
-    if extension in {".xlsx", ".xls"}:
-        return pd.read_excel(file_path, **kwargs)
-
-    last_error: Exception | None = None
-    for encoding in CSV_ENCODINGS:
-        try:
-            return pd.read_csv(file_path, encoding=encoding, **kwargs)
-        except UnicodeDecodeError as exc:
-            last_error = exc
-
-    try:
-        return pd.read_csv(file_path, encoding="latin1", **kwargs)
-    except Exception as exc:
-        raise last_error or exc
+# --- Задачи обучения (training_jobs.py) ---
+# Сколько моделей обучается одновременно, каждая в своем процессе; остальные ждут в очереди
+TRAINING_MAX_WORKERS = int(os.getenv("TRAINING_MAX_WORKERS", "1"))
+# Как часто /train_anomaly_detector/ проверяет, завершилась ли его задача
+TRAINING_JOB_POLL_SECONDS = 0.5
+MODEL_TYPES = ("IsolationForest", "LocalOutlierFactor", "OneClassSVM", "SGDOneClassSVM")
+
+# --- Большие датасеты (large_training.py) ---
+# Предел строк для алгоритмов, которые не обучаются на всем файле: ядровой OneClassSVM — O(n²),
+# LocalOutlierFactor хранит выборку для поиска соседей. Запрос может задать свой max_samples.
+DEFAULT_MAX_SAMPLES = {"OneClassSVM": 20_000, "LocalOutlierFactor": 200_000}
+# Алгоритмы, которые умеют обучаться по частям файла; SGDOneClassSVM — только так
+INCREMENTAL_MODEL_TYPES = ("IsolationForest", "SGDOneClassSVM")
+# Размер части файла при обучении по частям и генерации оконных признаков для выборки
+TRAINING_CHUNK_ROWS = int(os.getenv("TRAINING_CHUNK_ROWS", "200000"))
+# На скольких строках обучается препроцессор при обучении по частям, если max_samples не задан
+INCREMENTAL_PREPROCESSOR_ROWS = 100_000
+
+# --- Категориальные признаки (ml_common/encoders.py) ---
+CATEGORICAL_ENCODINGS = ("onehot", "frequency", "hashing")
+# onehot: не больше стольких колонок на признак, редкие значения объединяются в одну колонку «прочие»
+MAX_CATEGORIES = 50
+# hashing: колонок на все категориальные признаки вместе
+HASHING_FEATURES = 256
+# Сколько самых частых значений колонки сохраняется в categorical_values конфига
+MAX_PERSISTED_CATEGORICAL_VALUES = 100
+# Препроцессор отдает этим детекторам разреженную матрицу, если ее дает кодировщик;
+# LocalOutlierFactor ищет соседей по деревьям, которым нужна плотная
+SPARSE_MODEL_TYPES = ("OneClassSVM", "SGDOneClassSVM")
 
 # --- Хранилище моделей ---
 # Render services do not share a local filesystem.
-# If DATABASE_URL is set, models/configs are stored in Postgres (Neon).
+# If DATABASE_URL is set, models/configs are stored in Postgres (Neon)
+# as immutable versions in the model registry (ml_common/model_registry.py).
 DATABASE_URL = os.getenv("DATABASE_URL")
 USE_DB_STORAGE = bool(DATABASE_URL)
-
-Base = declarative_base()
-
-
-class ModelArtifact(Base):
-    __tablename__ = "model_artifacts"
-    model_name = Column(String, primary_key=True, index=True)
-    model_blob = Column(LargeBinary, nullable=False)
-    config_json = Column(Text, nullable=False)
+# Сколько строк обучающей выборки оценивать для метрик версии модели
+METRICS_SAMPLE_ROWS = 10000
 
 
 engine = create_engine(DATABASE_URL, pool_pre_ping=True) if USE_DB_STORAGE else None
@@ -68,52 +82,40 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine) if U
 @app.on_event("startup")
 def on_startup():
     if USE_DB_STORAGE:
-        Base.metadata.create_all(bind=engine)
+        model_registry.create_tables(engine)
+        model_registry.import_legacy_artifacts(engine)
 
 
-def _save_model_artifact(model_name: str, model_pipeline: Pipeline, config_json: str) -> None:
+def _save_model_artifact(model_name: str, model_pipeline: Pipeline, config_json: str, metrics: Dict[str, Any]) -> int | None:
+    """Публикует новую версию модели в реестре и делает ее активной; возвращает номер версии."""
     if not USE_DB_STORAGE:
-        return
+        return None
     buffer = io.BytesIO()
     joblib.dump(model_pipeline, buffer)
     model_bytes = buffer.getvalue()
 
     db = SessionLocal()
     try:
-        artifact = db.get(ModelArtifact, model_name)
-        if artifact is None:
-            artifact = ModelArtifact(
-                model_name=model_name,
-                model_blob=model_bytes,
-                config_json=config_json,
-            )
-            db.add(artifact)
-        else:
-            artifact.model_blob = model_bytes
-            artifact.config_json = config_json
+        model_version = model_registry.publish_version(db, model_name, model_bytes, config_json, metrics)
         db.commit()
+        return model_version.version
     finally:
         db.close()
 
 
-def _ensure_uploaded_file(filename: str) -> str:
-    file_path = os.path.join(UPLOAD_DIR, filename)
-    if os.path.exists(file_path):
-        return file_path
-
-    try:
-        response = requests.get(f"{FILE_SERVICE_URL}/download/{filename}", timeout=120, stream=True)
-        if response.status_code == 404:
-            raise HTTPException(status_code=404, detail=f"Файл '{filename}' не найден.")
-        response.raise_for_status()
-
-        with open(file_path, "wb") as f:
-            for chunk in response.iter_content(chunk_size=1024 * 1024):
-                if chunk:
-                    f.write(chunk)
-        return file_path
-    except requests.RequestException as e:
-        raise HTTPException(status_code=502, detail=f"Не удалось получить файл '{filename}' из file_service: {e}")
+def _training_metrics(model_pipeline: Pipeline, X: pd.DataFrame, fit_seconds: float) -> Dict[str, Any]:
+    """Сводка по обучению для реестра: размер выборки и распределение оценок на ее подвыборке."""
+    sample = X.sample(n=METRICS_SAMPLE_ROWS, random_state=42) if len(X) > METRICS_SAMPLE_ROWS else X
+    scores = model_pipeline.decision_function(sample)
+    return {
+        "n_samples": int(len(X)),
+        "n_features": int(X.shape[1]),
+        "fit_seconds": round(fit_seconds, 3),
+        "score_mean": float(np.mean(scores)),
+        "score_p01": float(np.quantile(scores, 0.01)),
+        "score_p50": float(np.quantile(scores, 0.5)),
+        "anomaly_rate": float(np.mean(scores < 0)),
+    }
 
 
 # --- Pydantic Модели ---
@@ -122,7 +124,7 @@ class TrainingRequest(BaseModel):
     model_name: str
     model_type: str = Field(
         "IsolationForest",
-        description="Тип модели: IsolationForest, LocalOutlierFactor или OneClassSVM"
+        description="Тип модели: IsolationForest, LocalOutlierFactor, OneClassSVM или SGDOneClassSVM"
     )
     numerical_features: List[str]
     categorical_features: List[str]
@@ -131,6 +133,14 @@ class TrainingRequest(BaseModel):
     card_id_column: str | None = Field(None)
     timestamp_column: str | None = Field(None)
     amount_column: str | None = Field(None)
+    max_samples: int | None = Field(None, ge=1, description="Обучать на выборке из стольких строк")
+    sampling: str = Field("random", description="Выборка: random (равномерная) или stratified")
+    stratify_column: str | None = Field(None, description="Колонка, доли значений которой сохраняет stratified")
+    incremental: bool = Field(False, description="Обучать детектор по частям файла (IsolationForest, SGDOneClassSVM)")
+    chunk_rows: int | None = Field(None, ge=1000, description="Строк в части файла")
+    categorical_encoding: str = Field("onehot", description="Кодирование категорий: onehot, frequency или hashing")
+    max_categories: int | None = Field(None, ge=2, description="onehot: колонок на признак, включая «прочие»")
+    hashing_features: int | None = Field(None, ge=8, description="hashing: колонок на все категориальные признаки")
 
 
 class ModelConfig(BaseModel):
@@ -140,9 +150,14 @@ class ModelConfig(BaseModel):
     categorical_features: List[str]
     date_features: List[str]
     categorical_values: Dict[str, List[Any]]
+    # Число уникальных значений колонки; больше len(categorical_values[col]) — список урезан до самых частых
+    categorical_cardinality: Dict[str, int] = {}
+    categorical_encoding: str = "onehot"
     generated_date_features: List[str]
     generated_eng_features: List[str]
     feature_engineering_config: Dict[str, Any]
+    # Статистики обучающих данных для онлайн-признаков в prediction_service
+    feature_engineering_stats: Dict[str, float] = {}
 
 
 # --- Вспомогательные функции date_feature_extractor ---
@@ -162,70 +177,6 @@ def date_feature_extractor(df: pd.DataFrame, date_features: List[str]) -> (pd.Da
     return df_processed, generated_features
 
 
-# --- Автоматическое создание признаков ---
-def generate_features(df: pd.DataFrame, config: Dict[str, Any]) -> (pd.DataFrame, List[str]):
-    df_eng = df.copy()
-    generated_eng_features = []
-
-    card_col = config.get("card_id_column")
-    ts_col = config.get("timestamp_column")
-    amt_col = config.get("amount_column")
-
-    required_cols_present = all(col in df_eng.columns for col in [card_col, ts_col, amt_col] if col)
-
-    if not required_cols_present:
-        print("Warning: Недостаточно колонок для Feature Engineering.")
-        return df_eng, generated_eng_features
-
-    try:
-        # --- Преобразования ---
-        df_eng[ts_col] = pd.to_datetime(df_eng[ts_col])
-        df_eng = df_eng.sort_values(by=[card_col, ts_col])  # Сортировка обязательна!
-
-        # --- 1. Признаки времени суток ---
-        hour_cols = [col for col in df_eng.columns if col.endswith('_hour')]
-        if hour_cols:
-            hour_col = hour_cols[0]
-            df_eng['is_night'] = df_eng[hour_col].apply(lambda x: 1 if (x >= 22 or x <= 6) else 0)
-            generated_eng_features.append('is_night')
-
-        # --- 2. Агрегация за последний час (rolling) ---
-        rolling_window_1h = df_eng.groupby(card_col, group_keys=False)[amt_col].rolling('1H', on=ts_col, closed='left')
-        df_eng['card_tx_count_1h'] = rolling_window_1h.count().reset_index(level=0, drop=True).fillna(0).astype(int)
-        generated_eng_features.append('card_tx_count_1h')
-        df_eng['card_tx_amount_sum_1h'] = rolling_window_1h.sum().reset_index(level=0, drop=True).fillna(0)
-        generated_eng_features.append('card_tx_amount_sum_1h')
-
-        # --- 3. Время с последней транзакции по карте ---
-        df_eng['time_since_last_tx_card'] = df_eng.groupby(card_col)[ts_col].diff().dt.total_seconds()
-        df_eng['time_since_last_tx_card'] = df_eng['time_since_last_tx_card'].fillna(86400)
-        generated_eng_features.append('time_since_last_tx_card')
-
-        # --- 4. Отклонение от среднего по карте за окно ---
-        rolling_window_24h_avg = df_eng.groupby(card_col, group_keys=False)[amt_col].rolling(
-            '24H', on=ts_col, closed='left'
-        ).mean()
-        df_eng['card_tx_amount_avg_24h'] = rolling_window_24h_avg.reset_index(level=0, drop=True)
-        df_eng['card_tx_amount_avg_24h'] = df_eng['card_tx_amount_avg_24h'].fillna(df_eng[amt_col].mean())
-
-        # Рассчитываем отклонение
-        df_eng['amount_deviation_from_card_avg'] = df_eng[amt_col] - df_eng['card_tx_amount_avg_24h']
-        generated_eng_features.append('amount_deviation_from_card_avg')
-
-        # Удаляем вспомогательную колонку среднего
-        df_eng = df_eng.drop(columns=['card_tx_amount_avg_24h'], errors='ignore')
-
-        print(f"Сгенерированы признаки (training): {generated_eng_features}")
-
-    except Exception as e:
-        print(f"Ошибка во время генерации признаков (training): {e}")
-        import traceback
-        traceback.print_exc()
-        return df.copy(), []
-
-    return df_eng, generated_eng_features
-
-
 def _normalize_numeric_series(series: pd.Series) -> pd.Series:
     if pd.api.types.is_numeric_dtype(series):
         return pd.to_numeric(series, errors="coerce")
@@ -290,30 +241,115 @@ def validate_and_prepare_features(
     return prepared
 
 
-# --- Эндпоинт обучения ---
-@app.post("/train_anomaly_detector/")
-async def train_anomaly_detector(request: TrainingRequest):
-    file_path = _ensure_uploaded_file(request.filename)
+def _replace_file(path: str, write) -> None:
+    """Пишет файл рядом и подменяет атомарно: prediction_service не прочитает его наполовину."""
+    tmp_path = f"{path}.tmp"
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def _check_training_request(request: TrainingRequest) -> None:
+    """Проверки, которые не требуют датасета: ошибка возвращается сразу, до постановки в очередь."""
+    if request.model_type not in MODEL_TYPES:
+        raise HTTPException(status_code=400, detail=f"Неизвестный тип модели: {request.model_type}")
+    if request.enable_feature_engineering and not all(
+        [request.card_id_column, request.timestamp_column, request.amount_column]
+    ):
+        raise HTTPException(status_code=400,
+                            detail="Для Feature Engineering необходимо указать колонки card_id, timestamp и amount.")
+    if request.sampling not in SAMPLING_METHODS:
+        raise HTTPException(status_code=400, detail=f"Неизвестный способ выборки: {request.sampling}")
+    if request.sampling == "stratified" and not request.stratify_column:
+        raise HTTPException(status_code=400, detail="Для stratified-выборки необходимо указать stratify_column.")
+    if request.incremental and request.model_type not in INCREMENTAL_MODEL_TYPES:
+        raise HTTPException(status_code=400,
+                            detail=f"Обучение по частям поддерживают только {', '.join(INCREMENTAL_MODEL_TYPES)}.")
+    if request.categorical_encoding not in CATEGORICAL_ENCODINGS:
+        raise HTTPException(status_code=400,
+                            detail=f"Неизвестное кодирование категорий: {request.categorical_encoding}")
+
+
+def _categorical_transformer(request: TrainingRequest):
+    """Кодировщик категорий: число колонок ограничено при любой кардинальности признака."""
+    if request.categorical_encoding == "frequency":
+        return Pipeline(steps=[('frequency', FrequencyEncoder()), ('scaler', StandardScaler())])
+    if request.categorical_encoding == "hashing":
+        return HashingEncoder(n_features=request.hashing_features or HASHING_FEATURES)
+    # Незнакомое при предсказании значение попадает в «прочие», если такая колонка есть
+    return OneHotEncoder(max_categories=request.max_categories or MAX_CATEGORIES,
+                         handle_unknown='infrequent_if_exist')
+
+
+# --- Обучение ---
+def run_training(params: Dict[str, Any], report: Callable[[str], None]) -> Dict[str, Any]:
+    """
+    Обучает и сохраняет модель по параметрам TrainingRequest. Выполняется в процессе задачи
+    (training_jobs.py); report(stage) отмечает начало этапов load, feature_engineering, fit и save.
+    """
+    request = TrainingRequest(**params)
+    _check_training_request(request)
+
+    report("load")
+    # Читаем только колонки, которые участвуют в обучении
+    dataset_columns = [
+        *request.numerical_features,
+        *request.categorical_features,
+        *request.date_features,
+        *[column for column in (request.card_id_column, request.timestamp_column, request.amount_column) if column],
+        *([request.stratify_column] if request.stratify_column else []),
+    ]
+    max_samples = request.max_samples or DEFAULT_MAX_SAMPLES.get(request.model_type)
+    incremental = request.incremental or request.model_type == "SGDOneClassSVM"
+    chunk_rows = request.chunk_rows or TRAINING_CHUNK_ROWS
+    table = None
+    df = None
+    if max_samples or incremental:
+        # Файл не загружается целиком: выборка и части читаются из Arrow-копии
+        table = open_feature_table(request.filename, dataset_columns)
+    else:
+        df = load_dataset(request.filename, columns=dataset_columns)
 
     try:
-        df = read_dataset(file_path)
-
-        # 1. Обработка дат
-        df_processed, generated_date_features = date_feature_extractor(df, request.date_features)
-
-        # 2. Генерация признаков
-        generated_eng_features = []
+        report("feature_engineering")
         feature_engineering_config = {}
+        feature_engineering_stats = {}
         if request.enable_feature_engineering:
-            if not all([request.card_id_column, request.timestamp_column, request.amount_column]):
-                raise HTTPException(status_code=400,
-                                    detail="Для Feature Engineering необходимо указать колонки card_id, timestamp и amount.")
             feature_engineering_config = {
                 "card_id_column": request.card_id_column,
                 "timestamp_column": request.timestamp_column,
                 "amount_column": request.amount_column
             }
-            df_processed, generated_eng_features = generate_features(df_processed, feature_engineering_config)
+
+        if table is None:
+            # 1. Обработка дат
+            df_processed, generated_date_features = date_feature_extractor(df, request.date_features)
+
+            # 2. Генерация признаков
+            generated_eng_features = []
+            if feature_engineering_config:
+                df_processed, generated_eng_features = generate_features(df_processed, feature_engineering_config)
+        else:
+            # 1-2. Даты и признаки по частям файла; остаются только строки выборки
+            generated_date_features = []
+
+            def extract_dates(chunk: pd.DataFrame) -> pd.DataFrame:
+                processed, generated = date_feature_extractor(chunk, request.date_features)
+                generated_date_features[:] = generated
+                return processed
+
+            positions = sample_positions(
+                table, max_samples or INCREMENTAL_PREPROCESSOR_ROWS, request.sampling, request.stratify_column
+            )
+            df_processed, generated_eng_features = collect_rows(
+                table, positions, feature_engineering_config, chunk_rows, extract_dates
+            )
+
+        if generated_eng_features:
+            # Среднее для карт без истории за сутки, как fillna в generate_features, — по всему файлу
+            amounts = df_processed[request.amount_column] if table is None else table.column(request.amount_column).to_pandas()
+            amount_mean = pd.to_numeric(amounts, errors="coerce").mean()
+            if pd.notna(amount_mean):
+                feature_engineering_stats["amount_mean"] = float(amount_mean)
 
         # Обновляем списки фичей
         final_numerical_features = request.numerical_features + generated_date_features + generated_eng_features
@@ -321,17 +357,33 @@ async def train_anomaly_detector(request: TrainingRequest):
         final_numerical_features = sorted(list(set(final_numerical_features)))
         final_categorical_features = sorted(list(set(final_categorical_features)))
 
-        # 3. Сбор уникальных категориальных значений
+        # 3. Сбор категориальных значений: в конфиг — только самые частые
         categorical_values = {}
+        categorical_cardinality = {}
+        warnings = []
         for col in final_categorical_features:
             if col in df_processed.columns:
-                categorical_values[col] = df_processed[col].astype(str).unique().tolist()
+                counts = df_processed[col].astype(str).value_counts()
+                categorical_values[col] = counts.index[:MAX_PERSISTED_CATEGORICAL_VALUES].tolist()
+                categorical_cardinality[col] = int(len(counts))
+                if len(counts) > MAX_PERSISTED_CATEGORICAL_VALUES:
+                    warnings.append(
+                        f"Колонка {col}: {len(counts)} уникальных значений, в конфиг сохранены "
+                        f"{MAX_PERSISTED_CATEGORICAL_VALUES} самых частых."
+                    )
+                max_categories = request.max_categories or MAX_CATEGORIES
+                if request.categorical_encoding == "onehot" and len(counts) > max_categories:
+                    warnings.append(
+                        f"Колонка {col}: значения реже {max_categories - 1} самых частых объединены в «прочие»."
+                    )
             else:
                 print(f"Warning: Категориальная колонка {col} не найдена после обработки.")
+        for warning in warnings:
+            print(f"Warning: {warning}")
 
         # 4. Создание препроцессора
         numeric_transformer = Pipeline(steps=[('scaler', StandardScaler())])
-        categorical_transformer = Pipeline(steps=[('onehot', OneHotEncoder(handle_unknown='ignore'))])
+        categorical_transformer = _categorical_transformer(request)
         actual_numerical = [f for f in final_numerical_features if f in df_processed.columns]
         actual_categorical = [f for f in final_categorical_features if f in df_processed.columns]
         df_processed = validate_and_prepare_features(df_processed, actual_numerical, actual_categorical)
@@ -342,7 +394,15 @@ async def train_anomaly_detector(request: TrainingRequest):
             transformers.append(('cat', categorical_transformer, actual_categorical))
         if not transformers:
             raise HTTPException(status_code=400, detail="Не удалось определить признаки для препроцессора.")
-        preprocessor = ColumnTransformer(transformers=transformers, remainder='drop')
+        # Разреженная матрица one-hot и hashing не уплотняется для SVM: строки с тысячами колонок
+        # занимают память по числу ненулевых значений
+        if request.model_type in SPARSE_MODEL_TYPES:
+            sparse_threshold = 1.0
+        elif request.model_type == "LocalOutlierFactor":
+            sparse_threshold = 0.0
+        else:
+            sparse_threshold = 0.3  # по умолчанию ColumnTransformer: по плотности матрицы
+        preprocessor = ColumnTransformer(transformers=transformers, remainder='drop', sparse_threshold=sparse_threshold)
 
         # 5. Выбор и инициализация модели
         if request.model_type == "IsolationForest":
@@ -352,7 +412,7 @@ async def train_anomaly_detector(request: TrainingRequest):
         elif request.model_type == "OneClassSVM":
             model_instance = OneClassSVM(nu=0.05, kernel="rbf", gamma='scale')
         else:
-            raise HTTPException(status_code=400, detail=f"Неизвестный тип модели: {request.model_type}")
+            model_instance = SGDOneClassSVM(nu=0.05, random_state=42)
 
         # 6. Создание и обучение полного пайплайна
         model_pipeline = Pipeline(steps=[
@@ -363,13 +423,31 @@ async def train_anomaly_detector(request: TrainingRequest):
         if not features_to_train_on:
             raise HTTPException(status_code=400, detail="Нет признаков для обучения после обработки.")
         X = df_processed[features_to_train_on]
-        model_pipeline.fit(X)
+        report("fit")
+        fit_started = time.perf_counter()
+        if incremental:
+            # Препроцессор — на выборке, детектор — на всех частях файла
+            preprocessor.fit(X)
+            chunks = (
+                validate_and_prepare_features(frame, actual_numerical, actual_categorical)[features_to_train_on]
+                for _, frame, _ in iter_feature_chunks(table, feature_engineering_config, chunk_rows, extract_dates)
+            )
+            n_chunks = len(range(0, table.num_rows, chunk_rows))
+            n_samples = fit_incremental(preprocessor, model_instance, chunks, n_chunks)
+        else:
+            model_pipeline.fit(X)
+            n_samples = len(X)
+        metrics = _training_metrics(model_pipeline, X, time.perf_counter() - fit_started)
+        metrics["n_samples"] = int(n_samples)
+        metrics["n_rows_total"] = int(len(X) if table is None else table.num_rows)
+        metrics["training_mode"] = "incremental" if incremental else "sample" if table is not None else "full"
 
         # 7. Сохранение модели и конфига
+        report("save")
         if not USE_DB_STORAGE:
             model_path = os.path.join(MODELS_DIR, f"{request.model_name}.joblib")
             config_path = os.path.join(MODELS_DIR, f"{request.model_name}.json")
-            joblib.dump(model_pipeline, model_path)
+            _replace_file(model_path, lambda path: joblib.dump(model_pipeline, path))
         config_data = ModelConfig(
             model_type='anomaly_detection',
             algorithm_class=request.model_type,
@@ -377,19 +455,31 @@ async def train_anomaly_detector(request: TrainingRequest):
             categorical_features=request.categorical_features,
             date_features=request.date_features,
             categorical_values=categorical_values,
+            categorical_cardinality=categorical_cardinality,
+            categorical_encoding=request.categorical_encoding,
             generated_date_features=generated_date_features,
             generated_eng_features=generated_eng_features,
-            feature_engineering_config=feature_engineering_config
+            feature_engineering_config=feature_engineering_config,
+            feature_engineering_stats=feature_engineering_stats
         )
         config_json = config_data.model_dump_json(indent=4)
 
+        version = None
         if USE_DB_STORAGE:
-            _save_model_artifact(request.model_name, model_pipeline, config_json)
+            version = _save_model_artifact(request.model_name, model_pipeline, config_json, metrics)
         else:
-            with open(config_path, 'w') as f:
-                f.write(config_json)
-
-        return {"message": f"Модель '{request.model_name}' ({request.model_type}) успешно обучена и сохранена."}
+            def write_config(path: str) -> None:
+                with open(path, 'w') as f:
+                    f.write(config_json)
+            _replace_file(config_path, write_config)
+
+        return {
+            "message": f"Модель '{request.model_name}' ({request.model_type}) успешно обучена и сохранена.",
+            "model_name": request.model_name,
+            "version": version,
+            "metrics": metrics,
+            "warnings": warnings,
+        }
 
     except HTTPException:
         raise
@@ -401,6 +491,62 @@ async def train_anomaly_detector(request: TrainingRequest):
         raise HTTPException(status_code=500, detail=f"Ошибка при обучении: {str(e)}")
 
 
+# --- Задачи обучения ---
+training_jobs = TrainingJobManager(run_training, max_workers=TRAINING_MAX_WORKERS)
+
+
+@app.on_event("shutdown")
+def on_shutdown():
+    training_jobs.shutdown()
+
+
+def _get_job(job_id: str) -> Dict[str, Any]:
+    try:
+        return training_jobs.get(job_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Задача обучения '{job_id}' не найдена.")
+
+
+@app.post("/jobs/train", status_code=202)
+async def submit_training_job(request: TrainingRequest):
+    _check_training_request(request)
+    return training_jobs.submit(request.model_dump())
+
+
+@app.get("/jobs/")
+async def list_training_jobs():
+    return {"jobs": training_jobs.list(), **training_jobs.stats()}
+
+
+@app.get("/jobs/{job_id}")
+async def get_training_job(job_id: str):
+    return _get_job(job_id)
+
+
+@app.post("/jobs/{job_id}/cancel")
+async def cancel_training_job(job_id: str):
+    _get_job(job_id)
+    try:
+        return training_jobs.cancel(job_id)
+    except JobStateError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@app.post("/train_anomaly_detector/")
+async def train_anomaly_detector(request: TrainingRequest):
+    """Прежний синхронный контракт: ставит задачу в очередь и ждет ее завершения."""
+    _check_training_request(request)
+    job_id = training_jobs.submit(request.model_dump())["job_id"]
+    while not training_jobs.is_finished(job_id):
+        await asyncio.sleep(TRAINING_JOB_POLL_SECONDS)
+    job = training_jobs.get(job_id)
+    if job["status"] == "succeeded":
+        return job["result"]
+    if job["status"] == "cancelled":
+        raise HTTPException(status_code=409, detail=f"Задача обучения '{job_id}' отменена.")
+    raise HTTPException(status_code=job["error"]["status_code"], detail=job["error"]["detail"])
+
+
 # --- Эндпоинты /models/ и /models/{model_name}/config ---
 @app.get("/models/", response_model=Dict[str, List[str]])
 async def get_models():
@@ -408,7 +554,7 @@ async def get_models():
         if USE_DB_STORAGE:
             db = SessionLocal()
             try:
-                model_names = [row[0] for row in db.query(ModelArtifact.model_name).all()]
+                model_names = model_registry.list_models(db)
             finally:
                 db.close()
         else:
@@ -425,10 +571,10 @@ async def get_model_config(model_name: str):
         if USE_DB_STORAGE:
             db = SessionLocal()
             try:
-                artifact = db.get(ModelArtifact, model_name)
-                if artifact is None:
+                config_json = model_registry.active_config_json(db, model_name)
+                if config_json is None:
                     raise HTTPException(status_code=404, detail=f"Конфиг для модели '{model_name}' не найден.")
-                config = json.loads(artifact.config_json)
+                config = json.loads(config_json)
             finally:
                 db.close()
         else:
@@ -444,3 +590,32 @@ async def get_model_config(model_name: str):
         raise HTTPException(status_code=500, detail=f"Ошибка при чтении конфига: {e}")
 
 
+# --- Версии моделей (только при хранении в Postgres) ---
+@app.get("/models/{model_name}/versions")
+async def get_model_versions(model_name: str):
+    if not USE_DB_STORAGE:
+        raise HTTPException(status_code=400, detail="Версии моделей хранятся только в Postgres (DATABASE_URL).")
+    db = SessionLocal()
+    try:
+        versions = model_registry.list_versions(db, model_name)
+    finally:
+        db.close()
+    if not versions:
+        raise HTTPException(status_code=404, detail=f"Модель '{model_name}' не найдена.")
+    return {"model_name": model_name, "versions": versions}
+
+
+@app.post("/models/{model_name}/versions/{version}/activate")
+async def activate_model_version(model_name: str, version: int):
+    if not USE_DB_STORAGE:
+        raise HTTPException(status_code=400, detail="Версии моделей хранятся только в Postgres (DATABASE_URL).")
+    db = SessionLocal()
+    try:
+        model_registry.activate_version(db, model_name, version)
+        db.commit()
+    except KeyError:
+        db.rollback()
+        raise HTTPException(status_code=404, detail=f"Версия {version} модели '{model_name}' не найдена.")
+    finally:
+        db.close()
+    return {"model_name": model_name, "active_version": version}
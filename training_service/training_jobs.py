@@ -0,0 +1,231 @@
+"""
+Очередь задач обучения training_service.
+
+Обучение (чтение датасета, признаки, fit, сохранение) выполняется не в обработчике
+запроса, а в отдельном процессе, поэтому event loop сервиса свободен и /models/
+отвечает во время обучения. Одновременно выполняется не больше max_workers задач,
+остальные ждут в очереди. Процесс сообщает о смене этапа через pipe, а отмена
+выполняемой задачи завершает ее процесс: fit в sklearn нельзя прервать изнутри.
+На этапе сохранения задача не отменяется, чтобы модель и конфиг не разошлись: процесс
+блокирует SIGTERM до того, как сообщить о сохранении, поэтому terminate(), отправленный
+до прихода этапа save к родителю, тоже не прервет запись — задача завершится успешно.
+
+Задачи хранятся в памяти процесса сервиса и не переживают перезапуск.
+"""
+import datetime
+import multiprocessing
+import signal
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List
+
+STAGES = ("load", "feature_engineering", "fit", "save")
+FINISHED_STATUSES = ("succeeded", "failed", "cancelled")
+
+
+class JobStateError(Exception):
+    """Действие недопустимо в текущем состоянии задачи."""
+
+
+def _iso(timestamp: float | None) -> str | None:
+    if timestamp is None:
+        return None
+    return datetime.datetime.fromtimestamp(timestamp, tz=datetime.timezone.utc).isoformat()
+
+
+@dataclass
+class Job:
+    id: str
+    params: Dict[str, Any]
+    created_at: float
+    status: str = "queued"
+    stage: str | None = None
+    stage_times: Dict[str, float] = field(default_factory=dict)
+    started_at: float | None = None
+    finished_at: float | None = None
+    result: Dict[str, Any] | None = None
+    error: Dict[str, Any] | None = None
+    process: Any = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        if self.status == "succeeded":
+            progress = 1.0
+        elif self.stage in STAGES:
+            progress = STAGES.index(self.stage) / len(STAGES)
+        else:
+            progress = 0.0
+        end = self.finished_at or time.time()
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "stage": self.stage,
+            "stages": list(STAGES),
+            "progress": round(progress, 3),
+            "model_name": self.params.get("model_name"),
+            "model_type": self.params.get("model_type"),
+            "filename": self.params.get("filename"),
+            "created_at": _iso(self.created_at),
+            "started_at": _iso(self.started_at),
+            "finished_at": _iso(self.finished_at),
+            "duration_seconds": round(end - self.started_at, 3) if self.started_at else None,
+            "stage_started_at": {stage: _iso(ts) for stage, ts in self.stage_times.items()},
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+def _run_in_worker(target: Callable, params: Dict[str, Any], conn) -> None:
+    """Точка входа процесса обучения: этапы и итог уходят родителю через conn."""
+    def report(stage: str) -> None:
+        if stage == "save":
+            # До конца процесса: отмена во время записи модели и конфига откладывается,
+            # а после отправки итога процесс завершается сам
+            signal.pthread_sigmask(signal.SIG_BLOCK, {signal.SIGTERM})
+        conn.send(("stage", stage))
+
+    try:
+        result = target(params, report)
+        conn.send(("result", result))
+    except Exception as e:
+        # HTTPException сериализуется как статус и текст: так же ответил бы синхронный эндпоинт
+        conn.send(("error", {"status_code": getattr(e, "status_code", 500), "detail": getattr(e, "detail", str(e))}))
+    finally:
+        conn.close()
+
+
+class TrainingJobManager:
+    def __init__(
+        self,
+        target: Callable[[Dict[str, Any], Callable[[str], None]], Dict[str, Any]],
+        max_workers: int = 1,
+        history_limit: int = 100,
+        start_method: str = "spawn",
+    ) -> None:
+        """
+        target(params, report) выполняется в отдельном процессе и должен импортироваться по имени;
+        report(stage) сообщает о начале этапа.
+        """
+        self._target = target
+        self.max_workers = max(max_workers, 1)
+        self.history_limit = history_limit
+        # spawn: процесс не наследует потоки и соединения с БД сервиса
+        self._context = multiprocessing.get_context(start_method)
+        self._jobs: OrderedDict[str, Job] = OrderedDict()
+        self._queue: deque[str] = deque()
+        self._running = 0
+        self._lock = threading.Lock()
+
+    def submit(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        job = Job(id=uuid.uuid4().hex, params=params, created_at=time.time())
+        with self._lock:
+            self._jobs[job.id] = job
+            self._queue.append(job.id)
+            self._trim_history()
+        self._dispatch()
+        return self.get(job.id)
+
+    def get(self, job_id: str) -> Dict[str, Any]:
+        """Состояние задачи; KeyError, если задачи нет."""
+        with self._lock:
+            job = self._jobs[job_id]
+            state = job.to_dict()
+            if job.status == "queued":
+                state["queue_position"] = self._queue.index(job_id) + 1
+            return state
+
+    def list(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [job.to_dict() for job in reversed(self._jobs.values())]
+
+    def is_finished(self, job_id: str) -> bool:
+        with self._lock:
+            return self._jobs[job_id].status in FINISHED_STATUSES
+
+    def cancel(self, job_id: str) -> Dict[str, Any]:
+        """Отменяет задачу в очереди или завершает ее процесс; KeyError, если задачи нет."""
+        with self._lock:
+            job = self._jobs[job_id]
+            if job.status == "queued":
+                self._queue.remove(job_id)
+                job.status = "cancelled"
+                job.finished_at = time.time()
+            elif job.status == "running":
+                if job.stage == "save":
+                    raise JobStateError("Модель уже сохраняется, отменить обучение нельзя.")
+                job.status = "cancelled"
+                job.process.terminate()
+        return self.get(job_id)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            statuses: Dict[str, int] = {}
+            for job in self._jobs.values():
+                statuses[job.status] = statuses.get(job.status, 0) + 1
+            return {"max_workers": self.max_workers, "running": self._running, "queued": len(self._queue), "statuses": statuses}
+
+    def shutdown(self) -> None:
+        with self._lock:
+            self._queue.clear()
+            processes = [job.process for job in self._jobs.values() if job.process is not None]
+        for process in processes:
+            process.terminate()
+
+    def _dispatch(self) -> None:
+        with self._lock:
+            while self._running < self.max_workers and self._queue:
+                job = self._jobs[self._queue.popleft()]
+                receiver, sender = self._context.Pipe(duplex=False)
+                job.process = self._context.Process(
+                    target=_run_in_worker,
+                    args=(self._target, job.params, sender),
+                    name=f"training-job-{job.id[:8]}",
+                )
+                job.status = "running"
+                job.started_at = time.time()
+                self._running += 1
+                job.process.start()
+                sender.close()
+                threading.Thread(target=self._watch, args=(job, receiver), name=f"watch-{job.id[:8]}", daemon=True).start()
+
+    def _watch(self, job: Job, receiver) -> None:
+        outcome = None
+        try:
+            while True:
+                try:
+                    kind, payload = receiver.recv()
+                except (EOFError, OSError):
+                    break  # процесс завершился или был остановлен
+                if kind == "stage":
+                    with self._lock:
+                        job.stage = payload
+                        job.stage_times[payload] = time.time()
+                else:
+                    outcome = (kind, payload)
+        finally:
+            receiver.close()
+        job.process.join()
+
+        with self._lock:
+            if outcome is not None and outcome[0] == "result":
+                # Модель уже сохранена, даже если отмена пришла в последний момент
+                job.status = "succeeded"
+                job.stage = "done"
+                job.result = outcome[1]
+            elif job.status != "cancelled":
+                job.status = "failed"
+                job.error = outcome[1] if outcome is not None else {
+                    "status_code": 500,
+                    "detail": f"Процесс обучения завершился с кодом {job.process.exitcode}.",
+                }
+            job.finished_at = time.time()
+            job.process = None
+            self._running -= 1
+        self._dispatch()
+
+    def _trim_history(self) -> None:
+        finished = [job_id for job_id, job in self._jobs.items() if job.status in FINISHED_STATUSES]
+        for job_id in finished[: max(len(finished) - self.history_limit, 0)]:
+            del self._jobs[job_id]
@@ -8,31 +8,24 @@ import {
   fetchLegacyModelConfig,
   fetchLegacyModels,
   predictLegacyRow,
-  scoreLegacyFile,
+  streamLegacyFileScores,
 } from "@/lib/legacy-api";
 import type {
   LegacyModelConfig,
   LegacyPredictionResponse,
-  LegacyScoreFileResponse,
+  LegacyScoreFileProgress,
+  LegacyScoreFileStreamResult,
 } from "@/lib/legacy-types";
 import { useSessionContext } from "@/lib/use-session-context";
 
-function scoreStats(scores: number[]) {
-  if (scores.length === 0) {
-    return { count: 0, min: 0, max: 0, mean: 0, anomalies: 0 };
+function histogramBars(counts: number[], buckets = 25) {
+  const size = Math.max(1, Math.ceil(counts.length / buckets));
+  const bars: number[] = [];
+  for (let index = 0; index < counts.length; index += size) {
+    bars.push(counts.slice(index, index + size).reduce((sum, count) => sum + count, 0));
   }
-  const min = Math.min(...scores);
-  const max = Math.max(...scores);
-  const mean = scores.reduce((sum, score) => sum + score, 0) / scores.length;
-  const anomalies = scores.filter((score) => score < 0).length;
-  return { count: scores.length, min, max, mean, anomalies };
-}
-
-function normalizeScore(score: number, min: number, max: number) {
-  if (max === min) {
-    return 50;
-  }
-  return Math.max(8, Math.min(100, ((score - min) / (max - min)) * 100));
+  const peak = Math.max(1, ...bars);
+  return bars.map((count) => ({ count, height: Math.max(2, (count / peak) * 100) }));
 }
 
 export function LegacyPrediction() {
@@ -43,7 +36,8 @@ export function LegacyPrediction() {
   const [modelName, setModelName] = useState("");
   const [config, setConfig] = useState<LegacyModelConfig | null>(null);
   const [featureInputs, setFeatureInputs] = useState<Record<string, string>>({});
-  const [scoreResult, setScoreResult] = useState<LegacyScoreFileResponse | null>(null);
+  const [scoreResult, setScoreResult] = useState<LegacyScoreFileStreamResult | null>(null);
+  const [scoreProgress, setScoreProgress] = useState<LegacyScoreFileProgress | null>(null);
   const [prediction, setPrediction] = useState<LegacyPredictionResponse | null>(null);
   const [isScoring, setIsScoring] = useState(false);
   const [isPredicting, setIsPredicting] = useState(false);
@@ -110,7 +104,7 @@ export function LegacyPrediction() {
     void loadConfig();
   }, [modelName, onAuthFailure, session]);
 
-  const stats = useMemo(() => scoreStats(scoreResult?.scores ?? []), [scoreResult]);
+  const bars = useMemo(() => histogramBars(scoreResult?.summary.histogram?.counts ?? []), [scoreResult]);
 
   const handleScoreFile = async () => {
     if (!session || !modelName || !filename) {
@@ -118,8 +112,9 @@ export function LegacyPrediction() {
     }
     setIsScoring(true);
     setError(null);
+    setScoreProgress(null);
     try {
-      const result = await scoreLegacyFile(session, { model_name: modelName, filename });
+      const result = await streamLegacyFileScores(session, { model_name: modelName, filename }, setScoreProgress);
       setScoreResult(result);
     } catch (err) {
       if (err instanceof ApiError && err.status === 401) {
@@ -129,6 +124,7 @@ export function LegacyPrediction() {
       setError(err instanceof Error ? err.message : "Ошибка batch score.");
     } finally {
       setIsScoring(false);
+      setScoreProgress(null);
     }
   };
 
@@ -200,7 +196,11 @@ export function LegacyPrediction() {
           disabled={!modelName || !filename || isScoring}
           onClick={() => void handleScoreFile()}
         >
-          {isScoring ? "Скоринг..." : "Score file"}
+          {isScoring
+            ? scoreProgress?.stage === "uploading"
+              ? "Сохранение результата..."
+              : `Скоринг... ${scoreProgress ? Math.floor((scoreProgress.rows_done / Math.max(scoreProgress.rows, 1)) * 100) : 0}%`
+            : "Score file"}
         </button>
 
         {scoreResult ? (
@@ -208,11 +208,11 @@ export function LegacyPrediction() {
             <h3 className="text-xl font-semibold text-ink">Распределение anomaly score</h3>
             <div className="mt-4 grid gap-3 sm:grid-cols-5">
               {[
-                ["Count", stats.count],
-                ["Anomaly", stats.anomalies],
-                ["Min", stats.min.toFixed(3)],
-                ["Mean", stats.mean.toFixed(3)],
-                ["Max", stats.max.toFixed(3)],
+                ["Count", scoreResult.summary.count],
+                ["Anomaly", scoreResult.summary.anomalies ?? 0],
+                ["Min", (scoreResult.summary.min ?? 0).toFixed(3)],
+                ["Median", (scoreResult.summary.quantiles?.p50 ?? 0).toFixed(3)],
+                ["Max", (scoreResult.summary.max ?? 0).toFixed(3)],
               ].map(([label, value]) => (
                 <div key={label} className="rounded-2xl border border-line bg-panel p-3">
                   <p className="font-[family-name:var(--font-mono)] text-xs uppercase tracking-[0.2em] text-smoke">{label}</p>
@@ -220,20 +220,20 @@ export function LegacyPrediction() {
                 </div>
               ))}
             </div>
-            <div className="mt-5 space-y-2">
-              {scoreResult.scores.slice(0, 24).map((score, index) => (
-                <div key={`${score}-${index}`} className="flex items-center gap-3">
-                  <span className="w-10 font-[family-name:var(--font-mono)] text-xs text-smoke">#{index}</span>
-                  <div className="h-3 flex-1 overflow-hidden rounded-full bg-line">
-                    <div
-                      className={score < 0 ? "h-full rounded-full bg-ink" : "h-full rounded-full bg-smoke"}
-                      style={{ width: `${normalizeScore(score, stats.min, stats.max)}%` }}
-                    />
-                  </div>
-                  <span className="w-20 text-right font-[family-name:var(--font-mono)] text-xs text-smoke">{score.toFixed(4)}</span>
-                </div>
+            <div className="mt-5 flex h-32 items-end gap-1">
+              {bars.map((bar, index) => (
+                <div
+                  key={index}
+                  className="flex-1 rounded-t bg-ink"
+                  style={{ height: `${bar.height}%` }}
+                  title={String(bar.count)}
+                />
               ))}
             </div>
+            <p className="mt-4 text-sm text-smoke">
+              Оценки всех строк сохранены в файл{" "}
+              <span className="font-[family-name:var(--font-mono)] text-ink">{scoreResult.result_filename}</span>.
+            </p>
           </div>
         ) : null}
 
@@ -255,10 +255,27 @@ export function LegacyPrediction() {
               const categoricalOptions = config.categorical_values?.[feature] ?? [];
               const isDate = config.date_features.includes(feature);
               const isNumeric = config.numerical_features.includes(feature);
+              // В конфиге только самые частые значения колонки: остальные вводятся вручную
+              const isTruncated = (config.categorical_cardinality?.[feature] ?? 0) > categoricalOptions.length;
               return (
                 <label key={feature} className="block text-sm font-semibold text-ink">
                   {feature}
-                  {categoricalOptions.length > 0 ? (
+                  {categoricalOptions.length > 0 && isTruncated ? (
+                    <>
+                      <input
+                        className="input-field mt-2"
+                        list={`values-${feature}`}
+                        value={value}
+                        onChange={(event) => setFeatureInputs((current) => ({ ...current, [feature]: event.target.value }))}
+                        placeholder={`${categoricalOptions.length} самых частых из ${config.categorical_cardinality?.[feature]}`}
+                      />
+                      <datalist id={`values-${feature}`}>
+                        {categoricalOptions.map((option) => (
+                          <option key={option} value={option} />
+                        ))}
+                      </datalist>
+                    </>
+                  ) : categoricalOptions.length > 0 ? (
                     <select
                       className="input-field mt-2"
                       value={value}
@@ -4,15 +4,38 @@ import { useEffect, useState } from "react";
 
 import { ApiError } from "@/lib/api";
 import {
+  cancelLegacyTrainingJob,
   fetchLegacyColumns,
   fetchLegacyFiles,
   fetchLegacyModels,
-  trainLegacyAnomalyDetector,
+  fetchLegacyTrainingJob,
+  submitLegacyTrainingJob,
 } from "@/lib/legacy-api";
-import type { LegacyModelType, LegacyTrainPayload } from "@/lib/legacy-types";
+import type {
+  LegacyCategoricalEncoding,
+  LegacyModelType,
+  LegacyTrainingJob,
+  LegacyTrainingSampling,
+  LegacyTrainPayload,
+} from "@/lib/legacy-types";
 import { useSessionContext } from "@/lib/use-session-context";
 
-const modelTypes: LegacyModelType[] = ["IsolationForest", "LocalOutlierFactor", "OneClassSVM"];
+const modelTypes: LegacyModelType[] = ["IsolationForest", "LocalOutlierFactor", "OneClassSVM", "SGDOneClassSVM"];
+const jobPollIntervalMs = 1000;
+const stageLabels: Record<string, string> = {
+  load: "загрузка данных",
+  feature_engineering: "подготовка признаков",
+  fit: "обучение",
+  save: "сохранение",
+};
+
+function jobStatusLabel(job: LegacyTrainingJob | null): string {
+  if (!job || job.status === "queued") {
+    return job?.queue_position ? `В очереди (${job.queue_position})...` : "В очереди...";
+  }
+  const stage = job.stage ? stageLabels[job.stage] ?? job.stage : "запуск";
+  return `Обучение: ${stage} (${Math.round(job.progress * 100)}%)`;
+}
 
 function toggleValue(values: string[], value: string): string[] {
   return values.includes(value) ? values.filter((item) => item !== value) : [...values, value];
@@ -33,7 +56,14 @@ export function LegacyTrainModel() {
   const [cardIdColumn, setCardIdColumn] = useState("");
   const [timestampColumn, setTimestampColumn] = useState("");
   const [amountColumn, setAmountColumn] = useState("");
+  const [maxSamples, setMaxSamples] = useState("");
+  const [sampling, setSampling] = useState<LegacyTrainingSampling>("random");
+  const [stratifyColumn, setStratifyColumn] = useState("");
+  const [incremental, setIncremental] = useState(false);
+  const [categoricalEncoding, setCategoricalEncoding] = useState<LegacyCategoricalEncoding>("onehot");
+  const [maxCategories, setMaxCategories] = useState("");
   const [isLoading, setIsLoading] = useState(false);
+  const [job, setJob] = useState<LegacyTrainingJob | null>(null);
   const [message, setMessage] = useState<string | null>(null);
   const [error, setError] = useState<string | null>(null);
 
@@ -76,6 +106,7 @@ export function LegacyTrainModel() {
         setCardIdColumn(nextColumns[0] || "");
         setTimestampColumn(nextColumns[0] || "");
         setAmountColumn(nextColumns[0] || "");
+        setStratifyColumn(nextColumns[0] || "");
       } catch (err) {
         if (err instanceof ApiError && err.status === 401) {
           onAuthFailure();
@@ -105,6 +136,9 @@ export function LegacyTrainModel() {
         return "Timestamp-колонка должна быть отмечена как date feature.";
       }
     }
+    if (maxSamples && !(Number(maxSamples) >= 1)) {
+      return "Размер выборки должен быть положительным числом.";
+    }
     return null;
   };
 
@@ -129,16 +163,37 @@ export function LegacyTrainModel() {
       card_id_column: enableFeatureEngineering ? cardIdColumn : null,
       timestamp_column: enableFeatureEngineering ? timestampColumn : null,
       amount_column: enableFeatureEngineering ? amountColumn : null,
+      max_samples: maxSamples ? Number(maxSamples) : null,
+      sampling,
+      stratify_column: sampling === "stratified" ? stratifyColumn : null,
+      incremental: modelType === "IsolationForest" && incremental,
+      categorical_encoding: categoricalEncoding,
+      max_categories: categoricalEncoding === "onehot" && maxCategories ? Number(maxCategories) : null,
     };
 
     setIsLoading(true);
     setError(null);
     setMessage(null);
     try {
-      const result = await trainLegacyAnomalyDetector(session, payload);
-      setMessage(result.message);
-      const nextModels = await fetchLegacyModels(session);
-      setModels(nextModels.models);
+      let current = await submitLegacyTrainingJob(session, payload);
+      setJob(current);
+      while (current.status === "queued" || current.status === "running") {
+        await new Promise((resolve) => setTimeout(resolve, jobPollIntervalMs));
+        current = await fetchLegacyTrainingJob(session, current.job_id);
+        setJob(current);
+      }
+      if (current.status === "succeeded") {
+        setMessage(
+          [current.result?.message ?? `Модель '${current.model_name}' обучена.`, ...(current.result?.warnings ?? [])].join(" "),
+        );
+        const nextModels = await fetchLegacyModels(session);
+        setModels(nextModels.models);
+      } else if (current.status === "cancelled") {
+        setMessage("Обучение отменено.");
+      } else {
+        const detail = current.error?.detail;
+        setError(typeof detail === "string" ? detail : "Ошибка обучения модели.");
+      }
     } catch (err) {
       if (err instanceof ApiError && err.status === 401) {
         onAuthFailure();
@@ -147,6 +202,22 @@ export function LegacyTrainModel() {
       setError(err instanceof Error ? err.message : "Ошибка обучения модели.");
     } finally {
       setIsLoading(false);
+      setJob(null);
+    }
+  };
+
+  const handleCancel = async () => {
+    if (!session || !job) {
+      return;
+    }
+    try {
+      setJob(await cancelLegacyTrainingJob(session, job.job_id));
+    } catch (err) {
+      if (err instanceof ApiError && err.status === 401) {
+        onAuthFailure();
+        return;
+      }
+      setError(err instanceof Error ? err.message : "Не удалось отменить обучение.");
     }
   };
 
@@ -200,6 +271,69 @@ export function LegacyTrainModel() {
             />
             Включить feature engineering
           </label>
+          <label className="block text-sm font-semibold text-ink">
+            Размер выборки
+            <input
+              className="input-field mt-2"
+              inputMode="numeric"
+              value={maxSamples}
+              onChange={(event) => setMaxSamples(event.target.value.replace(/\D/g, ""))}
+              placeholder="по умолчанию: весь файл, для OneClassSVM и LOF — ограничен"
+            />
+          </label>
+          <label className="block text-sm font-semibold text-ink">
+            Выборка
+            <select
+              className="input-field mt-2"
+              value={sampling}
+              onChange={(event) => setSampling(event.target.value as LegacyTrainingSampling)}
+            >
+              <option value="random">Равномерная</option>
+              <option value="stratified">Стратифицированная</option>
+            </select>
+          </label>
+          {sampling === "stratified" ? (
+            <label className="block text-sm font-semibold text-ink">
+              Колонка стратификации
+              <select className="input-field mt-2" value={stratifyColumn} onChange={(event) => setStratifyColumn(event.target.value)}>
+                {columns.map((column) => (
+                  <option key={`stratify-${column}`} value={column}>
+                    {column}
+                  </option>
+                ))}
+              </select>
+            </label>
+          ) : null}
+          {modelType === "IsolationForest" ? (
+            <label className="flex items-center gap-3 rounded-2xl border border-line bg-white/70 px-4 py-3 text-sm font-semibold text-ink">
+              <input type="checkbox" checked={incremental} onChange={(event) => setIncremental(event.target.checked)} />
+              Обучать по частям файла
+            </label>
+          ) : null}
+          <label className="block text-sm font-semibold text-ink">
+            Кодирование категорий
+            <select
+              className="input-field mt-2"
+              value={categoricalEncoding}
+              onChange={(event) => setCategoricalEncoding(event.target.value as LegacyCategoricalEncoding)}
+            >
+              <option value="onehot">One-hot, редкие значения — в «прочие»</option>
+              <option value="frequency">Частота значения</option>
+              <option value="hashing">Хэширование</option>
+            </select>
+          </label>
+          {categoricalEncoding === "onehot" ? (
+            <label className="block text-sm font-semibold text-ink">
+              Колонок на категориальный признак
+              <input
+                className="input-field mt-2"
+                inputMode="numeric"
+                value={maxCategories}
+                onChange={(event) => setMaxCategories(event.target.value.replace(/\D/g, ""))}
+                placeholder="по умолчанию: 50"
+              />
+            </label>
+          ) : null}
         </div>
 
         <div className="mt-6 grid gap-4 lg:grid-cols-3">
@@ -257,8 +391,13 @@ export function LegacyTrainModel() {
           disabled={isLoading}
           onClick={() => void handleTrain()}
         >
-          {isLoading ? "Обучение..." : "Обучить модель"}
+          {isLoading ? jobStatusLabel(job) : "Обучить модель"}
         </button>
+        {isLoading && job ? (
+          <button className="button-secondary mt-3 w-full" onClick={() => void handleCancel()}>
+            Отменить обучение
+          </button>
+        ) : null}
 
         {message ? <p className="mt-5 rounded-2xl bg-white/70 p-4 text-sm text-ink">{message}</p> : null}
         {error ? <p className="mt-5 rounded-2xl bg-ink p-4 text-sm text-paper">{error}</p> : null}
@@ -6,15 +6,22 @@ import {
 } from "@/lib/api";
 import type {
   LegacyAiAnalysis,
+  LegacyBatchPredictionResponse,
   LegacyChatMessage,
   LegacyFraudCheckResponse,
   LegacyFraudDataType,
   LegacyModelConfig,
   LegacyModelListResponse,
+  LegacyModelVersionsResponse,
   LegacyPredictionResponse,
   LegacyProfileResponse,
+  LegacyScoreFileFormat,
+  LegacyScoreFileProgress,
   LegacyScoreFileResponse,
+  LegacyScoreFileStreamResult,
+  LegacyTrainingJob,
   LegacyTrainPayload,
+  LegacyTrainResponse,
   LegacyUploadResponse,
 } from "@/lib/legacy-types";
 
@@ -181,19 +188,67 @@ export function fetchLegacyModelConfig(
   );
 }
 
+export function fetchLegacyModelVersions(
+  session: SessionRequestContext,
+  modelName: string,
+): Promise<LegacyModelVersionsResponse> {
+  return legacyRequest<LegacyModelVersionsResponse>(
+    `/legacy/models/${encodeURIComponent(modelName)}/versions`,
+    session,
+  );
+}
+
+export function activateLegacyModelVersion(
+  session: SessionRequestContext,
+  modelName: string,
+  version: number,
+): Promise<{ model_name: string; active_version: number }> {
+  return legacyRequest<{ model_name: string; active_version: number }>(
+    `/legacy/models/${encodeURIComponent(modelName)}/versions/${version}/activate`,
+    session,
+    { method: "POST" },
+  );
+}
+
 export function trainLegacyAnomalyDetector(
   session: SessionRequestContext,
   payload: LegacyTrainPayload,
-): Promise<{ message: string }> {
-  return legacyRequest<{ message: string }>("/legacy/train-anomaly-detector", session, {
+): Promise<LegacyTrainResponse> {
+  return legacyRequest<LegacyTrainResponse>("/legacy/train-anomaly-detector", session, {
     method: "POST",
     body: JSON.stringify(payload),
   });
 }
 
+export function submitLegacyTrainingJob(
+  session: SessionRequestContext,
+  payload: LegacyTrainPayload,
+): Promise<LegacyTrainingJob> {
+  return legacyRequest<LegacyTrainingJob>("/legacy/training-jobs", session, {
+    method: "POST",
+    body: JSON.stringify(payload),
+  });
+}
+
+export function fetchLegacyTrainingJob(
+  session: SessionRequestContext,
+  jobId: string,
+): Promise<LegacyTrainingJob> {
+  return legacyRequest<LegacyTrainingJob>(`/legacy/training-jobs/${encodeURIComponent(jobId)}`, session);
+}
+
+export function cancelLegacyTrainingJob(
+  session: SessionRequestContext,
+  jobId: string,
+): Promise<LegacyTrainingJob> {
+  return legacyRequest<LegacyTrainingJob>(`/legacy/training-jobs/${encodeURIComponent(jobId)}/cancel`, session, {
+    method: "POST",
+  });
+}
+
 export function scoreLegacyFile(
   session: SessionRequestContext,
-  payload: { model_name: string; filename: string },
+  payload: { model_name: string; filename: string; n_jobs?: number },
 ): Promise<LegacyScoreFileResponse> {
   return legacyRequest<LegacyScoreFileResponse>("/legacy/score-file", session, {
     method: "POST",
@@ -201,9 +256,75 @@ export function scoreLegacyFile(
   });
 }
 
+export async function streamLegacyFileScores(
+  session: SessionRequestContext,
+  payload: {
+    model_name: string;
+    filename: string;
+    output_format?: LegacyScoreFileFormat;
+    result_filename?: string;
+    n_jobs?: number;
+  },
+  onProgress?: (progress: LegacyScoreFileProgress) => void,
+): Promise<LegacyScoreFileStreamResult> {
+  const send = (accessToken: string) =>
+    fetch(`${API_BASE_URL}/legacy/score-file-stream`, {
+      method: "POST",
+      headers: {
+        Authorization: `Bearer ${accessToken}`,
+        "Content-Type": "application/json",
+      },
+      body: JSON.stringify(payload),
+      cache: "no-store",
+    });
+
+  let response = await send(session.accessToken);
+  if (response.status === 401) {
+    const refreshed = await refreshSession(session.refreshToken);
+    session.onSession(refreshed);
+    response = await send(refreshed.access_token);
+  }
+  if (!response.ok || !response.body) {
+    throw await parseApiError(response);
+  }
+
+  // NDJSON: progress lines per chunk, then the result with the summary or an error line
+  const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+  let buffer = "";
+  for (;;) {
+    const { value, done } = await reader.read();
+    buffer += value ?? "";
+    const lines = buffer.split("\n");
+    buffer = done ? "" : (lines.pop() ?? "");
+    for (const line of lines) {
+      if (!line.trim()) {
+        continue;
+      }
+      const event = JSON.parse(line) as
+        | LegacyScoreFileProgress
+        | LegacyScoreFileStreamResult
+        | { error: string };
+      if ("error" in event) {
+        throw new ApiError(event.error, 500);
+      }
+      if ("done" in event) {
+        return event;
+      }
+      onProgress?.(event);
+    }
+    if (done) {
+      throw new ApiError("Scoring stream ended without a result", 502);
+    }
+  }
+}
+
 export function predictLegacyRow(
   session: SessionRequestContext,
-  payload: { model_name: string; features: Record<string, unknown> },
+  payload: {
+    model_name: string;
+    features: Record<string, unknown>;
+    update_feature_state?: boolean;
+  },
 ): Promise<LegacyPredictionResponse> {
   return legacyRequest<LegacyPredictionResponse>("/legacy/predict-or-score", session, {
     method: "POST",
@@ -211,6 +332,20 @@ export function predictLegacyRow(
   });
 }
 
+export function predictLegacyBatch(
+  session: SessionRequestContext,
+  payload: {
+    model_name: string;
+    columns: Record<string, unknown[]>;
+    update_feature_state?: boolean;
+  },
+): Promise<LegacyBatchPredictionResponse> {
+  return legacyRequest<LegacyBatchPredictionResponse>("/legacy/predict-batch", session, {
+    method: "POST",
+    body: JSON.stringify(payload),
+  });
+}
+
 export function checkLegacyFraud(
   session: SessionRequestContext,
   payload: { data_type: LegacyFraudDataType; value: string },
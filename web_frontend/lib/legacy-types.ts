@@ -1,4 +1,8 @@
-export type LegacyModelType = "IsolationForest" | "LocalOutlierFactor" | "OneClassSVM";
+export type LegacyModelType = "IsolationForest" | "LocalOutlierFactor" | "OneClassSVM" | "SGDOneClassSVM";
+
+export type LegacyTrainingSampling = "random" | "stratified";
+
+export type LegacyCategoricalEncoding = "onehot" | "frequency" | "hashing";
 
 export type LegacyUploadResponse = {
   status: string;
@@ -56,9 +60,66 @@ export type LegacyModelConfig = {
   categorical_features: string[];
   date_features: string[];
   categorical_values?: Record<string, string[]>;
+  categorical_cardinality?: Record<string, number>;
+  categorical_encoding?: LegacyCategoricalEncoding;
   generated_date_features?: string[];
   generated_eng_features?: string[];
   feature_engineering_config?: Record<string, unknown>;
+  feature_engineering_stats?: Record<string, number>;
+};
+
+export type LegacyTrainMetrics = {
+  n_samples: number;
+  n_features: number;
+  fit_seconds: number;
+  score_mean: number;
+  score_p01: number;
+  score_p50: number;
+  anomaly_rate: number;
+  n_rows_total?: number;
+  training_mode?: "full" | "sample" | "incremental";
+};
+
+export type LegacyTrainResponse = {
+  message: string;
+  version?: number | null;
+  metrics?: LegacyTrainMetrics;
+  warnings?: string[];
+};
+
+export type LegacyTrainingStage = "load" | "feature_engineering" | "fit" | "save" | "done";
+
+export type LegacyTrainingJobStatus = "queued" | "running" | "succeeded" | "failed" | "cancelled";
+
+export type LegacyTrainingJob = {
+  job_id: string;
+  status: LegacyTrainingJobStatus;
+  stage: LegacyTrainingStage | null;
+  stages: LegacyTrainingStage[];
+  progress: number;
+  model_name: string;
+  model_type: LegacyModelType;
+  filename: string;
+  created_at: string;
+  started_at: string | null;
+  finished_at: string | null;
+  duration_seconds: number | null;
+  queue_position?: number;
+  result: (LegacyTrainResponse & { model_name: string }) | null;
+  error: { status_code: number; detail: unknown } | null;
+};
+
+export type LegacyModelVersion = {
+  version: number;
+  sha256: string;
+  created_at: string;
+  metrics: LegacyTrainMetrics | null;
+  active: boolean;
+};
+
+export type LegacyModelVersionsResponse = {
+  model_name: string;
+  versions: LegacyModelVersion[];
 };
 
 export type LegacyTrainPayload = {
@@ -72,12 +133,48 @@ export type LegacyTrainPayload = {
   card_id_column?: string | null;
   timestamp_column?: string | null;
   amount_column?: string | null;
+  max_samples?: number | null;
+  sampling?: LegacyTrainingSampling;
+  stratify_column?: string | null;
+  incremental?: boolean;
+  chunk_rows?: number | null;
+  categorical_encoding?: LegacyCategoricalEncoding;
+  max_categories?: number | null;
+  hashing_features?: number | null;
 };
 
 export type LegacyScoreFileResponse = {
   scores: number[];
 };
 
+export type LegacyScoreFileFormat = "csv" | "parquet";
+
+export type LegacyScoreSummary = {
+  count: number;
+  mean?: number;
+  std?: number;
+  min?: number;
+  max?: number;
+  anomalies?: number;
+  anomaly_rate?: number;
+  quantiles?: Record<string, number>;
+  histogram?: { bin_edges: number[]; counts: number[] };
+};
+
+export type LegacyScoreFileProgress = {
+  stage: "scoring" | "uploading";
+  rows: number;
+  rows_done: number;
+};
+
+export type LegacyScoreFileStreamResult = {
+  done: true;
+  rows: number;
+  result_filename: string;
+  output_format: LegacyScoreFileFormat;
+  summary: LegacyScoreSummary;
+};
+
 export type LegacyPredictionResponse = {
   model_type: string;
   anomaly_score?: number;
@@ -86,6 +183,13 @@ export type LegacyPredictionResponse = {
   probabilities?: Record<string, number>;
 };
 
+export type LegacyBatchPredictionResponse = {
+  model_type: string;
+  scores?: number[];
+  is_anomaly_predicted?: boolean[];
+  predictions?: unknown[];
+};
+
 export type LegacyFraudDataType = "phone" | "email" | "url" | "text";
 
 export type LegacyFraudCheckResponse = {